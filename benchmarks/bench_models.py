@@ -0,0 +1,136 @@
+"""Benchmark the recommenders on synthetic data of growing size.
+
+For each size and each model, times (and optionally memory-profiles) fit,
+single user predict, batch predict and evaluation, then writes every
+measure to a JSON file that can be diffed between versions:
+
+    $ python -m benchmarks.bench_models --sizes 10000 100000 --output bench.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from tiny_clues_recommander import CollaborativeFilter, ContentFilter, SVD
+from tiny_clues_recommander import evaluation
+from tiny_clues_recommander.data import Dataset
+from tiny_clues_recommander.data.synthetic import make_movies, make_ratings
+
+MODELS = {
+    'svd': lambda movies: (SVD(), {'k': 20, 'solver': 'randomized', 'random_state': 0}),
+    'collaborative_filter': lambda movies: (CollaborativeFilter(), {'n_neighbors': 50}),
+    'content_filter': lambda movies: (ContentFilter(), {'movie_df': movies, 'n_neighbors': 50}),
+}
+
+
+class Stage:
+    """Measure the wall time and, if enabled, the peak traced memory of a block"""
+
+    def __init__(self, records, memory, **labels):
+        self.records = records
+        self.memory = memory
+        self.labels = labels
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record = dict(self.labels, seconds=time.perf_counter() - self.start)
+        if self.memory:
+            record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        self.records.append(record)
+
+
+def _version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes, models, n_batch_users=1000, n_single_users=20, memory=False, random_state=0):
+    """run the benchmarks
+
+    Args:
+        sizes (List): numbers of ratings
+        models (List): names of the models, keys of MODELS
+        n_batch_users (int, optional): number of users of batch predict and ranking evaluation. Defaults to 1000.
+        n_single_users (int, optional): number of single user predict calls timed. Defaults to 20.
+        memory (bool, optional): also record peak memory, tracing slows the stages down. Defaults to False.
+        random_state (int, optional): seed of the data and of the splits. Defaults to 0.
+
+    Returns:
+        List: one record per (size, model, stage)
+    """
+    records = []
+    rng = np.random.RandomState(random_state)
+    for n_ratings in sizes:
+        ratings = make_ratings(n_ratings, random_state=random_state)
+        n_items = int(ratings['movie_id'].max()) + 1
+        movies = make_movies(n_items, random_state=random_state)
+        test_mask = rng.random_sample(len(ratings)) < 0.2
+        train, test = ratings[~test_mask], ratings[test_mask]
+        size = {'n_ratings': n_ratings, 'n_users': int(ratings['user_id'].nunique()), 'n_items': n_items}
+
+        with Stage(records, memory, model='dataset', stage='build_trainset', **size):
+            Dataset(train).build_trainset()
+
+        users = np.intersect1d(test['user_id'].unique(), train['user_id'].unique())
+        batch_users = users[:n_batch_users]
+        single_users = rng.choice(users, min(n_single_users, len(users)), replace=False)
+        for name in models:
+            model, fit_params = MODELS[name](movies)
+            labels = dict(size, model=name)
+            with Stage(records, memory, stage='fit', **labels):
+                model.fit(ratings=train, **fit_params)
+            with Stage(records, memory, stage='predict', calls=len(single_users), **labels):
+                for user_id in single_users:
+                    model.predict(user_id, N=10)
+            with Stage(records, memory, stage='predict_batch', calls=len(batch_users), **labels):
+                recommended, _ = model.predict_batch(batch_users, N=10, chunk_size=256)
+            with Stage(records, memory, stage='evaluate', **labels):
+                if hasattr(model, 'test_result'):
+                    evaluation.rmse(model.test_result(test), verbose=False)
+                item_ids = np.arange(n_items)
+                relevant = evaluation.holdout_matrix(test, batch_users, item_ids)
+                evaluation.ndcg_at_k(evaluation.item_positions(recommended, item_ids), relevant, verbose=False)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6],
+                        help='numbers of ratings, from 10^4 to 10^7')
+    parser.add_argument('--models', nargs='+', default=sorted(MODELS), choices=sorted(MODELS))
+    parser.add_argument('--batch-users', type=int, default=1000)
+    parser.add_argument('--memory', action='store_true', help='record peak memory with tracemalloc')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmarks.json')
+    args = parser.parse_args()
+
+    records = run(args.sizes, args.models, n_batch_users=args.batch_users, memory=args.memory,
+                  random_state=args.seed)
+    report = {
+        'version': _version(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'results': records,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for record in records:
+        print(record)
+
+
+if __name__ == '__main__':
+    main()
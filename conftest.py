@@ -0,0 +1,63 @@
+"""
+Fixtures shared by the test modules: seeded synthetic ratings of 40 users on
+30 movies, and movies with 4 genres. They are built once per session, tests
+must not modify them.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+N_USERS, N_MOVIES = 40, 30
+GENRES = ['Comedy', 'Drama', 'Action', 'Horror']
+
+
+def _ratings(rng, n_ratings):
+    pairs = rng.choice(N_USERS * N_MOVIES, size=n_ratings, replace=False)
+    return pd.DataFrame({
+        'user_id': pairs // N_MOVIES,
+        'movie_id': pairs % N_MOVIES,
+        'rating': rng.randint(1, 6, size=len(pairs)),
+    })
+
+
+@pytest.fixture(scope='session')
+def n_users():
+    return N_USERS
+
+
+@pytest.fixture(scope='session')
+def n_movies():
+    return N_MOVIES
+
+
+@pytest.fixture(scope='session')
+def genres():
+    return list(GENRES)
+
+
+@pytest.fixture(scope='session')
+def make_ratings():
+    """Build distinct (user, movie) ratings from 1 to 5, the same ones for the same number of ratings."""
+
+    return lambda n_ratings=400: _ratings(np.random.RandomState(0), n_ratings)
+
+
+@pytest.fixture(scope='session')
+def ratings(make_ratings):
+    """400 ratings: cols user_id | movie_id | rating"""
+
+    return make_ratings()
+
+
+@pytest.fixture(scope='session')
+def movies():
+    """The movies of the ratings: cols movie_id | title | year | *genres"""
+
+    rng = np.random.RandomState(0)
+    _ratings(rng, 400)
+    movies = pd.DataFrame(rng.randint(0, 2, size=(N_MOVIES, len(GENRES))), columns=GENRES)
+    movies.insert(0, 'movie_id', np.arange(N_MOVIES))
+    movies.insert(1, 'title', [f'Movie {i}' for i in range(N_MOVIES)])
+    movies.insert(2, 'year', 1990 + np.arange(N_MOVIES) % 10)
+    return movies
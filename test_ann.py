@@ -0,0 +1,73 @@
+"""
+Module for testing the approximate nearest neighbors index.
+"""
+
+import copy
+import pickle
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from tiny_clues_recommander import ContentFilter, MatrixFactorization, SVD
+from tiny_clues_recommander.ann import ApproximateRecommander, IVFIndex, exact_search, recall_report
+
+def test_ivf_index():
+    """Ensure probing all clusters is exact and recall grows with the probed clusters"""
+
+    rng = np.random.RandomState(0)
+    vectors, queries = rng.normal(size=(500, 8)), rng.normal(size=(50, 8))
+    ids = np.arange(500) + 1000
+    index = IVFIndex(n_lists=10, n_probe=2, random_state=0).fit(vectors, ids)
+    assert index.list_indptr[-1] == 500
+
+    exact, exact_scores = exact_search(vectors, queries, N=5, ids=ids)
+    found, scores = index.search(queries, N=5, n_probe=10, chunk_size=7)
+    np.testing.assert_array_equal(found, exact)
+    np.testing.assert_allclose(scores, exact_scores)
+
+    exclude = csr_matrix((np.ones(50), (np.arange(50), exact[:, 0] - 1000)), shape=(50, 500))
+    found, _ = index.search(queries, N=5, n_probe=10, exclude=exclude)
+    np.testing.assert_array_equal(found[:, :4], exact[:, 1:])
+
+    report = recall_report(index, queries, N=5, n_probes=(1, 2, 5, 10))
+    assert list(report.index) == ['exact', 1, 2, 5, 10]
+    recalls = report['recall@5'].values[1:]
+    assert np.all(np.diff(recalls) >= 0) and recalls[-1] == 1
+    assert report.loc[10, 'scanned'] == 1
+
+
+def test_approximate_recommander(ratings, movies, genres, n_users):
+    """Ensure a full scan of the index suggests the movies of the model"""
+
+    user_ids = np.arange(n_users)
+    for model, fit_params in [(SVD(), {'k': 5}), (MatrixFactorization(), {'k': 5, 'random_state': 0})]:
+        model.fit(ratings, **fit_params)
+        recommander = ApproximateRecommander(model, n_lists=4, n_probe=1, random_state=0)
+        expected, expected_scores = model.predict_batch(user_ids, N=5)
+        recommended, scores = recommander.predict_batch(user_ids, N=5, n_probe=4)
+        np.testing.assert_array_equal(recommended, expected)
+        np.testing.assert_allclose(scores, expected_scores)
+        assert recommander.trainset is model.trainset
+
+    content_filter = ContentFilter()
+    content_filter.fit(movies, ratings)
+    recommander = ApproximateRecommander(content_filter, n_lists=4, random_state=0)
+    recommended, scores = recommander.predict_batch(user_ids, N=5, n_probe=4)
+    for user_id in [0, 7, 23]:
+        rated = ratings[ratings.user_id == user_id]
+        assert not set(recommended[user_id]) & set(rated.movie_id)
+        profile = (movies.loc[rated.movie_id, genres].values * rated.rating.values[:, None]).sum(axis=0)
+        np.testing.assert_allclose(scores[user_id], movies.loc[recommended[user_id], genres].values.dot(profile))
+    assert len(recommander.recall_report(user_ids, N=5, n_probes=(1, 4))) == 3
+
+
+def test_approximate_recommander_copy(ratings, n_users):
+    """Ensure the recommander copies and pickles without looking attributes up on a missing model"""
+
+    model = SVD()
+    model.fit(ratings, k=5)
+    recommander = ApproximateRecommander(model, n_lists=4, random_state=0)
+    for clone in [copy.copy(recommander), copy.deepcopy(recommander), pickle.loads(pickle.dumps(recommander))]:
+        np.testing.assert_array_equal(clone.predict_batch(np.arange(5), N=5, n_probe=4)[0],
+                                      recommander.predict_batch(np.arange(5), N=5, n_probe=4)[0])
+        assert clone.trainset.n_users == n_users
@@ -0,0 +1,79 @@
+"""
+Module for testing the offline top N job.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tiny_clues_recommander import SVD
+from tiny_clues_recommander import batch
+from tiny_clues_recommander.batch import load_results, recommend_all, shard_path
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_recommend_all(tmp_path, n_jobs, ratings, n_users):
+    """Ensure the shards hold the batch predictions of every user and a rerun only computes missing shards"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    svd.save(tmp_path / 'model')
+    output = str(tmp_path / 'top')
+
+    progress = []
+    summary = recommend_all(str(tmp_path / 'model'), output, N=5, shard_size=15, n_jobs=n_jobs,
+                            progress=lambda *args: progress.append(args))
+    assert summary['shards'] == summary['computed'] == 3
+    assert [done for done, total, _, _ in progress] == [1, 2, 3]
+    assert progress[-1][2] == n_users
+
+    user_ids, recommended, scores = load_results(output)
+    expected, expected_scores = svd.predict_batch(svd.trainset.raw_uids.values, N=5)
+    np.testing.assert_array_equal(user_ids, svd.trainset.raw_uids.values)
+    np.testing.assert_array_equal(recommended, expected)
+    np.testing.assert_allclose(scores, expected_scores)
+
+    os.remove(shard_path(output, 1))
+    summary = recommend_all(str(tmp_path / 'model'), output, N=5, shard_size=15, n_jobs=n_jobs, progress=None)
+    assert (summary['computed'], summary['skipped'], summary['users']) == (1, 2, 15)
+    np.testing.assert_array_equal(load_results(output)[1], expected)
+
+    with pytest.raises(ValueError):
+        recommend_all(str(tmp_path / 'model'), output, N=10, shard_size=15, n_jobs=n_jobs)
+    assert not batch._worker
+
+
+def test_recommend_all_checks_job(tmp_path, ratings):
+    """Ensure shards of a model saved again are not resumed and parameters must be saved with the job"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    svd.save(tmp_path / 'model')
+    output = str(tmp_path / 'top')
+    recommend_all(str(tmp_path / 'model'), output, N=5, shard_size=15, n_jobs=1, progress=None)
+
+    svd.fit(ratings, k=4)
+    svd.save(tmp_path / 'model')
+    with pytest.raises(ValueError):
+        recommend_all(str(tmp_path / 'model'), output, N=5, shard_size=15, n_jobs=1, progress=None)
+    with pytest.raises(ValueError):
+        recommend_all(str(tmp_path / 'model'), str(tmp_path / 'other'), n_jobs=1,
+                      predict_params={'content_weights': pd.Series([0.5], index=[7])})
+
+
+def test_recommend_all_csv(tmp_path, ratings, n_users):
+    """Ensure csv shards list the ranked movies of every user"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    svd.save(tmp_path / 'model')
+    recommend_all(str(tmp_path / 'model'), str(tmp_path / 'top'), N=3, shard_size=100, n_jobs=1, fmt='csv',
+                  progress=None)
+
+    shard = pd.read_csv(shard_path(str(tmp_path / 'top'), 0, 'csv'))
+    assert len(shard) == 3 * n_users
+    user = shard[shard.user_id == 7]
+    assert list(user['rank']) == [1, 2, 3]
+    assert list(user['movie_id']) == list(svd.predict(7, N=3))
@@ -0,0 +1,74 @@
+"""
+Module for testing the recommendation cache.
+"""
+
+import copy
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from tiny_clues_recommander import SVD
+from tiny_clues_recommander.cache import LRUCache, CachedRecommander
+
+
+class Clock:
+    now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache():
+    """Ensure least recently used and expired entries are dropped"""
+
+    clock = Clock()
+    cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+    cache.put((1, 'a'), 'one')
+    cache.put((2, 'a'), 'two')
+    assert cache.get((1, 'a')) == 'one'
+    cache.put((3, 'a'), 'three')
+    assert cache.get((2, 'a')) is None
+    assert cache.get((1, 'a')) == 'one'
+
+    clock.now = 11
+    assert cache.get((1, 'a')) is None
+    assert cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 2, 'misses': 2, 'hit_rate': 0.5,
+                             'evictions': 1, 'expirations': 1, 'invalidations': 0}
+
+
+def test_cached_recommander(ratings):
+    """Ensure cached results are reused until the user's ratings or the model change"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    model = CachedRecommander(svd, maxsize=100)
+
+    first = model.predict(7, N=5)
+    assert model.predict(7, N=5) is first
+    assert list(model.predict(7, N=3)) == list(first[:3])
+    model.predict(8, N=5)
+    assert model.cache.hits == 1 and model.cache.misses == 3
+
+    svd.update(pd.DataFrame({'user_id': [7], 'movie_id': [first[0]], 'rating': [1]}))
+    assert model.cache.invalidations == 2
+    assert first[0] not in model.predict(7, N=5)
+    assert model.predict(8, N=5) is model.predict(8, N=5)
+
+    svd.fit(ratings, k=3)
+    model.predict(8, N=5)
+    assert model.cache.misses == 5
+    assert model.trainset is svd.trainset
+
+
+def test_cached_recommander_copy(ratings):
+    """Ensure the cached model copies and pickles, special methods are not cached"""
+
+    model = SVD()
+    model.fit(ratings, k=5)
+    cached = CachedRecommander(model)
+    expected = cached.predict(3)
+    for clone in [copy.copy(cached), copy.deepcopy(cached), pickle.loads(pickle.dumps(cached))]:
+        np.testing.assert_array_equal(clone.predict(3), expected)
+    assert not hasattr(cached, '__fspath__')
+    assert cached.__dict__['model'] is model
@@ -4,10 +4,11 @@ Module for testing the Dataset class.
 
 import random
 
+import numpy as np
 import pytest
 import pandas as pd
 
-from tiny_clues_recommander.data import Dataset, Trainset, InfoData
+from tiny_clues_recommander.data import Dataset, Trainset, InfoData, load_ratings
 
 random.seed(1)
 
@@ -49,6 +50,10 @@ def test_iterate_over_trainset():
 
     assert next(trainset.all_ratings()) == (0, 0, 3.0)
 
+    uids, iids, values = trainset.all_ratings_arrays()
+    expected = list(zip(uids.tolist(), iids.tolist(), values.tolist()))
+    assert list(trainset.all_ratings(chunk_size=2)) == expected
+
 
 def test_mappings_ids():
     """Ensure Mappings is Ok"""
@@ -86,3 +91,235 @@ def test_info_data():
     assert trainset.get_itemid_info('0002005018')['year'] == 2001
     assert trainset.get_userid_info(1) == {'Name' : 'Thomas'}
 
+
+def test_info_data_batch():
+    """Ensure batch information matches the single id lookups"""
+
+    trainset = Dataset(ratings).build_trainset()
+    book_info = InfoData(books, 'ISBN')
+
+    isbns = list(books['ISBN'])[::-1]
+    info = book_info.get_batch(isbns, columns=['Book-title', 'year'])
+    assert list(info) == ['Book-title', 'year']
+    for k, isbn in enumerate(isbns):
+        expected = book_info.get_inforamtions(isbn)
+        assert info['Book-title'][k] == expected['Book-title']
+        assert info['year'][k] == expected['year']
+    assert book_info.get_batch(isbns[:1], as_records=True) == [book_info.get_inforamtions(isbns[0])]
+    with pytest.raises(KeyError):
+        book_info.get_batch(['unknown'])
+
+    # the first column of ratings is the book, so books are the trainset users
+    trainset.set_user_info(book_info)
+    trainset.set_item_info(InfoData(users, 'User'))
+    info = trainset.get_users_info(isbns, columns=['year'])
+    assert list(info['year']) == list(books['year'])[::-1]
+    inner_info = trainset.get_items_info([0, 1], is_raw_id=False, as_records=True)
+    assert inner_info == [trainset.get_itemid_info(i, is_raw_id=False) for i in [0, 1]]
+
+    trainset.add_ratings(['0195153448'], [5], [4])
+    assert trainset.get_items_info([5], columns=['Name'])['Name'][0] == 'Jonas'
+    trainset.add_ratings(['unknown'], [1], [4])
+    with pytest.raises(KeyError):
+        trainset.get_users_info(['unknown'])
+    for inner_ids in [[-1], [trainset.n_items], [0.5]]:
+        with pytest.raises(KeyError):
+            trainset.get_items_info(inner_ids, is_raw_id=False)
+
+    # a book nobody rated has no inner id but has its information
+    unrated = pd.DataFrame({'ISBN': ['0195153448', '0000000000'], 'User': [1, 2], 'ratings': [3, 4]})
+    trainset = Dataset(unrated).build_trainset()
+    trainset.set_user_info(book_info)
+    assert list(trainset.get_users_info(['0393045218', '0195153448'])['year']) == [1999, 2002]
+    with pytest.raises(KeyError):
+        trainset.get_users_info(['0000000000'])
+
+
+def test_compressed_storage():
+    """Ensure per-user and per-item slices match the ratings"""
+
+    data = Dataset(ratings)
+    trainset = data.build_trainset()
+
+    uid = trainset.to_inner_uid('0195153448')
+    iids, user_ratings = trainset.user_ratings(uid)
+    assert iids.base is not None
+    assert [trainset.to_raw_iid(i) for i in iids] == [1, 2, 4]
+    assert list(user_ratings) == [3, 4, 3]
+
+    uids, item_ratings = trainset.item_ratings(trainset.to_inner_iid(2))
+    assert sorted(trainset.to_raw_uid(u) for u in uids) == ['0060973129', '0195153448', '0374157065']
+    assert sorted(item_ratings) == [2, 3, 4]
+
+    uids, iids, all_ratings = trainset.all_ratings_arrays()
+    assert len(uids) == len(iids) == len(all_ratings) == len(ratings)
+    assert trainset.global_mean == pytest.approx(ratings['ratings'].mean())
+
+def test_raw_ratings_are_lazy():
+    """Ensure raw ratings are only built on demand"""
+
+    data = Dataset(ratings)
+    data.build_trainset()
+    assert data._raw_ratings is None
+    assert data.raw_ratings[0] == ('0195153448', 1, 3.0, None)
+    assert len(data.raw_ratings) == len(ratings)
+
+def test_missing_ids():
+    """Ensure ratings without a user or item id are rejected"""
+
+    missing_user = ratings.astype({'ISBN': object})
+    missing_user.loc[3, 'ISBN'] = None
+    with pytest.raises(ValueError, match='1 ratings have no ISBN id, first at row 3'):
+        Dataset(missing_user).build_trainset()
+    missing_item = ratings.astype({'User': float})
+    missing_item.loc[[2, 5], 'User'] = np.nan
+    with pytest.raises(ValueError, match='2 ratings have no User id, first at row 2'):
+        Dataset(missing_item).build_trainset()
+
+def test_synthetic_ratings():
+    """Ensure synthetic ratings are seeded, distinct and in the rating scale"""
+
+    from tiny_clues_recommander.data.synthetic import make_ratings, make_movies
+
+    df = make_ratings(2000, n_users=100, n_items=80, random_state=3)
+    assert len(df) == 2000
+    assert not df.duplicated(['user_id', 'movie_id']).any()
+    assert df['rating'].between(1, 5).all()
+    assert df.equals(make_ratings(2000, n_users=100, n_items=80, random_state=3))
+    # power law: the most popular item is rated far more than the median one
+    counts = df['movie_id'].value_counts()
+    assert counts.iloc[0] > 5 * counts.median()
+
+    movies = make_movies(80, random_state=3)
+    assert len(movies) == 80
+    assert (movies.filter(like='genre_').sum(axis=1) >= 1).all()
+
+def test_trainset_state(tmp_path):
+    """Ensure a trainset is rebuilt from its saved arrays, mixed raw ids included"""
+
+    from tiny_clues_recommander.persistence import save_state, load_state
+
+    df = pd.DataFrame({'userID': [9, 32, 2, 45, '10000'], 'itemID': [1, 1, 1, 2, 2], 'rating': [3, 2, 4, 3, 1]})
+    trainset = Dataset(df).build_trainset()
+    save_state(tmp_path, 'Trainset', *trainset.get_state())
+    _, arrays, params, _ = load_state(tmp_path)
+    loaded = Trainset.from_state(arrays, params)
+
+    assert loaded.n_users == 5 and loaded.n_items == 2 and loaded.n_ratings == 5
+    assert loaded.to_inner_uid('10000') == trainset.to_inner_uid('10000')
+    assert loaded.to_raw_iid(1) == 2
+    assert list(loaded.all_ratings()) == list(trainset.all_ratings())
+    assert loaded.rating_scale == (1, 4)
+
+def test_add_ratings():
+    """Ensure new ratings extend the id mappings and the storage in place"""
+
+    trainset = Dataset(ratings).build_trainset()
+    trainset.to_raw_uid(0)
+    uids, iids = trainset.add_ratings(['0195153448', 'new book', 'new book'], [1, 7, 1], [1, 2, 5])
+
+    assert trainset.n_users == 6 and trainset.n_items == 5
+    assert trainset.n_ratings == len(ratings) + 2
+    assert list(uids) == [0, 5, 5] and list(iids) == [0, 4, 0]
+    assert trainset.to_inner_uid('new book') == 5 and trainset.to_raw_uid(5) == 'new book'
+    assert sorted(trainset.ur[0]) == [(0, 1.0), (1, 4.0), (2, 3.0)]
+    assert sorted(trainset.ir[0]) == [(0, 1.0), (1, 5.0), (3, 1.0), (5, 5.0)]
+
+
+def test_add_ratings_matches_rebuild():
+    """Ensure successive in place additions store what a rebuild from all ratings stores"""
+
+    rng = np.random.RandomState(0)
+    all_ratings = pd.DataFrame({'user': rng.randint(0, 30, 300), 'item': rng.randint(0, 20, 300),
+                                'rating': rng.randint(1, 6, 300)})
+    trainset = Dataset(all_ratings[:200].drop_duplicates(['user', 'item'], keep='last')).build_trainset()
+    for start in range(200, 300, 25):
+        trainset.add_ratings(*all_ratings[start:start + 25].T.values)
+        assert trainset.rating_matrix([3, 0, 3]).toarray().tolist() == \
+            trainset.rating_matrix()[[3, 0, 3]].toarray().tolist()
+
+    # the last rating of a pair is kept
+    expected = all_ratings.drop_duplicates(['user', 'item'], keep='last')
+    uids, iids, stored = trainset.all_ratings_arrays()
+    assert sorted(zip(trainset.raw_uids[uids], trainset.raw_iids[iids], stored)) == \
+        sorted(expected.itertuples(index=False, name=None))
+    assert trainset.n_ratings == len(expected)
+    for iid in trainset.all_items():
+        users, item_ratings = trainset.item_ratings(iid)
+        assert sorted(zip(trainset.raw_uids[users], item_ratings)) == \
+            sorted(expected.loc[expected['item'] == trainset.to_raw_iid(iid), ['user', 'rating']].itertuples(
+                index=False, name=None))
+
+
+def test_add_ratings_changed_rows():
+    """Ensure added ratings only touch the rows of their users and items, the stored arrays are not rebuilt"""
+
+    trainset = Dataset(ratings).build_trainset()
+    stored = [(storage._indptr, storage._indices, storage._data) for storage in (trainset.ur, trainset.ir)]
+    trainset.add_ratings(['0195153448', 'new book'], [1, 7], [4, 5])
+    trainset.add_ratings(['0002005018'], [1], [2])
+
+    for storage, arrays in zip((trainset.ur, trainset.ir), stored):
+        assert all(new is old for new, old in zip((storage._indptr, storage._indices, storage._data), arrays))
+    assert sorted(trainset.ur._changed_rows) == [0, 1, 5]
+    assert sorted(trainset.ir._changed_rows) == [0, 4]
+    # two of the three ratings replace former ones
+    assert trainset.ur.nnz == trainset.n_ratings == len(ratings) + 1
+
+    # reading the whole arrays merges the changed rows back, once
+    assert trainset.ur.indptr[-1] == trainset.n_ratings
+    assert trainset.ur._changed_rows == {} and trainset.ir._changed_rows != {}
+    assert sorted(trainset.ur[1]) == [(0, 2.0), (3, 5.0)]
+
+
+def test_load_ratings(tmp_path):
+    """Ensure chunked loading encodes ratings like Dataset and caches them"""
+
+    path = str(tmp_path / 'ratings.csv')
+    implicit = pd.DataFrame({'ISBN': ['0000000000'], 'User': [9], 'ratings': [0]})
+    pd.concat([ratings, implicit]).to_csv(path, sep=';', index=False, encoding='latin-1')
+
+    dataset = load_ratings(path, chunksize=2, drop_zero=True, sep=';', encoding='latin-1', dtype={'ISBN': str})
+    expected = Dataset(ratings).build_trainset()
+    trainset = dataset.build_trainset()
+    assert list(trainset.raw_uids) == list(expected.raw_uids)
+    assert list(trainset.raw_iids) == list(expected.raw_iids)
+    assert trainset.ur[0] == expected.ur[0]
+    assert trainset.n_ratings == len(ratings)
+    assert list(dataset.df.columns) == list(ratings.columns)
+    assert list(dataset.df['ISBN']) == list(ratings['ISBN'])
+
+    cached = load_ratings(path, chunksize=2, drop_zero=True, sep=';', encoding='latin-1', dtype={'ISBN': str})
+    assert isinstance(cached._codes[0], np.memmap)
+    assert list(cached.build_trainset().raw_uids) == list(expected.raw_uids)
+    # other options do not reuse the cache
+    assert load_ratings(path, sep=';', encoding='latin-1', dtype={'ISBN': str}).build_trainset().n_ratings == len(ratings) + 1
+
+    # a missing id in a later chunk is not encoded as the last known id
+    pd.concat([ratings, pd.DataFrame({'ISBN': [None], 'User': [1], 'ratings': [4]})]).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='no ISBN id, first at row 9'):
+        load_ratings(path, chunksize=4, cache=False, dtype={'ISBN': str})
+
+
+def test_rating_statistics():
+    """Ensure cached statistics match the ratings and follow added ratings"""
+
+    trainset = Dataset(ratings).build_trainset()
+    by_user = ratings.groupby('ISBN')['ratings']
+    uids = trainset.to_inner_uids(by_user.mean().index)
+    assert list(trainset.user_counts[uids]) == list(by_user.size())
+    np.testing.assert_allclose(trainset.user_means[uids], by_user.mean())
+    np.testing.assert_allclose(trainset.item_means[trainset.to_inner_iids([1, 3])], [3, 5])
+
+    user_biases, item_biases = trainset.baseline_biases(reg_user=0., reg_item=0., n_epochs=50)
+    uids, iids, user_ratings = trainset.all_ratings_arrays()
+    residuals = user_ratings - trainset.global_mean - user_biases[uids] - item_biases[iids]
+    # unregularized biases are least squares: residuals sum to zero for every user and item
+    np.testing.assert_allclose(np.bincount(iids, residuals), 0, atol=1e-2)
+    assert trainset.baseline_biases(reg_user=0., reg_item=0., n_epochs=50)[0] is user_biases
+    assert np.abs(trainset.baseline_biases()[0]).max() < np.abs(user_biases).max()
+
+    trainset.add_ratings(['0393045218'], [1], [5])
+    assert trainset.user_counts[trainset.to_inner_uid('0393045218')] == 2
+    assert trainset.user_means[trainset.to_inner_uid('0393045218')] == 4
+    assert trainset.baseline_biases(reg_user=0., reg_item=0., n_epochs=50)[0] is not user_biases
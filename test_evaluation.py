@@ -0,0 +1,58 @@
+"""
+Module for testing the evaluation metrics.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tiny_clues_recommander.evaluation import (rmse, mse, mae, ErrorAccumulator, holdout_matrix, item_positions,
+                                               precision_at_k, recall_at_k, map_at_k, ndcg_at_k, coverage)
+
+predictions = [(3, 2.5), (4, 4.5), (1, 3), (5, 5)]
+
+
+def test_rating_metrics():
+    """Ensure metrics accept lists of pairs and arrays"""
+
+    assert rmse(predictions, verbose=False) == pytest.approx(np.sqrt(4.5 / 4))
+    assert mse(np.array(predictions), verbose=False) == pytest.approx(4.5 / 4)
+    assert mae(np.array(predictions), verbose=False) == pytest.approx(3 / 4)
+    with pytest.raises(ValueError):
+        rmse(np.empty((0, 2)))
+
+
+def test_error_accumulator():
+    """Ensure chunk by chunk metrics match the metrics over all predictions"""
+
+    accumulator = ErrorAccumulator()
+    accumulator.update(np.array(predictions[:3])).update(predictions[3:]).update([])
+    assert accumulator.count == 4
+    assert accumulator.rmse() == pytest.approx(rmse(predictions, verbose=False))
+    assert accumulator.mae() == pytest.approx(mae(predictions, verbose=False))
+    with pytest.raises(ValueError):
+        ErrorAccumulator().mse()
+
+
+def test_ranking_metrics():
+    """Ensure ranking metrics on a hand computed example"""
+
+    test = pd.DataFrame({
+        'user_id': [1, 1, 2, 3, 9],
+        'movie_id': ['a', 'c', 'b', 'a', 'a'],
+        'rating': [5, 4, 2, 3, 5],
+    })
+    user_ids, item_ids = [1, 2, 3], ['a', 'b', 'c', 'd']
+    relevant = holdout_matrix(test, user_ids, item_ids, min_rating=3)
+    recommended = item_positions(np.array([['a', 'b', 'c'], ['a', 'c', 'd'], ['b', 'a', 'x']]), item_ids)
+    assert list(recommended[2]) == [1, 0, -1]
+
+    # user 2 has no relevant item, user 1 hits at ranks 1 and 3, user 3 at rank 2
+    assert precision_at_k(recommended, relevant, verbose=False) == pytest.approx((2 / 3 + 1 / 3) / 2)
+    assert precision_at_k(recommended, relevant, k=1, verbose=False) == pytest.approx(1 / 2)
+    assert recall_at_k(recommended, relevant, verbose=False) == pytest.approx(1)
+    assert map_at_k(recommended, relevant, verbose=False) == pytest.approx(((1 + 2 / 3) / 2 + 1 / 2) / 2)
+    ndcg_user_1 = (1 + 1 / np.log2(4)) / (1 + 1 / np.log2(3))
+    ndcg_user_3 = 1 / np.log2(3)
+    assert ndcg_at_k(recommended, relevant, verbose=False) == pytest.approx((ndcg_user_1 + ndcg_user_3) / 2)
+    assert coverage(recommended, len(item_ids), verbose=False) == 1
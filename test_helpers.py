@@ -0,0 +1,43 @@
+"""
+Module for testing the helpers.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tiny_clues_recommander import MovieIndex, AmbiguousTitleError
+
+movies = pd.DataFrame({
+    'title': ['Toy Story', 'Jumanji', 'Hamlet', 'Hamlet', 'Heat'],
+    'year': [1995, 1995, 1990, 1996, 1995],
+    'Comedy': [1, 0, 0, 0, 0],
+}, index=[10, 11, 12, 13, 14])
+
+
+def test_movie_index_lookups():
+    """Ensure ids, titles and years are resolved both ways"""
+
+    index = MovieIndex(movies)
+
+    assert index.get_id('Jumanji') == 11
+    assert index.get_id('Hamlet', 1996) == 13
+    assert index.get_title(14) == 'Heat'
+    assert index.get_year(12) == 1990
+    assert list(index.get_titles([14, 10])) == ['Heat', 'Toy Story']
+    assert list(index.get_years(np.array([11, 13]))) == [1995, 1996]
+
+
+def test_movie_index_errors():
+    """Ensure unknown and ambiguous titles raise instead of printing"""
+
+    index = MovieIndex(movies)
+
+    with pytest.raises(AmbiguousTitleError) as error:
+        index.get_id('Hamlet')
+    assert [candidate[0] for candidate in error.value.candidates] == [12, 13]
+    with pytest.raises(KeyError):
+        index.get_id('Casino')
+    with pytest.raises(KeyError):
+        index.get_titles([10, 99])
+    assert index.ambiguous_titles() == {'Hamlet': [(12, 1990), (13, 1996)]}
@@ -0,0 +1,62 @@
+"""
+Module for testing the profiling of the models.
+"""
+
+import json
+
+import numpy as np
+
+from tiny_clues_recommander import SVD, instrumentation
+from tiny_clues_recommander.instrumentation import Profiler
+
+
+def test_profiler():
+    """Ensure stages are recorded under their parents only when enabled"""
+
+    profiler = Profiler()
+    with profiler.stage('off'):
+        pass
+    assert profiler.stage('off') is profiler.stage('other')
+
+    profiler.enable(memory=True)
+    for _ in range(3):
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                buffer = np.ones(2 ** 18)
+            del buffer
+    profiler.disable()
+
+    stats = profiler.snapshot()
+    assert set(stats) == {'outer', 'outer/inner'}
+    assert stats['outer']['calls'] == stats['outer/inner']['calls'] == 3
+    assert stats['outer']['total_seconds'] >= stats['outer/inner']['total_seconds']
+    assert stats['outer']['peak_mb'] >= stats['outer/inner']['peak_mb'] >= 2
+    assert json.loads(profiler.to_json())['stages'] == stats
+
+    profiler.reset()
+    assert profiler.snapshot() == {}
+
+
+def test_model_stages(ratings, n_users):
+    """Ensure model methods and the trainset build are recorded"""
+
+    svd = SVD()
+    instrumentation.enable()
+    try:
+        svd.fit(ratings, k=5)
+        svd.predict(7)
+        svd.predict_batch(np.arange(n_users), chunk_size=16)
+    finally:
+        instrumentation.disable()
+    stats = instrumentation.snapshot()
+    instrumentation.reset()
+
+    assert stats['SVD.fit']['calls'] == 1
+    assert 'SVD.fit/Dataset.build_trainset/compress' in stats
+    assert 'SVD.fit/decompose' in stats
+    assert 'SVD.predict/SVD.predict_ratings' in stats
+    assert stats['SVD.predict_batch/score']['calls'] == 3
+    assert stats['SVD.predict_batch/top_n']['calls'] == 3
+
+    svd.fit(ratings, k=5)
+    assert instrumentation.snapshot() == {}
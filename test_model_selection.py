@@ -0,0 +1,34 @@
+"""
+Module for testing the cross validation runner.
+"""
+
+import numpy as np
+
+from tiny_clues_recommander import SVD
+from tiny_clues_recommander.model_selection import KFold, RepeatedHoldout, cross_validate
+
+
+def test_splitters():
+    """Ensure KFold test sets partition the ratings and holdouts have the right size"""
+
+    masks = KFold(n_splits=4, random_state=0).test_masks(10)
+    assert masks.shape == (4, 10)
+    assert (masks.sum(axis=0) == 1).all()
+
+    masks = RepeatedHoldout(n_repeats=3, test_size=0.2, random_state=0).test_masks(10)
+    assert (masks.sum(axis=1) == 2).all()
+
+
+def test_cross_validate(make_ratings):
+    """Ensure folds run in a process pool give the in process results"""
+
+    ratings = make_ratings(600)
+    cv = KFold(n_splits=3, random_state=0)
+    results = cross_validate(SVD, ratings, cv=cv, fit_params={'k': 5}, N=5, n_jobs=1)
+    assert list(results.index) == [0, 1, 2]
+    for column in ['fit_time', 'predict_time', 'rmse', 'mae', 'precision@5', 'ndcg@5', 'coverage']:
+        assert column in results
+
+    parallel_results = cross_validate(SVD, ratings, cv=cv, fit_params={'k': 5}, N=5, n_jobs=2)
+    metrics = ['rmse', 'mae', 'mse', 'precision@5', 'recall@5', 'map@5', 'ndcg@5', 'coverage']
+    np.testing.assert_allclose(parallel_results[metrics].values, results[metrics].values)
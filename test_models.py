@@ -0,0 +1,350 @@
+"""
+Module for testing the recommendation models.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tiny_clues_recommander import (BaselineOnly, CollaborativeFilter, ContentFilter, HybridRecommander,
+                                    MatrixFactorization, SVD)
+from tiny_clues_recommander.models import BaseRecommander, _als_solve
+from tiny_clues_recommander.evaluation import rmse
+
+
+@pytest.mark.parametrize('solver, solver_kwargs', [('randomized', {'n_iter': 10}), ('lanczos', {})])
+def test_truncated_svd_matches_dense(solver, solver_kwargs, ratings):
+    """Ensure sparse solvers reconstruct the same top k approximation"""
+
+    dense = SVD()
+    dense.fit(ratings, k=5)
+    truncated = SVD()
+    truncated.fit(ratings, k=5, solver=solver, random_state=0, **solver_kwargs)
+
+    for user_id in [0, 7, 23]:
+        expected = dense.predict_ratings(user_id, N=5)
+        predicted = truncated.predict_ratings(user_id, N=5)
+        assert list(predicted.index) == list(expected.index)
+        np.testing.assert_allclose(predicted.values, expected.values, rtol=1e-4)
+
+
+def test_svd_predict_ratings(ratings):
+    """Ensure factor scoring matches the rank k reconstruction of the pivot"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+
+    pivot = ratings.pivot(index='user_id', columns='movie_id', values='rating').fillna(0)
+    U, S, Vt = np.linalg.svd(pivot.values, full_matrices=False)
+    reconstructed = pd.DataFrame((U[:, :5] * S[:5]).dot(Vt[:5]), index=pivot.index, columns=pivot.columns)
+
+    for user_id in [0, 7, 23]:
+        expected = reconstructed.loc[user_id][pivot.loc[user_id] == 0].sort_values(ascending=False)[:5]
+        predicted = svd.predict_ratings(user_id, N=5)
+        assert list(predicted.index) == list(expected.index)
+        np.testing.assert_allclose(predicted.values, expected.values, rtol=1e-5)
+        assert not set(svd.predict(user_id, N=50)) & set(ratings[ratings.user_id == user_id].movie_id)
+
+
+def test_predict_batch(ratings, movies, n_users):
+    """Ensure batched predictions match single user predictions"""
+
+    user_ids = np.arange(n_users)
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    recommended, scores = svd.predict_batch(user_ids, N=5, chunk_size=7)
+    assert recommended.shape == scores.shape == (n_users, 5)
+    for user_id in [0, 7, 23]:
+        expected = svd.predict_ratings(user_id, N=5)
+        assert list(recommended[user_id]) == list(expected.index)
+        np.testing.assert_allclose(scores[user_id], expected.values)
+
+    collaborative_filter = CollaborativeFilter()
+    collaborative_filter.fit(ratings)
+    recommended, scores = collaborative_filter.predict_batch(user_ids, N=5, chunk_size=7)
+    for user_id in [0, 7, 23]:
+        expected = collaborative_filter.predict_sim(user_id, N=5)
+        np.testing.assert_allclose(scores[user_id], expected.values)
+
+    content_filter = ContentFilter()
+    content_filter.fit(movies, ratings)
+    recommended, scores = content_filter.predict_batch(user_ids, N=5, chunk_size=7, M=3)
+    assert recommended.shape == (n_users, 5)
+    for user_id in [0, 7, 23]:
+        assert not set(recommended[user_id]) & set(ratings[ratings.user_id == user_id].movie_id)
+
+
+def test_svd_test_result(ratings):
+    """Ensure test results follow the unknown pairs policy"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    test = pd.DataFrame({
+        'user_id': [0, 7, 1000, 23],
+        'movie_id': [3, 1000, 3, 4],
+        'rating': [4, 3, 2, 5],
+    })
+
+    result = svd.test_result(test)
+    assert result.shape == (2, 2)
+    np.testing.assert_allclose(result[:, 1], [svd.user_factors[svd.trainset.to_inner_uid(u)].dot(
+        svd.item_factors[:, svd.trainset.to_inner_iid(i)]) for u, i in [(0, 3), (23, 4)]])
+
+    result = svd.test_result(test, unknown='global_mean')
+    assert list(result[:, 0]) == [4, 3, 2, 5]
+    assert result[1, 1] == result[2, 1] == pytest.approx(ratings.rating.mean())
+
+    result = svd.test_result(test, unknown='baseline')
+    user_mean = ratings[ratings.user_id == 7].rating.mean()
+    movie_mean = ratings[ratings.movie_id == 3].rating.mean()
+    assert result[1, 1] == pytest.approx(user_mean)
+    assert result[2, 1] == pytest.approx(movie_mean)
+    assert rmse(result, verbose=False) >= 0
+
+
+def test_collaborative_filter_predict_sim(ratings, n_users):
+    """Ensure sparse correlations match the dense pandas implementation"""
+
+    collaborative_filter = CollaborativeFilter()
+    collaborative_filter.fit(ratings)
+
+    pivot = ratings.pivot(index='user_id', columns='movie_id', values='rating').fillna(0)
+    for user_id in [0, 7, 23]:
+        user_ratings = pivot.loc[user_id]
+        similar_users = pivot.T.corrwith(user_ratings)
+        not_rated_movies = user_ratings[user_ratings == 0].index
+        expected = (similar_users.dot(pivot.loc[:, not_rated_movies]) / sum(similar_users)).sort_values(ascending=False)[:5]
+        predicted = collaborative_filter.predict_sim(user_id, N=5)
+        np.testing.assert_allclose(predicted.values, expected.values)
+
+    collaborative_filter.fit(ratings, n_neighbors=5)
+    recommended, scores = collaborative_filter.predict_batch(np.arange(n_users), N=5)
+    for user_id in [0, 7, 23]:
+        assert list(recommended[user_id]) == list(collaborative_filter.predict(user_id))
+        assert not set(recommended[user_id]) & set(ratings[ratings.user_id == user_id].movie_id)
+
+
+def test_content_filter_neighbor_index(ratings, movies, n_movies):
+    """Ensure the top K index gives the same neighbors as the dense similarity"""
+
+    dense = ContentFilter()
+    dense.fit(movies, ratings)
+    indexed = ContentFilter()
+    indexed.fit(movies, ratings, n_neighbors=10, block_size=7)
+    assert indexed.similarity is None
+    assert indexed.neighbor_ids.shape == (n_movies, 10)
+
+    for movie_id in [0, 5, 12]:
+        expected = sorted(dense.similarity[movie_id, np.arange(n_movies) != movie_id], reverse=True)[:10]
+        np.testing.assert_allclose(indexed.neighbor_scores[movie_id], expected)
+        assert movie_id not in indexed.neighbor_ids[movie_id]
+        _, dense_scores = dense._neighbors(np.array([movie_id]))
+        np.testing.assert_allclose(dense_scores[0], expected)
+
+
+@pytest.mark.parametrize('n_neighbors', [None, 10])
+def test_content_filter_predict_df(n_neighbors, ratings, movies, genres, n_movies):
+    """Ensure suggestions aggregate the neighbors of the best rated movies"""
+
+    content_filter = ContentFilter()
+    content_filter.fit(movies, ratings, n_neighbors=n_neighbors)
+    similarity = movies[genres].values.dot(movies[genres].values.T)
+
+    for user_id in [0, 7, 23]:
+        user_ratings = ratings[ratings.user_id == user_id]
+        seeds = user_ratings.sort_values('rating', ascending=False, kind='stable').head(3)
+        expected_max = np.full(n_movies, -np.inf)
+        expected_sum = np.zeros(n_movies)
+        for movie_id, rating in zip(seeds.movie_id, seeds.rating):
+            # every other movie with the full similarity, the 10 stored neighbors with the index
+            neighbors, scores = content_filter._neighbors(np.array([movie_id]), top=None)
+            assert len(scores[0]) == (n_movies - 1 if n_neighbors is None else n_neighbors)
+            expected_max[neighbors[0]] = np.maximum(expected_max[neighbors[0]], scores[0])
+            expected_sum[neighbors[0]] += scores[0] * rating
+            assert sorted(scores[0], reverse=True) == \
+                sorted(np.delete(similarity[movie_id], movie_id), reverse=True)[:len(scores[0])]
+
+        prediction = content_filter.predict_df(user_id, N=7, M=3)
+        assert list(prediction.columns) == ['movie_id', 'title', 'similarity']
+        assert len(prediction) <= 7
+        assert not set(prediction.movie_id) & set(user_ratings.movie_id)
+        assert list(prediction.title) == [f'Movie {i}' for i in prediction.movie_id]
+        np.testing.assert_allclose(prediction.similarity, expected_max[prediction.movie_id])
+
+        prediction = content_filter.predict_df(user_id, N=7, M=3, aggregate='sum')
+        np.testing.assert_allclose(prediction.similarity, expected_sum[prediction.movie_id])
+
+
+@pytest.mark.parametrize('aggregate', ['max', 'sum'])
+def test_content_filter_batch_matches_single(aggregate, ratings, movies, genres, n_users):
+    """Ensure batch scores use the full similarity rows, as the single user predictions do"""
+
+    content_filter = ContentFilter()
+    content_filter.fit(movies, ratings)
+    similarity = movies[genres].values.dot(movies[genres].values.T).astype(np.float64)
+    user_ids = np.arange(n_users)
+    # every rated movie is a seed
+    recommended, scores = content_filter.predict_batch(user_ids, N=5, chunk_size=7, M=100, aggregate=aggregate)
+    for user_id in [0, 7, 23]:
+        user_ratings = ratings[ratings.user_id == user_id]
+        weighted = similarity[user_ratings.movie_id]
+        if aggregate == 'max':
+            expected = weighted.max(axis=0)
+        else:
+            expected = (weighted * user_ratings.rating.values[:, None]).sum(axis=0)
+        expected[user_ratings.movie_id] = -np.inf
+        np.testing.assert_allclose(scores[user_id], np.sort(expected)[::-1][:5])
+        np.testing.assert_allclose(scores[user_id], expected[recommended[user_id]])
+        prediction = content_filter.predict_df(user_id, N=5, M=100, aggregate=aggregate)
+        np.testing.assert_allclose(prediction.similarity, scores[user_id])
+
+
+@pytest.mark.parametrize('model, fit_params', [
+    (SVD(), {'k': 5}),
+    (CollaborativeFilter(), {'n_neighbors': 5}),
+    (ContentFilter(), {}),
+    (ContentFilter(), {'n_neighbors': 5}),
+    (MatrixFactorization(), {'k': 5, 'method': 'sgd', 'random_state': 0}),
+    (BaselineOnly(), {}),
+    (HybridRecommander(), {'factor_params': {'k': 5}, 'n_candidates': 10}),
+])
+def test_save_load(tmp_path, model, fit_params, ratings, movies, n_users):
+    """Ensure a loaded model predicts like the saved one, from memory-mapped arrays"""
+
+    if isinstance(model, (ContentFilter, HybridRecommander)):
+        fit_params = dict(fit_params, movie_df=movies)
+    model.fit(ratings=ratings, **fit_params)
+    model.save(tmp_path / 'model')
+
+    loaded = BaseRecommander.load(tmp_path / 'model')
+    assert type(loaded) is type(model)
+    assert isinstance(loaded.trainset.ur.data, np.memmap)
+    user_ids = np.arange(n_users)
+    for expected, predicted in zip(model.predict_batch(user_ids), loaded.predict_batch(user_ids)):
+        np.testing.assert_array_equal(expected, predicted)
+    assert list(loaded.predict(7)) == list(model.predict(7))
+
+    assert not isinstance(type(model).load(tmp_path / 'model', mmap=False).trainset.ur.data, np.memmap)
+    other = SVD if not isinstance(model, SVD) else ContentFilter
+    with pytest.raises(ValueError):
+        other.load(tmp_path / 'model')
+
+
+def test_svd_update(ratings, n_users, n_movies):
+    """Ensure folded-in users are scored like users of the fit"""
+
+    svd = SVD()
+    svd.fit(ratings, k=5)
+
+    # folding in an unchanged user gives back its factors
+    user_ratings = ratings[ratings.user_id == 7]
+    expected = svd.user_factors[svd.trainset.to_inner_uid(7)].copy()
+    svd.update(user_ratings)
+    np.testing.assert_allclose(svd.user_factors[svd.trainset.to_inner_uid(7)], expected, atol=1e-8)
+
+    # a new user with the same ratings gets the same suggestions
+    svd.update(user_ratings.assign(user_id=1000))
+    assert svd.trainset.n_users == n_users + 1
+    assert list(svd.predict(1000)) == list(svd.predict(7))
+
+    # a changed rating replaces the former one, a new movie can be folded in
+    svd.update(pd.DataFrame({'user_id': [1000, 1000], 'movie_id': [user_ratings.movie_id.iloc[0], 500],
+                             'rating': [1, 5]}), fold_in_items=True)
+    assert svd.trainset.n_ratings == len(ratings) + len(user_ratings) + 1
+    iids, new_ratings = svd.trainset.user_ratings(svd.trainset.to_inner_uid(1000))
+    assert sorted(new_ratings) == sorted(list(user_ratings.rating.iloc[1:]) + [1, 5])
+    assert svd.item_factors.shape == (5, n_movies + 1)
+    assert np.abs(svd.item_factors[:, -1]).sum() > 0
+    assert svd.predict_ratings(1000, N=50).shape[0] > 0
+
+
+def test_als_solve(ratings):
+    """Ensure blocked als solves match the normal equations of each user"""
+
+    model = MatrixFactorization()
+    model.fit(ratings, k=3, n_epochs=1, random_state=0)
+    item_factors = model.item_factors.T
+    user_factors, user_biases = _als_solve(model.trainset.ur, item_factors, 0.1, block_size=50,
+                                           global_bias=model.global_bias, fixed_biases=model.item_biases)
+    for uid in [0, 7, 23]:
+        iids, user_ratings = model.trainset.user_ratings(uid)
+        features = np.column_stack([item_factors[iids], np.ones(len(iids))])
+        targets = user_ratings.astype(np.float64) - model.global_bias - model.item_biases[iids]
+        expected = np.linalg.solve(features.T.dot(features) + 0.1 * len(iids) * np.eye(4), features.T.dot(targets))
+        np.testing.assert_allclose(np.append(user_factors[uid], user_biases[uid]), expected)
+
+
+@pytest.mark.parametrize('method', ['als', 'sgd'])
+@pytest.mark.parametrize('feedback', ['explicit', 'implicit'])
+def test_matrix_factorization(method, feedback, ratings, n_users):
+    """Ensure the factors fit the ratings and early stopping keeps the best epoch"""
+
+    train, validation = ratings.iloc[:300], ratings.iloc[300:]
+    model = MatrixFactorization()
+    model.fit(train, k=5, method=method, feedback=feedback, n_epochs=30, learning_rate=0.05,
+              validation=validation, patience=2, random_state=0)
+    assert 0 < len(model.history) <= 30
+    assert model.version == 1
+
+    if feedback == 'explicit':
+        train_error = rmse(model.test_result(train), verbose=False)
+        assert train_error < np.std(train.rating)
+        assert rmse(model.test_result(validation), verbose=False) == pytest.approx(min(model.history))
+
+    user_ids = np.arange(n_users)
+    recommended, scores = model.predict_batch(user_ids, N=5, chunk_size=7)
+    for user_id in [0, 7, 23]:
+        expected = model.predict_ratings(user_id, N=5)
+        assert list(recommended[user_id]) == list(expected.index)
+        np.testing.assert_allclose(scores[user_id], expected.values)
+        assert not set(recommended[user_id]) & set(train[train.user_id == user_id].movie_id)
+
+
+def test_baseline_only(ratings, n_users, n_movies):
+    """Ensure the baseline predicts any pair and ranks movies by bias"""
+
+    baseline = BaselineOnly()
+    baseline.fit(ratings)
+    trainset = baseline.trainset
+    assert baseline.global_mean == pytest.approx(ratings.rating.mean())
+
+    predicted = baseline.estimate([0, 0, 1000, 1000], [3, 1000, 3, 1000])
+    user_bias = baseline.user_biases[trainset.to_inner_uid(0)]
+    item_bias = baseline.item_biases[trainset.to_inner_iid(3)]
+    np.testing.assert_allclose(predicted, baseline.global_mean + np.array([user_bias + item_bias, user_bias,
+                                                                           item_bias, 0]))
+    assert len(baseline.test_result(ratings.iloc[:10])) == 10
+
+    recommended, scores = baseline.predict_batch(np.arange(n_users), N=5)
+    expected = baseline.predict_ratings(7, N=5)
+    assert list(recommended[7]) == list(expected.index)
+    unrated = np.setdiff1d(np.arange(n_movies), ratings[ratings.user_id == 7].movie_id)
+    best = unrated[np.argmax(baseline.item_biases[trainset.to_inner_iids(unrated)])]
+    assert recommended[7, 0] == best
+
+
+def test_hybrid_recommander(ratings, movies, n_users):
+    """Ensure blended scores follow each source according to the content weights"""
+
+    user_ids = np.arange(n_users)
+    hybrid = HybridRecommander()
+    hybrid.fit(movies, ratings, factor_params={'k': 5}, n_candidates=10, weight=0., cold_ratings=0)
+    recommended, scores = hybrid.predict_batch(user_ids, N=5, chunk_size=7)
+    for user_id in [0, 7, 23]:
+        assert list(recommended[user_id]) == list(hybrid.factors.predict(user_id, N=5))
+        assert list(recommended[user_id]) == list(hybrid.predict(user_id, N=5))
+        assert not set(recommended[user_id]) & set(ratings[ratings.user_id == user_id].movie_id)
+    assert scores.max() == 1
+
+    content_scores = hybrid.content._score_users(hybrid.trainset.to_inner_uids([7]))[0]
+    recommended, _ = hybrid.predict_batch([7, 23], N=5, content_weights=pd.Series([1.], index=[7]))
+    assert np.isfinite(content_scores[recommended[0]]).all()
+    assert list(recommended[1]) == list(hybrid.factors.predict(23, N=5))
+
+    # users with few ratings lean on the content
+    hybrid.fit(movies, ratings, factor_params={'k': 5}, weight=0.2, cold_ratings=20)
+    counts = hybrid.trainset.user_counts[hybrid.trainset.to_inner_uids(user_ids)]
+    weights = hybrid.content_weights(hybrid.trainset.to_inner_uids(user_ids))
+    assert np.all(weights >= 0.2) and np.all(weights <= 1)
+    assert np.all(np.diff(weights[np.argsort(counts)]) <= 1e-12)
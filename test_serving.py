@@ -0,0 +1,187 @@
+"""
+Module for testing the micro-batching server.
+"""
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from tiny_clues_recommander import SVD
+from tiny_clues_recommander.serving import MicroBatcher, RecommendationServer
+
+
+@pytest.fixture(scope='module')
+def svd(ratings):
+    svd = SVD()
+    svd.fit(ratings, k=5)
+    return svd
+
+
+async def _get(port, target):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    response = await reader.read()
+    writer.close()
+    status, _, body = response.partition(b'\r\n\r\n')
+    return int(status.split()[1]), json.loads(body)
+
+
+async def _post(port, target, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'POST {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + body)
+    response = await reader.read()
+    writer.close()
+    status, _, body = response.partition(b'\r\n\r\n')
+    return int(status.split()[1]), json.loads(body)
+
+
+def test_micro_batches(svd):
+    """Ensure concurrent requests are batched and answered like predict_batch"""
+
+    async def run():
+        batcher = MicroBatcher(svd, max_batch_size=8, max_wait=0.05)
+        batcher.start()
+        results = await asyncio.gather(*[batcher.recommend(user_id, N=3 + user_id % 3) for user_id in range(20)])
+        await batcher.stop()
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+    expected, _ = svd.predict_batch(np.arange(20), N=5)
+    for user_id, (recommended, scores) in enumerate(results):
+        assert list(recommended) == list(expected[user_id, :3 + user_id % 3])
+    assert max(batcher.batch_sizes) == 8
+    assert batcher.stats()['requests'] == 20
+
+
+def test_server(svd):
+    """Ensure the HTTP endpoints answer recommendations, errors and stats"""
+
+    async def run():
+        server = RecommendationServer(MicroBatcher(svd, max_wait=0.01))
+        port = await server.start(port=0)
+        responses = await asyncio.gather(_get(port, '/recommend?user_id=7&n=4'), _get(port, '/recommend?user_id=999'))
+        stats = await _get(port, '/stats')
+        await server.stop()
+        return responses, stats
+
+    ((status, body), (missing_status, _)), (_, stats) = asyncio.run(run())
+    assert status == 200
+    assert body['movie_ids'] == list(svd.predict(7, N=4))
+    assert missing_status == 404
+    assert stats['requests'] == 2 and stats['errors'] == 1
+    assert stats['latency_p99_ms'] >= stats['latency_p50_ms'] > 0
+
+
+def test_invalid_requests(svd):
+    """Ensure malformed requests get a 400 answer and keep the server serving"""
+
+    async def run():
+        server = RecommendationServer(MicroBatcher(svd, max_wait=0.01))
+        port = await server.start(port=0)
+        invalid = await asyncio.gather(
+            _post(port, '/recommend', b'[1]'), _post(port, '/recommend', b'"x"'),
+            _post(port, '/recommend', b'{"user_id": 7, "n": 0}'), _post(port, '/recommend', b'{"user_id": [7]}'),
+            _post(port, '/recommend', b'{"user_id": 7, "n": null}'), _get(port, '/recommend?user_id=7&n=-1'))
+        valid = await _post(port, '/recommend', b'{"user_id": 7, "n": 4}')
+        await server.stop()
+        return invalid, valid
+
+    invalid, (status, body) = asyncio.run(run())
+    assert [status for status, _ in invalid] == [400] * 6
+    assert status == 200 and body['movie_ids'] == list(svd.predict(7, N=4))
+
+
+class _FailingModel:
+    """predict_batch returns rows of scalars, unusable when answering, for the first batch"""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def predict_batch(self, user_ids, N=5):
+        self.calls += 1
+        if self.calls == 1:
+            return np.arange(len(user_ids)), np.zeros(len(user_ids))
+        return self.model.predict_batch(user_ids, N=N)
+
+
+def test_batcher_survives_errors(svd):
+    """Ensure a batch failing outside predict_batch fails its requests only"""
+
+    async def run():
+        batcher = MicroBatcher(_FailingModel(svd), max_wait=0.01)
+        batcher.start()
+        failed = await asyncio.gather(batcher.recommend(1, N=3), return_exceptions=True)
+        recommended, _ = await asyncio.wait_for(batcher.recommend(7, N=4), 5)
+        await batcher.stop()
+        return batcher, failed, recommended
+
+    batcher, failed, recommended = asyncio.run(run())
+    assert isinstance(failed[0], IndexError)
+    assert list(recommended) == list(svd.predict(7, N=4))
+    assert batcher.stats()['errors'] == 1
+
+
+def test_single_unknown_user(svd):
+    """Ensure a request for an unknown user alone in its batch gets a 404"""
+
+    async def run():
+        server = RecommendationServer(MicroBatcher(svd, max_wait=0.01))
+        port = await server.start(port=0)
+        missing = await _get(port, '/recommend?user_id=999')
+        found = await _get(port, '/recommend?user_id=7&n=4')
+        await server.stop()
+        return missing, found
+
+    (missing_status, missing_body), (status, body) = asyncio.run(run())
+    assert missing_status == 404 and 'error' in missing_body
+    assert status == 200 and body['movie_ids'] == list(svd.predict(7, N=4))
+
+
+class _BrokenModel:
+
+    def __init__(self, trainset):
+        self.trainset = trainset
+
+    def predict_batch(self, user_ids, N=5):
+        raise RuntimeError('broken')
+
+
+def test_unexpected_error(svd):
+    """Ensure an unexpected error is answered with a 500"""
+
+    async def run():
+        server = RecommendationServer(MicroBatcher(_BrokenModel(svd.trainset), max_wait=0.01))
+        port = await server.start(port=0)
+        response = await _get(port, '/recommend?user_id=7')
+        await server.stop()
+        return response
+
+    status, body = asyncio.run(run())
+    assert status == 500 and body['error'] == 'RuntimeError: broken'
+
+
+def test_string_user_ids(ratings, svd):
+    """Ensure numeric looking string ids are found over GET, integer ids too"""
+
+    string_ratings = ratings.assign(user_id=ratings.user_id.map('{:03d}'.format))
+    string_svd = SVD()
+    string_svd.fit(string_ratings, k=5)
+
+    async def run(model, targets):
+        server = RecommendationServer(MicroBatcher(model, max_wait=0.01))
+        port = await server.start(port=0)
+        responses = await asyncio.gather(*[_get(port, target) for target in targets])
+        await server.stop()
+        return responses
+
+    (status, body), (missing_status, _) = asyncio.run(run(string_svd, ['/recommend?user_id=007&n=4',
+                                                                        '/recommend?user_id=7']))
+    assert status == 200 and body['user_id'] == '007'
+    assert body['movie_ids'] == list(string_svd.predict('007', N=4))
+    assert missing_status == 404
+    ((status, body),) = asyncio.run(run(svd, ['/recommend?user_id=7&n=4']))
+    assert status == 200 and body['user_id'] == 7
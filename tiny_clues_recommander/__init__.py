@@ -1,2 +1,2 @@
-from .models import CollaborativeFilter, ContentFilter, SVD
-from .helpers import  get_movie_id, get_movie_name, get_movie_year
\ No newline at end of file
+from .models import BaselineOnly, CollaborativeFilter, ContentFilter, HybridRecommander, MatrixFactorization, SVD
+from .helpers import  get_movie_id, get_movie_name, get_movie_year, MovieIndex, AmbiguousTitleError
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""Approximate top N retrieval of movies by maximum inner product.
+
+Scoring every movie of the catalog for every user is a full scan. An IVF
+(inverted file) index clusters the movie vectors with k-means and a query only
+scores the movies of the ``n_probe`` clusters closest to it: the more clusters
+probed, the higher the recall and the latency.
+
+    >>> recommander = ApproximateRecommander(svd, n_probe=8, random_state=0)
+    >>> recommended, scores = recommander.predict_batch(user_ids, N=10)
+    >>> recommander.recall_report(user_ids, N=10)
+
+Inner products are turned into euclidean distances by appending to every movie
+vector x the coordinate sqrt(max_norm ** 2 - ||x|| ** 2) and a 0 to every
+query (Bachrach et al.), so that k-means clusters fit the search.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .helpers import ModelWrapper, top_n
+
+
+class IVFIndex:
+    """Inverted file index for approximate maximum inner product search
+
+    Args:
+        n_lists (int, optional): number of k-means clusters. Defaults to None: the square root of the number of vectors.
+        n_probe (int, optional): number of clusters scanned per query, trades recall for latency. Defaults to 8.
+        n_iter (int, optional): number of k-means iterations. Defaults to 10.
+        block_size (int, optional): number of vectors assigned to clusters at once. Defaults to 8192.
+        random_state (int, optional): seed of the k-means initialization. Defaults to None.
+    """
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, block_size=8192, random_state=None):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.block_size = block_size
+        self.random_state = random_state
+
+    def fit(self, vectors, ids=None):
+        """cluster the vectors and store them grouped by cluster
+
+        Args:
+            vectors (np.Array): vectors of shape (n, d)
+            ids (np.Array, optional): ids returned by search, in vectors order. Defaults to None: positions.
+
+        Returns:
+            IVFIndex: self
+        """
+        vectors = np.asarray(vectors, dtype=np.float64)
+        squared_norms = np.einsum('ij,ij->i', vectors, vectors)
+        extra = np.sqrt(np.maximum(squared_norms.max() - squared_norms, 0))
+        augmented = np.column_stack([vectors, extra])
+        n_lists = self.n_lists or max(int(np.sqrt(len(vectors))), 1)
+        n_lists = min(n_lists, len(vectors))
+
+        rng = np.random.RandomState(self.random_state)
+        self.centroids = augmented[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignments = self._assign(augmented)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, augmented)
+            sizes = np.bincount(assignments, minlength=n_lists)
+            # empty clusters keep their centroid
+            filled = sizes > 0
+            self.centroids[filled] = sums[filled] / sizes[filled, None]
+        assignments = self._assign(augmented)
+
+        # vectors are stored by cluster so that a probed cluster is a contiguous block
+        self.positions = np.argsort(assignments, kind='stable')
+        self.vectors = vectors[self.positions]
+        self.list_indptr = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.ids = np.arange(len(vectors)) if ids is None else np.asarray(ids)
+        return self
+
+    @property
+    def n_vectors(self):
+        return len(self.vectors)
+
+    def _assign(self, augmented):
+        """nearest centroid of every augmented vector"""
+        assignments = np.empty(len(augmented), dtype=np.intp)
+        half_norms = np.einsum('ij,ij->i', self.centroids, self.centroids) / 2
+        for start in range(0, len(augmented), self.block_size):
+            block = slice(start, start + self.block_size)
+            assignments[block] = np.argmax(augmented[block].dot(self.centroids.T) - half_norms, axis=1)
+        return assignments
+
+    def probe(self, queries, n_probe=None):
+        """clusters scanned for each query, nearest first
+
+        Returns:
+            np.Array: cluster numbers of shape (len(queries), n_probe)
+        """
+        n_probe = self.n_probe if n_probe is None else n_probe
+        centroids = self.centroids[:, :-1]
+        half_norms = np.einsum('ij,ij->i', self.centroids, self.centroids) / 2
+        return top_n(queries.dot(centroids.T) - half_norms, n_probe)
+
+    def search(self, queries, N=10, n_probe=None, exclude=None, chunk_size=256):
+        """approximate top N vectors by inner product with each query
+
+        Args:
+            queries (np.Array): queries of shape (n_queries, d)
+            N (int, optional): number of vectors returned per query. Defaults to 10.
+            n_probe (int, optional): clusters scanned per query. Defaults to None: the index n_probe.
+            exclude (scipy.sparse matrix, optional): (n_queries, n) matrix whose nonzero entries are
+                the vector positions not to return to each query. Defaults to None.
+            chunk_size (int, optional): number of queries searched at once. Defaults to 256.
+
+        Returns:
+            Tuple: np.Array of ids (n_queries, N) and np.Array of inner products (n_queries, N).
+                An inner product of -inf means that fewer than N vectors were found.
+        """
+        queries = np.asarray(queries, dtype=np.float64)
+        N = min(N, self.n_vectors)
+        positions = np.zeros((len(queries), N), dtype=np.intp)
+        scores = np.full((len(queries), N), -np.inf)
+        exclude = None if exclude is None else csr_matrix(exclude)
+        for start in range(0, len(queries), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            chunk_exclude = None if exclude is None else exclude[chunk]
+            positions[chunk], scores[chunk] = self._search_chunk(queries[chunk], N, n_probe, chunk_exclude)
+        return self.ids[positions], scores
+
+    def _search_chunk(self, queries, N, n_probe, exclude):
+        probes = self.probe(queries, n_probe)
+        starts = self.list_indptr[probes].ravel()
+        lengths = np.diff(self.list_indptr)[probes].ravel()
+        counts = lengths.reshape(probes.shape).sum(axis=1)
+        # one candidate per (query, vector of a probed cluster), grouped by query
+        owners = np.repeat(np.arange(len(queries)), counts)
+        slots = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidate_scores = np.einsum('ij,ij->i', queries[owners], self.vectors[slots])
+        if exclude is not None:
+            excluded = exclude.tocoo()
+            excluded_keys = excluded.row.astype(np.int64) * self.n_vectors + excluded.col
+            candidate_keys = owners.astype(np.int64) * self.n_vectors + self.positions[slots]
+            candidate_scores[np.isin(candidate_keys, excluded_keys)] = -np.inf
+
+        width = max(counts.max(), N)
+        columns = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        padded_scores = np.full((len(queries), width), -np.inf)
+        padded_scores[owners, columns] = candidate_scores
+        padded_slots = np.zeros((len(queries), width), dtype=np.intp)
+        padded_slots[owners, columns] = slots
+        best = top_n(padded_scores, N)
+        return self.positions[np.take_along_axis(padded_slots, best, axis=1)], \
+            np.take_along_axis(padded_scores, best, axis=1)
+
+
+def exact_search(vectors, queries, N=10, exclude=None, ids=None, chunk_size=256):
+    """exact top N vectors by inner product with each query, scanning all vectors
+
+    Args:
+        vectors (np.Array): vectors of shape (n, d)
+        queries (np.Array): queries of shape (n_queries, d)
+        N (int, optional): number of vectors returned per query. Defaults to 10.
+        exclude (scipy.sparse matrix, optional): (n_queries, n) vectors not to return to each query. Defaults to None.
+        ids (np.Array, optional): ids returned, in vectors order. Defaults to None: positions.
+        chunk_size (int, optional): number of queries scored at once. Defaults to 256.
+
+    Returns:
+        Tuple: np.Array of ids (n_queries, N) and np.Array of inner products (n_queries, N)
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    ids = np.arange(len(vectors)) if ids is None else np.asarray(ids)
+    exclude = None if exclude is None else csr_matrix(exclude)
+    N = min(N, len(vectors))
+    positions = np.empty((len(queries), N), dtype=np.intp)
+    scores = np.empty((len(queries), N))
+    for start in range(0, len(queries), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_scores = np.asarray(queries[chunk], dtype=np.float64).dot(vectors.T)
+        if exclude is not None:
+            excluded = exclude[chunk].tocoo()
+            chunk_scores[excluded.row, excluded.col] = -np.inf
+        best = top_n(chunk_scores, N)
+        positions[chunk], scores[chunk] = best, np.take_along_axis(chunk_scores, best, axis=1)
+    return ids[positions], scores
+
+
+def recall_at_n(approximate, exact, exact_scores=None):
+    """mean fraction of the exact top N found by an approximate search
+
+    Args:
+        approximate (np.Array): ids (n_queries, N) returned by the approximate search
+        exact (np.Array): ids (n_queries, N) returned by the exact search
+        exact_scores (np.Array, optional): scores of the exact search, the slots scored -inf are not counted.
+            Defaults to None.
+
+    Returns:
+        float: recall@N
+    """
+    valid = np.ones(exact.shape, dtype=bool) if exact_scores is None else np.isfinite(exact_scores)
+    found = (exact[:, :, None] == approximate[:, None, :]).any(axis=2) & valid
+    return found.sum() / max(valid.sum(), 1)
+
+
+def recall_report(index, queries, N=10, n_probes=(1, 2, 4, 8, 16, 32), exclude=None):
+    """recall@N and latency of an index for several n_probe, against the exact search
+
+    Args:
+        index (IVFIndex): fitted index
+        queries (np.Array): queries of shape (n_queries, d)
+        N (int, optional): number of vectors searched per query. Defaults to 10.
+        n_probes (Tuple, optional): numbers of probed clusters to measure, at most the number of clusters.
+            Defaults to (1, 2, 4, 8, 16, 32).
+        exclude (scipy.sparse matrix, optional): (n_queries, n) vectors not to return to each query. Defaults to None.
+
+    Returns:
+        pd.DataFrame: indexed by n_probe ('exact' for the full scan),
+            cols: recall@N | scanned (mean fraction of the vectors scored) | ms_per_query
+    """
+    queries = np.asarray(queries, dtype=np.float64)
+    vectors = np.empty_like(index.vectors)
+    vectors[index.positions] = index.vectors
+    start = time.perf_counter()
+    exact, exact_scores = exact_search(vectors, queries, N, exclude=exclude, ids=index.ids)
+    rows = {'exact': {f'recall@{N}': 1., 'scanned': 1.,
+                      'ms_per_query': (time.perf_counter() - start) * 1000 / len(queries)}}
+
+    list_sizes = np.diff(index.list_indptr)
+    for n_probe in sorted(set(min(n_probe, len(list_sizes)) for n_probe in n_probes)):
+        start = time.perf_counter()
+        approximate, _ = index.search(queries, N, n_probe=n_probe, exclude=exclude)
+        elapsed = time.perf_counter() - start
+        rows[n_probe] = {
+            f'recall@{N}': recall_at_n(approximate, exact, exact_scores),
+            'scanned': list_sizes[index.probe(queries, n_probe)].sum(axis=1).mean() / index.n_vectors,
+            'ms_per_query': elapsed * 1000 / len(queries),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index').rename_axis('n_probe')
+
+
+class ApproximateRecommander(ModelWrapper):
+    """Fitted model whose top N movies are searched in an IVFIndex instead of scoring every movie
+    SVD and MatrixFactorization are indexed on their movie factors (and movie biases, which do not change
+    the ranking of a user's movies), users query with their factors: scores are the model's predictions.
+    ContentFilter is indexed on the genre vectors of its movies, users query with the sum of the genre vectors
+    of their rated movies weighted by the ratings: the movie score is its rating weighted similarity
+    summed over all rated movies, ContentFilter with aggregate 'sum' and unlimited M and top.
+    Any other attribute is the model's.
+
+    Args:
+        model (SVD, MatrixFactorization or ContentFilter): fitted model
+        n_lists (int, optional): number of clusters. Defaults to None: the square root of the number of movies.
+        n_probe (int, optional): number of clusters scanned per user. Defaults to 8.
+        n_iter (int, optional): number of k-means iterations. Defaults to 10.
+        random_state (int, optional): seed of the k-means initialization. Defaults to None.
+    """
+    def __init__(self, model, n_lists=None, n_probe=8, n_iter=10, random_state=None):
+        super().__init__(model)
+        self.index = IVFIndex(n_lists=n_lists, n_probe=n_probe, n_iter=n_iter, random_state=random_state)
+        if hasattr(model, 'item_factors'):
+            vectors, ids = model.item_factors.T, model.trainset.raw_iids.values
+            if hasattr(model, 'item_biases'):
+                vectors = np.column_stack([vectors, model.item_biases])
+        elif hasattr(model, 'genre_cols'):
+            vectors, ids = model.movies[model.genre_cols].to_numpy(dtype=np.float64), model.movie_index.ids
+        else:
+            raise TypeError(f'{type(model).__name__} has neither movie factors nor movie genres to index.')
+        self.index.fit(vectors, ids)
+
+    def _queries(self, inner_uids):
+        """query vectors of users, with the score offset of each user
+
+        Returns:
+            Tuple: np.Array of queries (len(inner_uids), d) and np.Array of offsets (len(inner_uids),)
+        """
+        model = self.model
+        if hasattr(model, 'item_factors'):
+            queries = model.user_factors[inner_uids]
+            if not hasattr(model, 'item_biases'):
+                return queries, np.zeros(len(inner_uids))
+            return (np.column_stack([queries, np.ones(len(inner_uids))]),
+                    model.global_bias + model.user_biases[inner_uids])
+        rated = model.trainset.rating_matrix(inner_uids).tocoo()
+        indexed = model._movie_positions[rated.col] >= 0
+        weights = csr_matrix((rated.data[indexed], (rated.row[indexed], model._movie_positions[rated.col[indexed]])),
+                             shape=(len(inner_uids), self.index.n_vectors))
+        return weights.dot(model.movies[model.genre_cols].to_numpy(dtype=np.float64)), np.zeros(len(inner_uids))
+
+    def _rated(self, inner_uids):
+        """rated movies of users, as a (len(inner_uids), number of indexed movies) matrix"""
+        rated = self.model.trainset.rating_matrix(inner_uids).tocoo()
+        columns = rated.col
+        if not hasattr(self.model, 'item_factors'):
+            columns = self.model._movie_positions[columns]
+            rated.row, columns = rated.row[columns >= 0], columns[columns >= 0]
+        return csr_matrix((np.ones(len(columns)), (rated.row, columns)), shape=(len(inner_uids), self.index.n_vectors))
+
+    def predict_batch(self, user_ids, N=5, n_probe=None, chunk_size=256):
+        """predict the ids of top N movies for many users at once, their rated movies excluded
+
+        Args:
+            user_ids (array-like): ids of the users
+            N (int, optional): number of movies to suggest. Defaults to 5.
+            n_probe (int, optional): clusters scanned per user. Defaults to None: the index n_probe.
+            chunk_size (int, optional): number of users searched at once. Defaults to 256.
+
+        Returns:
+            Tuple: np.Array of movie ids (n_users, N) and np.Array of their scores (n_users, N).
+                A score of -inf means there was no movie left to suggest in that slot.
+        """
+        inner_uids = self.model.trainset.to_inner_uids(np.asarray(user_ids))
+        queries, offsets = self._queries(inner_uids)
+        recommended, scores = self.index.search(queries, N, n_probe=n_probe, exclude=self._rated(inner_uids),
+                                                chunk_size=chunk_size)
+        return recommended, scores + offsets[:, None]
+
+    def predict(self, user_id, N=5):
+        """predict the ids of top N movies
+
+        Args:
+            user_id ([int]): id for user
+            N (int, optional): number of movies to suggest. Defaults to 5.
+
+        Returns:
+            np.Array: of movie ids
+        """
+        recommended, scores = self.predict_batch([user_id], N)
+        return recommended[0][np.isfinite(scores[0])]
+
+    def recall_report(self, user_ids, N=10, n_probes=(1, 2, 4, 8, 16, 32)):
+        """recall@N and latency of the index for several n_probe on the given users, see recall_report"""
+        inner_uids = self.model.trainset.to_inner_uids(np.asarray(user_ids))
+        queries, _ = self._queries(inner_uids)
+        return recall_report(self.index, queries, N, n_probes, exclude=self._rated(inner_uids))
@@ -0,0 +1,207 @@
+"""Offline top N of every user of a saved model, sharded over a process pool.
+
+    $ python -m tiny_clues_recommander.batch path/to/saved/model path/to/output -n 10 --shard-size 10000
+
+The users are split into shards of consecutive inner ids. Every worker process
+loads the saved model once, memory-mapped, so that all workers share one
+read-only copy of its arrays. Each shard is written to its own file in the
+output directory (``shard-00000.npz`` with arrays user_ids | movie_ids | scores,
+or ``shard-00000.csv`` with cols user_id | rank | movie_id | score) under a
+temporary name renamed once complete: a rerun after an interruption only
+computes the missing shards, of the same model saved files and parameters.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .models import BaseRecommander
+
+JOB_FILE = 'job.json'
+FORMATS = ('npz', 'csv')
+
+# model of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(model_path, mmap):
+    _worker['model'] = BaseRecommander.load(model_path, mmap=mmap)
+
+
+def shard_path(output, shard, fmt='npz'):
+    return os.path.join(output, f'shard-{shard:05d}.{fmt}')
+
+
+def _write_shard(path, user_ids, recommended, scores, fmt):
+    """write a shard under a temporary name then rename it, so that a shard file is always complete"""
+    tmp_path = path + '.tmp'
+    if fmt == 'npz':
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, user_ids=user_ids, movie_ids=recommended, scores=scores)
+    else:
+        n_users, N = recommended.shape
+        pd.DataFrame({
+            'user_id': np.repeat(user_ids, N),
+            'rank': np.tile(np.arange(1, N + 1), n_users),
+            'movie_id': recommended.ravel(),
+            'score': scores.ravel(),
+        }).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _run_shard(shard, start, end, output, N, chunk_size, fmt, predict_params):
+    """top N of the users of inner ids start to end, written to the shard file
+
+    Returns:
+        Tuple: shard number and number of users
+    """
+    model = _worker['model']
+    user_ids = np.asarray(model.trainset.raw_uids[start:end])
+    recommended, scores = model.predict_batch(user_ids, N=N, chunk_size=chunk_size, **predict_params)
+    _write_shard(shard_path(output, shard, fmt), user_ids, recommended, scores, fmt)
+    return shard, len(user_ids)
+
+
+def _model_stamp(model_path):
+    """hash of the names, sizes and modification times of the saved model files, changed by a new save()"""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(model_path)):
+        stat = os.stat(os.path.join(model_path, name))
+        digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()
+
+
+def _check_job(output, job):
+    """save the job parameters, or check that they are those of the interrupted run whose shards are resumed"""
+    path = os.path.join(output, JOB_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous != job:
+            raise ValueError(f'{output} holds the shards of another job {previous}, not of {job}.')
+        return
+    with open(path, 'w') as f:
+        json.dump(job, f, indent=2)
+
+
+def _print_progress(done, total, n_users, elapsed):
+    rate = n_users / elapsed if elapsed > 0 else float('nan')
+    print(f'{done}/{total} shards, {n_users} users, {rate:.0f} users/s', file=sys.stderr)
+
+
+def recommend_all(model_path, output, N=10, shard_size=10000, n_jobs=None, chunk_size=1024, fmt='npz',
+                  mmap=True, progress=_print_progress, predict_params=None):
+    """compute the top N movies of every user of a saved model, shard by shard
+
+    Args:
+        model_path (str): directory of a model saved with save()
+        output (str): directory of the shard files, created if needed
+        N (int, optional): number of movies per user. Defaults to 10.
+        shard_size (int, optional): number of users of a shard. Defaults to 10000.
+        n_jobs (int, optional): number of worker processes, 1 runs in the current process. Defaults to None: one per CPU.
+        chunk_size (int, optional): number of users scored at once by predict_batch. Defaults to 1024.
+        fmt (str, optional): 'npz' | 'csv' shard files. Defaults to 'npz'.
+        mmap (bool, optional): memory-map the model arrays in the workers. Defaults to True.
+        progress (callable, optional): called after each shard with the number of shards done, the number of shards,
+            the number of users done and the elapsed seconds, None to stay silent. Defaults to printing to stderr.
+        predict_params (dict, optional): extra arguments of predict_batch. They are saved with the job so must be
+            JSON serializable: the content_weights Series of HybridRecommander is not, fit it with the wanted weight
+            instead. Defaults to None.
+
+    Returns:
+        dict: number of shards, shards computed by this run, shards skipped as already done, users, seconds
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected 'npz' or 'csv'.")
+    try:
+        # as read back from job.json, tuples become lists
+        params = json.loads(json.dumps(predict_params or {}))
+    except TypeError as error:
+        raise ValueError(f'predict_params must be JSON serializable to be saved with the job: {error}')
+    os.makedirs(output, exist_ok=True)
+    model = BaseRecommander.load(model_path, mmap=True)
+    n_users = model.trainset.n_users
+    del model
+    job = {'model_path': os.path.abspath(model_path), 'model_stamp': _model_stamp(model_path), 'N': N,
+           'shard_size': shard_size, 'n_users': n_users, 'format': fmt, 'predict_params': params}
+    _check_job(output, job)
+
+    starts = range(0, n_users, shard_size)
+    pending = [(shard, start, min(start + shard_size, n_users)) for shard, start in enumerate(starts)
+               if not os.path.exists(shard_path(output, shard, fmt))]
+    args = (output, N, chunk_size, fmt, predict_params or {})
+    start_time = time.perf_counter()
+    done, users_done = len(starts) - len(pending), 0
+
+    def shard_done(n_shard_users):
+        nonlocal done, users_done
+        done, users_done = done + 1, users_done + n_shard_users
+        if progress is not None:
+            progress(done, len(starts), users_done, time.perf_counter() - start_time)
+
+    if n_jobs == 1:
+        _init_worker(model_path, mmap)
+        try:
+            for shard in pending:
+                shard_done(_run_shard(*shard, *args)[1])
+        finally:
+            # do not keep the model (and its mapped files) alive in this process
+            _worker.clear()
+    elif pending:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(model_path, mmap)) as pool:
+            futures = [pool.submit(_run_shard, *shard, *args) for shard in pending]
+            for future in as_completed(futures):
+                shard_done(future.result()[1])
+
+    return {
+        'shards': len(starts),
+        'computed': len(pending),
+        'skipped': len(starts) - len(pending),
+        'users': users_done,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def load_results(output):
+    """read back the npz shards of a finished job, in user inner id order
+
+    Returns:
+        Tuple: np.Array of user ids (n_users,), np.Array of movie ids (n_users, N), np.Array of scores (n_users, N)
+    """
+    with open(os.path.join(output, JOB_FILE)) as f:
+        job = json.load(f)
+    if job['format'] != 'npz':
+        raise ValueError(f"{output} holds {job['format']} shards, read them with pandas.")
+    n_shards = -(-job['n_users'] // job['shard_size'])
+    shards = []
+    for shard in range(n_shards):
+        with np.load(shard_path(output, shard), allow_pickle=True) as arrays:
+            shards.append((arrays['user_ids'], arrays['movie_ids'], arrays['scores']))
+    return tuple(np.concatenate(arrays) for arrays in zip(*shards))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='directory of a model saved with save()')
+    parser.add_argument('output', help='directory of the shard files, rerun with the same one to resume')
+    parser.add_argument('-n', type=int, default=10, help='number of movies per user')
+    parser.add_argument('--shard-size', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes, default one per CPU')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--format', choices=FORMATS, default='npz')
+    parser.add_argument('--no-mmap', action='store_true', help='read the model arrays instead of memory-mapping them')
+    args = parser.parse_args()
+
+    summary = recommend_all(args.model, args.output, N=args.n, shard_size=args.shard_size, n_jobs=args.jobs,
+                            chunk_size=args.chunk_size, fmt=args.format, mmap=not args.no_mmap)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Opt-in cache of recommendation results.
+
+Wrap a fitted model to serve repeated requests of the same users from memory:
+
+    >>> model = CachedRecommander(svd, maxsize=100000, ttl=300)
+    >>> model.predict(user_id, N=10)     # computed
+    >>> model.predict(user_id, N=10)     # cached
+    >>> model.cache.stats()
+
+Entries are keyed by user, method, arguments and model version. They are
+evicted least recently used first once the cache is full, expire after ``ttl``
+seconds, and the entries of a user are dropped as soon as its ratings change
+through ``Trainset.add_ratings`` (e.g. ``SVD.update``).
+"""
+import time
+from collections import OrderedDict
+
+from .helpers import ModelWrapper
+
+
+class LRUCache:
+    """Bounded mapping with least recently used eviction and time to live
+
+    Args:
+        maxsize (int, optional): maximum number of entries. Defaults to 10000.
+        ttl (float, optional): lifetime of an entry in seconds, None for no expiry. Defaults to None.
+        clock (callable, optional): returns the current time in seconds. Defaults to time.monotonic.
+    """
+    def __init__(self, maxsize=10000, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """cached value of a key, default when it is missing or expired"""
+        try:
+            value, expires_at = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires_at is not None and self.clock() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """cache a value, keys are tuples starting with the user id"""
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        user_keys = self._keys_by_user[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._keys_by_user[key[0]]
+
+    def invalidate_users(self, user_ids):
+        """drop every entry of the given users"""
+        for user_id in user_ids:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def stats(self):
+        """counters to size the cache
+
+        Returns:
+            dict: size, maxsize, hits, misses, hit_rate, evictions, expirations, invalidations
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+class CachedRecommander(ModelWrapper):
+    """Fitted model whose per user predictions are cached
+    predict, predict_sim, predict_ratings and predict_df are cached when the model has them,
+    any other attribute is the model's. Cached results are shared: do not modify them in place.
+
+    Args:
+        model (BaseRecommander): fitted model, with a trainset
+        maxsize (int, optional): maximum number of cached results. Defaults to 10000.
+        ttl (float, optional): lifetime of a result in seconds, None for no expiry. Defaults to 300.
+        clock (callable, optional): returns the current time in seconds. Defaults to time.monotonic.
+    """
+    CACHED_METHODS = ('predict', 'predict_sim', 'predict_ratings', 'predict_df')
+
+    def __init__(self, model, maxsize=10000, ttl=300, clock=time.monotonic):
+        super().__init__(model)
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl, clock=clock)
+        self._trainset = None
+        self._watch_trainset()
+
+    def _watch_trainset(self):
+        """listen to rating changes of the model's current trainset, it changes when the model is refitted"""
+        trainset = getattr(self.model, 'trainset', None)
+        if trainset is self._trainset:
+            return
+        if self._trainset is not None:
+            self._trainset.remove_listener(self.cache.invalidate_users)
+        if trainset is not None:
+            trainset.add_listener(self.cache.invalidate_users)
+        self._trainset = trainset
+
+    def _cached(self, method, user_id, *args, **kwargs):
+        self._watch_trainset()
+        key = (user_id, method, args, tuple(sorted(kwargs.items())), self.model.version)
+        missing = object()
+        result = self.cache.get(key, missing)
+        if result is missing:
+            result = getattr(self.model, method)(user_id, *args, **kwargs)
+            self.cache.put(key, result)
+        return result
+
+    def __getattr__(self, name):
+        attribute = super().__getattr__(name)
+        if name in self.CACHED_METHODS:
+            return lambda user_id, *args, **kwargs: self._cached(name, user_id, *args, **kwargs)
+        return attribute
@@ -1 +1,2 @@
-from .dataset import Trainset, Dataset, InfoData
\ No newline at end of file
+from .dataset import Trainset, Dataset, InfoData, CompressedRatings
+from .io import load_ratings
\ No newline at end of file
@@ -1,56 +1,137 @@
-from collections import defaultdict
+from collections.abc import Mapping
+from numbers import Integral
 import numpy as np
-from six import iteritems
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .. import instrumentation
 
 class Dataset():
+    """A Dataset wraps a ratings DataFrame with columns user | item | rating
+    (in that order, whatever their names).
+    Attributes:
+        df(pd.DataFrame): DataFrame of ratings.
+        rating_scale(tuple): The minimum and maximal rating of the rating
+            scale.
+    """
     def __init__(self, df):
 
-        self.df = df
-        self.raw_ratings = [(uid, iid, float(r), None)
-                                for (uid, iid, r) in
-                                self.df.itertuples(index=False)]
+        self._df = df
+        self._codes = None
+        self._raw_ratings = None
         self.rating_scale = (df.iloc[:, 2].min(), df.iloc[:, 2].max())
 
+    @classmethod
+    def from_codes(cls, user_codes, item_codes, ratings, raw_users, raw_items,
+                   columns=('user_id', 'movie_id', 'rating'),
+                   rating_scale=None):
+        """Build a Dataset from already encoded ratings, without a DataFrame.
+        Args:
+            user_codes(np.ndarray): Inner id of the user of each rating, ids
+                given in order of first appearance.
+            item_codes(np.ndarray): Inner id of the item of each rating.
+            ratings(np.ndarray): The ratings.
+            raw_users(array-like): User raw ids, indexed by inner id.
+            raw_items(array-like): Item raw ids, indexed by inner id.
+            columns(tuple): Names of the user, item and rating columns of
+                :attr:`df`.
+            rating_scale(tuple): Default is the minimum and maximal rating.
+        Returns:
+            Dataset: The dataset, its ``df`` is only built when accessed.
+        """
+
+        dataset = cls.__new__(cls)
+        dataset._df = None
+        dataset._columns = list(columns)
+        # asanyarray keeps memory-mapped arrays mapped
+        dataset._codes = (np.asanyarray(user_codes, dtype=np.int32),
+                          np.asanyarray(item_codes, dtype=np.int32),
+                          np.asanyarray(ratings, dtype=np.float32),
+                          pd.Index(raw_users), pd.Index(raw_items))
+        dataset._raw_ratings = None
+        if rating_scale is None:
+            rating_scale = (dataset._codes[2].min(), dataset._codes[2].max())
+        dataset.rating_scale = rating_scale
+        return dataset
+
+    @property
+    def df(self):
+        """DataFrame of ratings, rebuilt from the codes of a Dataset made
+        with :meth:`from_codes`.
+        """
+        if self._df is None:
+            user_codes, item_codes, ratings, raw_users, raw_items = self._codes
+            self._df = pd.DataFrame({
+                self._columns[0]: raw_users.take(user_codes),
+                self._columns[1]: raw_items.take(item_codes),
+                self._columns[2]: ratings,
+            })
+        return self._df
+
+    @property
+    def raw_ratings(self):
+        """List of ``(user raw id, item raw id, rating, timestamp)`` tuples.
+        It is only built when accessed: :meth:`build_trainset` does not need
+        it.
+        """
+        if self._raw_ratings is None:
+            self._raw_ratings = [(uid, iid, float(r), None)
+                                 for (uid, iid, r) in
+                                 self.df.iloc[:, :3].itertuples(index=False)]
+        return self._raw_ratings
+
+    def _factorize(self):
+        """Encode the user and item columns as inner ids.
+        Inner ids are given in order of first appearance, as
+        :meth:`build_trainset` always did.
+        Returns:
+            A tuple ``(user_codes, item_codes, ratings, raw_users, raw_items)``
+            where ``raw_users[user_codes[k]]`` is the user raw id of the k-th
+            rating.
+        Raises:
+            ValueError: When a user or item id is missing (NaN or None).
+        """
+        if self._codes is not None:
+            return self._codes
+        user_codes, raw_users = pd.factorize(self.df.iloc[:, 0])
+        item_codes, raw_items = pd.factorize(self.df.iloc[:, 1])
+        for column, codes in ((0, user_codes), (1, item_codes)):
+            # pd.factorize gives the code -1 to missing values
+            missing = np.flatnonzero(codes < 0)
+            if len(missing):
+                raise ValueError(
+                    '{0} ratings have no {1} id, first at row {2}.'.format(
+                        len(missing), self.df.columns[column],
+                        self.df.index[missing[0]]))
+        ratings = self.df.iloc[:, 2].to_numpy(dtype=np.float32)
+        return (user_codes.astype(np.int32), item_codes.astype(np.int32),
+                ratings, raw_users, raw_items)
+
     def build_trainset(self):
-        raw2inner_id_users = {}
-        raw2inner_id_items = {}
-
-        current_u_index = 0
-        current_i_index = 0
-
-        ur = defaultdict(list)
-        ir = defaultdict(list)
-
-        # user raw id, item raw id, translated rating, time stamp
-        for urid, irid, r, timestamp in self.raw_ratings:
-            try:
-                uid = raw2inner_id_users[urid]
-            except KeyError:
-                uid = current_u_index
-                raw2inner_id_users[urid] = current_u_index
-                current_u_index += 1
-            try:
-                iid = raw2inner_id_items[irid]
-            except KeyError:
-                iid = current_i_index
-                raw2inner_id_items[irid] = current_i_index
-                current_i_index += 1
-
-            ur[uid].append((iid, r))
-            ir[iid].append((uid, r))
-
-        n_users = len(ur)  # number of users
-        n_items = len(ir)  # number of items
-        n_ratings = len(self.raw_ratings)
-
-        trainset = Trainset(ur,
-                            ir,
-                            n_users,
-                            n_items,
-                            n_ratings,
-                            self.rating_scale,
-                            raw2inner_id_users,
-                            raw2inner_id_items)
+        with instrumentation.stage('Dataset.build_trainset'):
+            with instrumentation.stage('factorize'):
+                user_codes, item_codes, ratings, raw_users, raw_items = \
+                    self._factorize()
+
+                raw2inner_id_users = dict(zip(raw_users.tolist(), range(len(raw_users))))
+                raw2inner_id_items = dict(zip(raw_items.tolist(), range(len(raw_items))))
+
+            n_users = len(raw_users)  # number of users
+            n_items = len(raw_items)  # number of items
+            n_ratings = len(ratings)
+
+            with instrumentation.stage('compress'):
+                ur = CompressedRatings.from_coo(user_codes, item_codes, ratings, n_users)
+                ir = CompressedRatings.from_coo(item_codes, user_codes, ratings, n_items)
+
+            trainset = Trainset(ur,
+                                ir,
+                                n_users,
+                                n_items,
+                                n_ratings,
+                                self.rating_scale,
+                                raw2inner_id_users,
+                                raw2inner_id_items)
 
         return trainset
 
@@ -65,6 +146,8 @@ class InfoData():
             self.df = df.set_index(index_col)
         else: 
             self.df = df
+        # columnar store: one array per column, filled when first gathered
+        self._columns = {}
     
     def get_inforamtions(self, index, columns=None):
         if columns is None:
@@ -72,24 +155,300 @@ class InfoData():
         record = self.df.loc[index, columns]
         return {k:v for k,v in record.items()}
 
+    def column(self, name):
+        """The values of a column as an array, in row order."""
+
+        if name not in self._columns:
+            self._columns[name] = self.df[name].to_numpy()
+        return self._columns[name]
+
+    def positions(self, index, missing='raise'):
+        """Row positions of ids.
+        Args:
+            index(array-like): The ids.
+            missing(str): ``'raise'`` raises a ``KeyError`` for unknown ids,
+                ``'ignore'`` gives them the position ``-1``.
+        Returns:
+            np.ndarray: The row positions.
+        """
+
+        positions = self.df.index.get_indexer(index)
+        if missing == 'raise' and (positions < 0).any():
+            unknown = np.asarray(index, dtype=object)[positions < 0]
+            raise KeyError('Unknown ids: {0}'.format(list(unknown[:10])))
+        return positions
+
+    def take(self, positions, columns=None, as_records=False):
+        """Gather rows by position, with one indexing operation per column.
+        Args:
+            positions(np.ndarray): The row positions, all valid.
+            columns(list): The columns. Default is all columns.
+            as_records(bool): Return a list of dicts, one per row, instead
+                of a dict of column arrays.
+        Returns:
+            dict or list: ``{column: array}`` of the rows, or their records.
+        """
+
+        if columns is None:
+            columns = self.df.columns
+        gathered = {name: self.column(name)[positions] for name in columns}
+        if not as_records:
+            return gathered
+        return [dict(zip(gathered, values))
+                for values in zip(*gathered.values())]
+
+    def get_batch(self, index, columns=None, as_records=False):
+        """Information of many ids at once, see :meth:`take`.
+        Args:
+            index(array-like): The ids, a ``KeyError`` is raised for unknown
+                ones.
+            columns(list): The columns. Default is all columns.
+            as_records(bool): Return a list of dicts instead of a dict of
+                column arrays.
+        """
+
+        return self.take(self.positions(index), columns, as_records)
+
+
+class CompressedRatings(Mapping):
+    """Compressed sparse storage of the ratings grouped by row (user or item).
+    The ratings of row ``k`` are ``data[indptr[k]:indptr[k + 1]]`` and the
+    inner ids of the other side are ``indices[indptr[k]:indptr[k + 1]]``.
+    Within a row, ratings keep the order in which they were read.
+
+    Indexing it like a dict returns the list of ``(inner_id, rating)`` tuples
+    of a row, so it can be used where the former ``defaultdict`` of lists was
+    expected. :meth:`row` returns zero-copy array views instead.
+
+    Rows changed by :meth:`update_rows` are kept aside from the compressed
+    arrays, so that an update costs the size of the rows it touches. They are
+    merged back into the arrays, once, when the whole arrays are next read.
+    Attributes:
+        indptr(np.ndarray): Row offsets, of size ``n_rows + 1``.
+        indices(np.ndarray): Inner ids of the other side (int32).
+        data(np.ndarray): Ratings (float32).
+    """
+
+    def __init__(self, indptr, indices, data):
+        self._indptr = indptr
+        self._indices = indices
+        self._data = data
+        self._n_rows = len(indptr) - 1
+        self._nnz = len(data)
+        # row -> (indices, data) of the rows changed since the last merge
+        self._changed_rows = {}
+
+    @classmethod
+    def from_coo(cls, rows, cols, data, n_rows):
+        """Build the storage from rating triples.
+        Args:
+            rows(np.ndarray): Inner ids of the rows, in ``[0, n_rows)``.
+            cols(np.ndarray): Inner ids of the other side.
+            data(np.ndarray): Ratings.
+            n_rows(int): Number of rows.
+        Returns:
+            CompressedRatings: The compressed storage.
+        """
+
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return cls(indptr,
+                   np.asarray(cols, dtype=np.int32)[order],
+                   np.asarray(data, dtype=np.float32)[order])
+
+    @property
+    def indptr(self):
+        self._merge_changed_rows()
+        return self._indptr
+
+    @property
+    def indices(self):
+        self._merge_changed_rows()
+        return self._indices
+
+    @property
+    def data(self):
+        self._merge_changed_rows()
+        return self._data
+
+    @property
+    def n_rows(self):
+        return self._n_rows
+
+    @property
+    def nnz(self):
+        return self._nnz
+
+    def row(self, k):
+        """Ratings of a row, as zero-copy views.
+        Args:
+            k(int): The row inner id.
+        Returns:
+            A tuple ``(indices, data)`` of arrays.
+        """
+
+        if self._changed_rows and k in self._changed_rows:
+            return self._changed_rows[k]
+        start, end = self._indptr[k], self._indptr[k + 1]
+        return self._indices[start:end], self._data[start:end]
+
+    def update_rows(self, rows, cols, data, n_rows):
+        """Merge ratings into their rows, in place. A rating of an already
+        stored ``(row, col)`` pair replaces the former one and moves to the
+        end of the row, as if it was read last.
+        Args:
+            rows(np.ndarray): Inner ids of the rows, in ``[0, n_rows)``.
+            cols(np.ndarray): Inner ids of the other side.
+            data(np.ndarray): Ratings.
+            n_rows(int): Number of rows, at least the current one.
+        """
+
+        self._n_rows = n_rows
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        touched = np.unique(rows)
+        positions, old_cols, old_data = self._gather_rows(touched)
+        old_rows = touched[positions]
+        all_rows = np.concatenate([old_rows, rows])
+        all_cols = np.concatenate([old_cols, np.asarray(cols, dtype=np.int32)])
+        all_data = np.concatenate([old_data,
+                                   np.asarray(data, dtype=np.float32)])
+
+        # keep the last rating of each pair, old ones first within a row
+        pairs = all_rows * (int(all_cols.max()) + 1) + all_cols
+        _, last = np.unique(pairs[::-1], return_index=True)
+        kept = np.sort(len(pairs) - 1 - last)
+        kept = kept[np.argsort(all_rows[kept], kind='stable')]
+        bounds = np.searchsorted(all_rows[kept], touched[1:])
+        self._changed_rows.update(zip(
+            touched.tolist(),
+            zip(np.split(all_cols[kept], bounds),
+                np.split(all_data[kept], bounds))))
+        self._nnz += len(kept) - len(old_rows)
+
+    def _gather_rows(self, rows):
+        """Ratings of some rows, as ``(positions, cols, data)`` arrays where
+        ``positions`` are those of the rows in ``rows``, in increasing order.
+        """
+
+        n_stored = len(self._indptr) - 1
+        stored = np.array([k < n_stored and k not in self._changed_rows
+                           for k in rows.tolist()], dtype=bool)
+        starts = self._indptr[rows[stored]]
+        lengths = self._indptr[rows[stored] + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths,
+                            lengths) + np.arange(lengths.sum())
+        parts = [(np.repeat(np.flatnonzero(stored), lengths),
+                  self._indices[offsets], self._data[offsets])]
+        for position in np.flatnonzero(~stored).tolist():
+            cols, data = self._changed_rows.get(
+                int(rows[position]),
+                (np.empty(0, np.int32), np.empty(0, np.float32)))
+            parts.append((np.full(len(cols), position, dtype=np.int64),
+                          cols, data))
+        positions, cols, data = (np.concatenate(arrays)
+                                 for arrays in zip(*parts))
+        order = np.argsort(positions, kind='stable')
+        return positions[order], cols[order], data[order]
+
+    def _merge_changed_rows(self):
+        """Rebuild the compressed arrays with the changed rows."""
+
+        if not self._changed_rows:
+            return
+        n_stored = len(self._indptr) - 1
+        lengths = np.zeros(self._n_rows, dtype=np.int64)
+        lengths[:n_stored] = np.diff(self._indptr)
+        changed = np.fromiter(self._changed_rows, dtype=np.int64,
+                              count=len(self._changed_rows))
+        changed.sort()
+        lengths[changed] = [len(self._changed_rows[k][0])
+                            for k in changed.tolist()]
+        indptr = np.zeros(self._n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+
+        # unchanged rows keep their offset within the row
+        row_ids = np.repeat(np.arange(n_stored), np.diff(self._indptr))
+        unchanged = np.ones(n_stored, dtype=bool)
+        unchanged[changed[changed < n_stored]] = False
+        keep = np.flatnonzero(unchanged[row_ids])
+        positions = indptr[row_ids[keep]] + keep - self._indptr[row_ids[keep]]
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=np.float32)
+        indices[positions] = self._indices[keep]
+        data[positions] = self._data[keep]
+        for k in changed.tolist():
+            cols, values = self._changed_rows[k]
+            indices[indptr[k]:indptr[k + 1]] = cols
+            data[indptr[k]:indptr[k + 1]] = values
+
+        self._indptr, self._indices, self._data = indptr, indices, data
+        self._changed_rows = {}
+
+    def row_ids(self):
+        """Row inner id of every stored rating.
+        Returns:
+            np.ndarray: Array of size ``nnz`` aligned with ``indices``.
+        """
+
+        return np.repeat(np.arange(self.n_rows, dtype=np.int32),
+                         np.diff(self.indptr))
+
+    def to_csr(self, n_cols, rows=None):
+        """View the storage as a scipy sparse matrix, without copying.
+        Args:
+            n_cols(int): Number of columns (inner ids of the other side).
+            rows(array-like): Inner ids of the rows to keep, in this order.
+                Their ratings are copied, without merging the changed rows
+                back into the arrays. Default is all rows, not copied.
+        Returns:
+            scipy.sparse.csr_matrix: Matrix of shape ``(n_rows, n_cols)``, or
+            ``(len(rows), n_cols)``.
+        """
+
+        if rows is None:
+            return csr_matrix((self.data, self.indices, self.indptr),
+                              shape=(self.n_rows, n_cols), copy=False)
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        positions, cols, data = self._gather_rows(rows)
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=len(rows)),
+                  out=indptr[1:])
+        return csr_matrix((data, cols, indptr), shape=(len(rows), n_cols))
+
+    def __getitem__(self, k):
+        if not isinstance(k, Integral) or not 0 <= k < self.n_rows:
+            raise KeyError(k)
+        indices, data = self.row(k)
+        return list(zip(indices.tolist(), data.tolist()))
+
+    def __iter__(self):
+        return iter(range(self.n_rows))
+
+    def __len__(self):
+        return self.n_rows
+
 
 class Trainset:
     """A trainset contains all useful data that constitute a training set.
     It is used by the :meth: fit() of every
     prediction algorithm.
     Attributes:
-        ur(:obj:`defaultdict` of :obj:`list`): The users ratings. This is a
-            dictionary containing lists of tuples of the form ``(item_inner_id,
-            rating)``. The keys are user inner ids.
-        ir(:obj:`defaultdict` of :obj:`list`): The items ratings. This is a
-            dictionary containing lists of tuples of the form ``(user_inner_id,
-            rating)``. The keys are item inner ids.
+        ur(CompressedRatings): The users ratings. Indexed by user inner id,
+            it gives lists of tuples of the form ``(item_inner_id, rating)``.
+        ir(CompressedRatings): The items ratings. Indexed by item inner id,
+            it gives lists of tuples of the form ``(user_inner_id, rating)``.
         n_users: Total number of users :math:`|U|`.
         n_items: Total number of items :math:`|I|`.
         n_ratings: Total number of ratings :math:`|R_{train}|`.
         rating_scale(tuple): The minimum and maximal rating of the rating
             scale.
         global_mean: The mean of all ratings :math:`\\mu`.
+        user_counts, item_counts: The number of ratings of each user and item.
+        user_means, item_means: The mean rating of each user and item, the
+            global mean for those without ratings.
     """
 
     def __init__(self, ur, ir, n_users, n_items, n_ratings, rating_scale,
@@ -104,16 +463,37 @@ class Trainset:
         self._raw2inner_id_users = raw2inner_id_users
         self._raw2inner_id_items = raw2inner_id_items
         self._global_mean = None
+        # statistics computed when first needed, reset by add_ratings
+        self._stats = {}
         # inner2raw dicts could be built right now (or even before) but they
         # are not always useful so we wait until we need them.
         self._inner2raw_id_users = None
         self._inner2raw_id_items = None
+        self._raw_uids = None
+        self._raw_iids = None
+        self._listeners = []
+        self._user_info_positions = None
+        self._item_info_positions = None
+
+    def add_listener(self, callback):
+        """Register a function called with the raw ids of the users whose
+        ratings changed, after each :meth:`add_ratings`.
+        Args:
+            callback(callable): Function taking an array of user raw ids.
+        """
+
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
 
     def set_user_info(self, user_info):
         self.user_info = user_info
+        self._user_info_positions = None
 
     def set_item_info(self, item_info):
         self.item_info = item_info
+        self._item_info_positions = None
     
     def get_userid_info(self, uid, columns=None, is_raw_id=True):
         if not is_raw_id:
@@ -125,6 +505,69 @@ class Trainset:
             iid = self.to_raw_iid(iid)
         return self.item_info.get_inforamtions(iid, columns)
 
+    def get_users_info(self, uids, columns=None, is_raw_id=True,
+                       as_records=False):
+        """Information of many users at once, see :meth:`InfoData.take`.
+        Raw ids are looked up in the information itself, so users without
+        ratings in the trainset get their information too. Inner ids only
+        exist for users with ratings.
+        Args:
+            uids(array-like): The user ids.
+            columns(list): The columns. Default is all columns.
+            is_raw_id(bool): Whether the ids are raw or inner ids.
+            as_records(bool): Return a list of dicts instead of a dict of
+                column arrays.
+        Raises:
+            KeyError: If a user has no information, or an inner id is not
+                one of the trainset.
+        """
+
+        return self._get_info('users', uids, columns, is_raw_id, as_records)
+
+    def get_items_info(self, iids, columns=None, is_raw_id=True,
+                       as_records=False):
+        """Information of many items at once, see :meth:`get_users_info`.
+        Items that were never rated, which a content based model may still
+        recommend, are found by their raw ids.
+        """
+
+        return self._get_info('items', iids, columns, is_raw_id, as_records)
+
+    def _get_info(self, kind, ids, columns, is_raw_id, as_records):
+        info = self.user_info if kind == 'users' else self.item_info
+        ids = np.asarray(ids)
+        if is_raw_id:
+            return info.get_batch(ids, columns, as_records)
+
+        all_positions = self._info_positions(kind)
+        if len(ids) and ids.dtype.kind not in 'iu':
+            raise KeyError('Inner ids are integers, not {0}'.format(ids.dtype))
+        invalid = (ids < 0) | (ids >= len(all_positions))
+        if invalid.any():
+            raise KeyError('Unknown inner ids: {0}'.format(
+                list(ids[invalid][:10])))
+        positions = all_positions[ids]
+        if (positions < 0).any():
+            raise KeyError('No information for inner ids: {0}'.format(
+                list(ids[positions < 0][:10])))
+        return info.take(positions, columns, as_records)
+
+    def _info_positions(self, kind):
+        """Rows of the information of every inner id, -1 for missing rows.
+        Computed once, so gathering information costs one indexing operation
+        per column.
+        """
+
+        attribute = '_user_info_positions' if kind == 'users' \
+            else '_item_info_positions'
+        if getattr(self, attribute) is None:
+            if kind == 'users':
+                positions = self.user_info.positions(self.raw_uids, 'ignore')
+            else:
+                positions = self.item_info.positions(self.raw_iids, 'ignore')
+            setattr(self, attribute, positions)
+        return getattr(self, attribute)
+
     def to_inner_uid(self, ruid):
         """Convert a **user** raw id to an inner id.
         Args:
@@ -135,12 +578,27 @@ class Trainset:
             ValueError: When user is not part of the trainset.
         """
 
+        if self._raw2inner_id_users is None:
+            self._raw2inner_id_users = _raw2inner(self.raw_uids)
         try:
             return self._raw2inner_id_users[ruid]
         except KeyError:
             raise ValueError('User ' + str(ruid) +
                              ' is not part of the trainset.')
 
+    def to_inner_uids(self, ruids):
+        """Convert an array of **user** raw ids to inner ids.
+        Args:
+            ruids(array-like): The user raw ids.
+        Returns:
+            np.ndarray: The user inner ids.
+        Raises:
+            ValueError: When a user is not part of the trainset.
+        """
+
+        with instrumentation.stage('Trainset.to_inner_uids'):
+            return _to_inner_ids(self.raw_uids, ruids, 'User')
+
     def to_raw_uid(self, iuid):
         """Convert a **user** inner id to a raw id.
         Args:
@@ -152,8 +610,7 @@ class Trainset:
         """
 
         if self._inner2raw_id_users is None:
-            self._inner2raw_id_users = {inner: raw for (raw, inner) in
-                                        iteritems(self._raw2inner_id_users)}
+            self._inner2raw_id_users = dict(enumerate(self.raw_uids.tolist()))
 
         try:
             return self._inner2raw_id_users[iuid]
@@ -170,12 +627,27 @@ class Trainset:
             ValueError: When item is not part of the trainset.
         """
 
+        if self._raw2inner_id_items is None:
+            self._raw2inner_id_items = _raw2inner(self.raw_iids)
         try:
             return self._raw2inner_id_items[riid]
         except KeyError:
             raise ValueError('Item ' + str(riid) +
                              ' is not part of the trainset.')
 
+    def to_inner_iids(self, riids):
+        """Convert an array of **item** raw ids to inner ids.
+        Args:
+            riids(array-like): The item raw ids.
+        Returns:
+            np.ndarray: The item inner ids.
+        Raises:
+            ValueError: When an item is not part of the trainset.
+        """
+
+        with instrumentation.stage('Trainset.to_inner_iids'):
+            return _to_inner_ids(self.raw_iids, riids, 'Item')
+
     def to_raw_iid(self, iiid):
         """Convert an **item** inner id to a raw id.
         Args:
@@ -187,23 +659,70 @@ class Trainset:
         """
 
         if self._inner2raw_id_items is None:
-            self._inner2raw_id_items = {inner: raw for (raw, inner) in
-                                        iteritems(self._raw2inner_id_items)}
+            self._inner2raw_id_items = dict(enumerate(self.raw_iids.tolist()))
 
         try:
             return self._inner2raw_id_items[iiid]
         except KeyError:
             raise ValueError(str(iiid) + ' is not a valid inner id.')
 
-    def all_ratings(self):
-        """Generator function to iterate over all ratings.
+    def user_ratings(self, uid):
+        """Ratings of a user, as zero-copy views on the storage.
+        Args:
+            uid(int): The user inner id.
+        Returns:
+            A tuple ``(item_inner_ids, ratings)`` of arrays.
+        """
+
+        return self.ur.row(uid)
+
+    def item_ratings(self, iid):
+        """Ratings of an item, as zero-copy views on the storage.
+        Args:
+            iid(int): The item inner id.
+        Returns:
+            A tuple ``(user_inner_ids, ratings)`` of arrays.
+        """
+
+        return self.ir.row(iid)
+
+    def rating_matrix(self, uids=None):
+        """The users x items rating matrix, sharing the storage arrays.
+        Args:
+            uids(array-like): Inner ids of the users whose rows are copied,
+                in this order. Default is all users.
+        Returns:
+            scipy.sparse.csr_matrix: Ratings indexed by inner ids, missing
+            ratings are implicit zeros.
+        """
+
+        return self.ur.to_csr(self.n_items, uids)
+
+    def all_ratings_arrays(self):
+        """All ratings as arrays, ordered by user inner id.
+        Returns:
+            A tuple ``(uids, iids, ratings)`` of arrays where ids are inner
+            ids.
+        """
+
+        return self.ur.row_ids(), self.ur.indices, self.ur.data
+
+    def all_ratings(self, chunk_size=65536):
+        """Iterate over all ratings, ordered by user inner id.
+        Ratings are converted to python scalars ``chunk_size`` at a time.
+        Args:
+            chunk_size(int): Number of ratings converted at once. Default
+                is 65536.
         Yields:
             A tuple ``(uid, iid, rating)`` where ids are inner ids.
         """
 
-        for u, u_ratings in iteritems(self.ur):
-            for i, r in u_ratings:
-                yield u, i, r
+        indptr, iids, ratings = self.ur.indptr, self.ur.indices, self.ur.data
+        for start in range(0, len(iids), chunk_size):
+            stop = min(start + chunk_size, len(iids))
+            uids = np.searchsorted(indptr, np.arange(start, stop), side='right') - 1
+            yield from zip(uids.tolist(), iids[start:stop].tolist(),
+                           ratings[start:stop].tolist())
 
     def all_users(self):
         """Generator function to iterate over all users.
@@ -219,10 +738,197 @@ class Trainset:
         """
         return range(self.n_items)
 
+    @property
+    def raw_uids(self):
+        """User raw ids ordered by inner id (:obj:`pd.Index`)."""
+        if self._raw_uids is None:
+            self._raw_uids = _ordered_raw_ids(self._raw2inner_id_users)
+        return self._raw_uids
+
+    @property
+    def raw_iids(self):
+        """Item raw ids ordered by inner id (:obj:`pd.Index`)."""
+        if self._raw_iids is None:
+            self._raw_iids = _ordered_raw_ids(self._raw2inner_id_items)
+        return self._raw_iids
+
+    def add_ratings(self, ruids, riids, ratings):
+        """Add new ratings to the trainset, in place.
+        Unknown users and items get the next inner ids, in order of first
+        appearance. A rating of an already rated ``(user, item)`` pair
+        replaces the former one. The cost depends on the number of ratings
+        of the users and items involved, not on the size of the trainset,
+        see :meth:`CompressedRatings.update_rows`.
+        Args:
+            ruids(array-like): The user raw ids.
+            riids(array-like): The item raw ids.
+            ratings(array-like): The ratings.
+        Returns:
+            A tuple ``(uids, iids)`` of arrays, the inner ids of the added
+            ratings.
+        """
+
+        uids = self._extend_raw_ids('users', ruids)
+        iids = self._extend_raw_ids('items', riids)
+        ratings = np.asarray(ratings, dtype=np.float32)
+        # only the rows of the rating users and of the rated items change
+        self.ur.update_rows(uids, iids, ratings, self.n_users)
+        self.ir.update_rows(iids, uids, ratings, self.n_items)
+        self.n_ratings = self.ur.nnz
+        self._global_mean = None
+        self._stats = {}
+        self._user_info_positions = self._item_info_positions = None
+        if self._listeners:
+            changed_users = np.asarray(self.raw_uids[np.unique(uids)])
+            for callback in self._listeners:
+                callback(changed_users)
+        return uids, iids
+
+    def _extend_raw_ids(self, kind, raw_ids):
+        """Inner ids of raw ids, after giving new inner ids to unknown ones."""
+
+        raw_index = self.raw_uids if kind == 'users' else self.raw_iids
+        inner_ids = raw_index.get_indexer(raw_ids)
+        unknown = inner_ids < 0
+        if not unknown.any():
+            return inner_ids.astype(np.int32)
+
+        unknown_raw_ids = np.asarray(raw_ids, dtype=object)[unknown]
+        new_raw_ids = pd.Index(pd.unique(unknown_raw_ids).tolist())
+        n_known = len(raw_index)
+        inner_ids[unknown] = n_known + new_raw_ids.get_indexer(unknown_raw_ids)
+        new_inner_ids = range(n_known, n_known + len(new_raw_ids))
+        raw_index = raw_index.append(new_raw_ids)
+        if kind == 'users':
+            self._raw_uids, self.n_users = raw_index, len(raw_index)
+            raw2inner = self._raw2inner_id_users
+            inner2raw = self._inner2raw_id_users
+        else:
+            self._raw_iids, self.n_items = raw_index, len(raw_index)
+            raw2inner = self._raw2inner_id_items
+            inner2raw = self._inner2raw_id_items
+        if raw2inner is not None:
+            raw2inner.update(zip(new_raw_ids.tolist(), new_inner_ids))
+        if inner2raw is not None:
+            inner2raw.update(zip(new_inner_ids, new_raw_ids.tolist()))
+        return inner_ids.astype(np.int32)
+
+    def get_state(self):
+        """Numeric state of the trainset, to be saved as arrays.
+        Returns:
+            A tuple ``(arrays, params)`` of a dict of arrays and a dict of
+            json serializable parameters, see :meth:`from_state`.
+        """
+
+        arrays = {
+            'ur_indptr': self.ur.indptr,
+            'ur_indices': self.ur.indices,
+            'ur_data': self.ur.data,
+            'ir_indptr': self.ir.indptr,
+            'ir_indices': self.ir.indices,
+            'ir_data': self.ir.data,
+            'raw_uids': np.asarray(self.raw_uids),
+            'raw_iids': np.asarray(self.raw_iids),
+        }
+        params = {'rating_scale': [float(r) for r in self.rating_scale]}
+        return arrays, params
+
+    @classmethod
+    def from_state(cls, arrays, params):
+        """Rebuild a trainset from :meth:`get_state` output.
+        Arrays are used as they are, so memory-mapped arrays stay mapped.
+        Raw to inner id dicts are only built when a single id is converted.
+        """
+
+        ur = CompressedRatings(arrays['ur_indptr'], arrays['ur_indices'],
+                               arrays['ur_data'])
+        ir = CompressedRatings(arrays['ir_indptr'], arrays['ir_indices'],
+                               arrays['ir_data'])
+        trainset = cls(ur, ir, ur.n_rows, ir.n_rows, ur.nnz,
+                       tuple(params['rating_scale']), None, None)
+        trainset._raw_uids = pd.Index(arrays['raw_uids'])
+        trainset._raw_iids = pd.Index(arrays['raw_iids'])
+        return trainset
+
     @property
     def global_mean(self):
         if self._global_mean is None:
-            self._global_mean = np.mean([r for (_, _, r) in
-                                         self.all_ratings()])
+            self._global_mean = float(np.mean(self.ur.data, dtype=np.float64))
 
         return self._global_mean
+
+    @property
+    def user_counts(self):
+        return np.diff(self.ur.indptr)
+
+    @property
+    def item_counts(self):
+        return np.diff(self.ir.indptr)
+
+    @property
+    def user_means(self):
+        if 'user_means' not in self._stats:
+            self._stats['user_means'] = self._means(self.ur)
+        return self._stats['user_means']
+
+    @property
+    def item_means(self):
+        if 'item_means' not in self._stats:
+            self._stats['item_means'] = self._means(self.ir)
+        return self._stats['item_means']
+
+    def _means(self, ratings):
+        sums = np.bincount(ratings.row_ids(), ratings.data, ratings.n_rows)
+        counts = np.diff(ratings.indptr)
+        means = np.full(ratings.n_rows, self.global_mean)
+        np.divide(sums, counts, out=means, where=counts > 0)
+        return means
+
+    def baseline_biases(self, reg_user=15., reg_item=10., n_epochs=10):
+        """Regularized user and item biases :math:`b_u, b_i` of the baseline
+        estimate :math:`\\mu + b_u + b_i`, fitted by alternating least squares
+        as Surprise's ``BaselineOnly``. They are cached for each set of
+        parameters.
+        Args:
+            reg_user(float): Regularization of the user biases.
+            reg_item(float): Regularization of the item biases.
+            n_epochs(int): Number of alternating updates.
+        Returns:
+            A tuple ``(user_biases, item_biases)`` of arrays indexed by inner
+            id.
+        """
+
+        key = ('baseline_biases', reg_user, reg_item, n_epochs)
+        if key not in self._stats:
+            uids, iids, ratings = self.all_ratings_arrays()
+            residuals = ratings.astype(np.float64) - self.global_mean
+            user_biases = np.zeros(self.n_users)
+            item_biases = np.zeros(self.n_items)
+            for _ in range(n_epochs):
+                item_biases = np.bincount(
+                    iids, residuals - user_biases[uids], self.n_items) / \
+                    (reg_item + self.item_counts)
+                user_biases = np.bincount(
+                    uids, residuals - item_biases[iids], self.n_users) / \
+                    (reg_user + self.user_counts)
+            self._stats[key] = (user_biases, item_biases)
+        return self._stats[key]
+
+
+def _ordered_raw_ids(raw2inner):
+    raw_ids = np.empty(len(raw2inner), dtype=object)
+    raw_ids[list(raw2inner.values())] = list(raw2inner.keys())
+    return pd.Index(raw_ids.tolist())
+
+
+def _raw2inner(raw_ids):
+    return dict(zip(raw_ids.tolist(), range(len(raw_ids))))
+
+
+def _to_inner_ids(raw_ids, query, kind):
+    inner_ids = raw_ids.get_indexer(query)
+    if (inner_ids < 0).any():
+        unknown = np.asarray(query)[inner_ids < 0][0]
+        raise ValueError(kind + ' ' + str(unknown) +
+                         ' is not part of the trainset.')
+    return inner_ids
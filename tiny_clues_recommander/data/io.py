@@ -0,0 +1,156 @@
+"""Load large ratings CSV files by chunks into compact arrays.
+
+Chunks are encoded as they are read: user and item ids become int32 inner ids
+(in order of first appearance, as :meth:`Dataset.build_trainset` gives them)
+and ratings float32, so the whole file never sits in memory as int64/object
+columns. The encoded ratings are cached next to the file as raw ``.npy``
+arrays, later loads memory-map them instead of parsing the CSV again:
+
+    >>> dataset = load_ratings('BX-Book-Ratings.csv', sep=';',
+    ...                        encoding='latin-1', dtype={'ISBN': str},
+    ...                        drop_zero=True)
+    >>> trainset = dataset.build_trainset()
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .. import persistence
+from .dataset import Dataset
+
+CACHE_NAME = 'ratings'
+
+
+class _IncrementalCodes():
+    """``pd.factorize`` over successive chunks: an id keeps the code given in
+    the first chunk it appears in.
+    Attributes:
+        uniques(pd.Index): The ids, indexed by code.
+    """
+    def __init__(self):
+        self.uniques = None
+
+    def encode(self, values):
+        """Codes of the ids, ``-1`` for missing ids (NaN, None)."""
+        if self.uniques is None:
+            codes, uniques = pd.factorize(values)
+            self.uniques = pd.Index(uniques)
+            return codes.astype(np.int32)
+        codes = self.uniques.get_indexer(values)
+        unknown = codes < 0
+        if unknown.any():
+            new_codes, new_uniques = pd.factorize(values[unknown])
+            codes[unknown] = np.where(new_codes < 0, -1,
+                                      len(self.uniques) + new_codes)
+            self.uniques = self.uniques.append(pd.Index(new_uniques))
+        return codes.astype(np.int32)
+
+
+def _source_key(path, columns, drop_zero, read_csv_kwargs):
+    """Describes a CSV file and how it is read, a cache is only used for the
+    same key.
+    """
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'columns': None if columns is None else list(columns),
+        'drop_zero': drop_zero,
+        'read_csv': repr(sorted(read_csv_kwargs.items())),
+    }
+
+
+def read_ratings(path, columns=None, chunksize=10 ** 6, drop_zero=False,
+                 **read_csv_kwargs):
+    """Parse a ratings CSV file by chunks into encoded arrays.
+    Args:
+        path(str): The CSV file.
+        columns(list): Names of the user, item and rating columns. Default is
+            the first three columns.
+        chunksize(int): Number of lines parsed at once.
+        drop_zero(bool): Drop the ``0`` ratings, the implicit ratings of BX
+            data, before their ids are encoded.
+        **read_csv_kwargs: Passed to ``pd.read_csv`` (``sep``, ``encoding``,
+            ``dtype`` of ids that may look numeric...).
+    Returns:
+        A tuple ``(user_codes, item_codes, ratings, raw_users, raw_items,
+        columns)`` as taken by :meth:`Dataset.from_codes`.
+    Raises:
+        ValueError: When a user or item id is missing.
+    """
+
+    if columns is not None:
+        read_csv_kwargs['usecols'] = list(columns)
+    user_ids, item_ids = _IncrementalCodes(), _IncrementalCodes()
+    user_codes, item_codes, ratings = [], [], []
+    for chunk in pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs):
+        chunk = chunk.iloc[:, :3] if columns is None else chunk[list(columns)]
+        chunk_ratings = chunk.iloc[:, 2].to_numpy(dtype=np.float32)
+        keep = chunk_ratings != 0 if drop_zero \
+            else np.ones(len(chunk), dtype=bool)
+        for column, ids, codes in ((0, user_ids, user_codes),
+                                   (1, item_ids, item_codes)):
+            codes.append(ids.encode(chunk.iloc[:, column].to_numpy()[keep]))
+            missing = np.flatnonzero(codes[-1] < 0)
+            if len(missing):
+                raise ValueError('Ratings have no {0} id, first at row {1}.'
+                                 .format(chunk.columns[column],
+                                         chunk.index[keep][missing[0]]))
+        ratings.append(chunk_ratings[keep])
+        columns = list(chunk.columns)
+
+    return (np.concatenate(user_codes), np.concatenate(item_codes),
+            np.concatenate(ratings), user_ids.uniques, item_ids.uniques,
+            columns)
+
+
+def load_ratings(path, columns=None, chunksize=10 ** 6, drop_zero=False,
+                 cache=True, cache_path=None, mmap=True, **read_csv_kwargs):
+    """Load a ratings CSV file as a :class:`Dataset`, through a binary cache.
+    The cache is rebuilt when the file, the columns, ``drop_zero`` or the
+    ``pd.read_csv`` arguments change.
+    Args:
+        path(str): The CSV file.
+        columns(list): Names of the user, item and rating columns. Default is
+            the first three columns.
+        chunksize(int): Number of lines parsed at once.
+        drop_zero(bool): Drop the ``0`` ratings.
+        cache(bool): Read and write the binary cache.
+        cache_path(str): Directory of the cache. Default is ``path`` with a
+            ``.cache`` suffix.
+        mmap(bool): Memory-map the cached arrays instead of reading them.
+        **read_csv_kwargs: Passed to ``pd.read_csv``.
+    Returns:
+        Dataset: The encoded ratings, see :meth:`Dataset.from_codes`.
+    """
+
+    cache_path = cache_path or str(path) + '.cache'
+    key = _source_key(path, columns, drop_zero, read_csv_kwargs)
+    if cache and os.path.exists(os.path.join(cache_path,
+                                             persistence.META_FILE)):
+        _, arrays, params, _ = persistence.load_state(cache_path, mmap=mmap)
+        if params['source'] == key:
+            return Dataset.from_codes(
+                arrays['user_codes'], arrays['item_codes'], arrays['ratings'],
+                arrays['raw_users'], arrays['raw_items'], params['columns'])
+
+    user_codes, item_codes, ratings, raw_users, raw_items, names = \
+        read_ratings(path, columns, chunksize, drop_zero, **read_csv_kwargs)
+    if cache:
+        # written aside then renamed, so an interrupted run leaves no
+        # partial cache behind
+        tmp_path = cache_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        persistence.save_state(tmp_path, CACHE_NAME, {
+            'user_codes': user_codes,
+            'item_codes': item_codes,
+            'ratings': ratings,
+            'raw_users': np.asarray(raw_users),
+            'raw_items': np.asarray(raw_items),
+        }, {'source': key, 'columns': names})
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.rename(tmp_path, cache_path)
+    return Dataset.from_codes(user_codes, item_codes, ratings, raw_users,
+                              raw_items, names)
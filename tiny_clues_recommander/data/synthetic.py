@@ -0,0 +1,94 @@
+"""Seeded generators of synthetic ratings, shaped like MovieLens or
+Book-Crossing (BX) data: user activity and item popularity follow power laws.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _power_law(n, exponent, rng):
+    """Shuffled probabilities proportional to ``rank ** -exponent``."""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def make_ratings(n_ratings, n_users=None, n_items=None, user_exponent=0.8,
+                 item_exponent=1.0, rating_scale=(1, 5), implicit_fraction=0.,
+                 random_state=None):
+    """Generate a ratings DataFrame with power-law user and item frequencies.
+    Each (user, item) pair is rated at most once. Ratings are drawn around
+    per-user and per-item biases and rounded to the rating scale.
+    Args:
+        n_ratings(int): Number of ratings.
+        n_users(int): Number of users. Default is ``n_ratings // 20``, in line
+            with MovieLens.
+        n_items(int): Number of items. Default is ``n_ratings // 50``.
+        user_exponent(float): Power-law exponent of user activity.
+        item_exponent(float): Power-law exponent of item popularity.
+        rating_scale(tuple): The minimum and maximal rating.
+        implicit_fraction(float): Fraction of ratings replaced by ``0``, the
+            implicit ratings of BX data.
+        random_state(int): Seed of the generator.
+    Returns:
+        pd.DataFrame: Ratings cols: user_id | movie_id | rating, with int32
+        ids and float32 ratings.
+    """
+
+    rng = np.random.RandomState(random_state)
+    n_users = n_users or max(n_ratings // 20, 1)
+    n_items = n_items or max(n_ratings // 50, 1)
+    if n_ratings > n_users * n_items:
+        raise ValueError('Cannot draw {0} distinct ratings from {1} users and '
+                         '{2} items.'.format(n_ratings, n_users, n_items))
+
+    user_probabilities = _power_law(n_users, user_exponent, rng)
+    item_probabilities = _power_law(n_items, item_exponent, rng)
+    pairs = np.empty(0, dtype=np.int64)
+    while len(pairs) < n_ratings:
+        n_draws = int((n_ratings - len(pairs)) * 1.2) + 1
+        users = rng.choice(n_users, n_draws, p=user_probabilities)
+        items = rng.choice(n_items, n_draws, p=item_probabilities)
+        drawn = np.concatenate([pairs, users.astype(np.int64) * n_items + items])
+        # keep the first draw of each pair, in draw order
+        _, first = np.unique(drawn, return_index=True)
+        pairs = drawn[np.sort(first)]
+    pairs = pairs[:n_ratings]
+    users, items = pairs // n_items, pairs % n_items
+
+    low, high = rating_scale
+    center, spread = (low + high) / 2, (high - low) / 4
+    user_biases = rng.normal(0, spread / 2, n_users)
+    item_biases = rng.normal(0, spread / 2, n_items)
+    ratings = center + user_biases[users] + item_biases[items] + rng.normal(0, spread, n_ratings)
+    ratings = np.clip(np.round(ratings), low, high)
+    if implicit_fraction:
+        ratings[rng.random_sample(n_ratings) < implicit_fraction] = 0
+
+    return pd.DataFrame({
+        'user_id': users.astype(np.int32),
+        'movie_id': items.astype(np.int32),
+        'rating': ratings.astype(np.float32),
+    })
+
+
+def make_movies(n_items, n_genres=18, genres_per_movie=2, random_state=None):
+    """Generate a movies DataFrame with one-hot genre columns.
+    Args:
+        n_items(int): Number of movies, with ids ``0..n_items - 1``.
+        n_genres(int): Number of genre columns.
+        genres_per_movie(float): Mean number of genres of a movie.
+        random_state(int): Seed of the generator.
+    Returns:
+        pd.DataFrame: Movies cols: movie_id | title | year | *genres, indexed
+        by movie id.
+    """
+
+    rng = np.random.RandomState(random_state)
+    genres = rng.random_sample((n_items, n_genres)) < genres_per_movie / n_genres
+    genres[np.arange(n_items), rng.randint(n_genres, size=n_items)] = True
+    movies = pd.DataFrame(genres.astype(np.float64),
+                          columns=['genre_{0}'.format(g) for g in range(n_genres)])
+    movies.insert(0, 'movie_id', np.arange(n_items))
+    movies.insert(1, 'title', ['Movie {0}'.format(i) for i in range(n_items)])
+    movies.insert(2, 'year', rng.randint(1920, 2001, size=n_items))
+    return movies
@@ -0,0 +1,72 @@
+import numpy as np
+from scipy.sparse.linalg import svds
+
+
+def randomized_svd(matrix, k, n_oversamples=10, n_iter=4, random_state=None):
+    """compute the top k singular triplets with a randomized range finder
+    (Halko, Martinsson & Tropp). Only products with ``matrix`` are needed, so
+    it works on sparse matrices without densifying them.
+
+    Args:
+        matrix (scipy.sparse matrix or np.ndarray): matrix of shape (n_rows, n_cols)
+        k (int): number of singular triplets
+        n_oversamples (int, optional): extra random directions used to capture the range. Defaults to 10.
+        n_iter (int, optional): number of power iterations, improves accuracy on slowly decaying spectra. Defaults to 4.
+        random_state (int, optional): seed of the random projection. Defaults to None.
+
+    Returns:
+        Tuple: U (n_rows, k), S (k,) in decreasing order, Vt (k, n_cols)
+    """
+    rng = np.random.RandomState(random_state)
+    n_random = min(k + n_oversamples, min(matrix.shape))
+
+    Q, _ = np.linalg.qr(matrix @ rng.normal(size=(matrix.shape[1], n_random)))
+    for _ in range(n_iter):
+        Z, _ = np.linalg.qr(matrix.T @ Q)
+        Q, _ = np.linalg.qr(matrix @ Z)
+
+    B = (matrix.T @ Q).T
+    U_B, S, Vt = np.linalg.svd(B, full_matrices=False)
+    return (Q @ U_B)[:, :k], S[:k], Vt[:k]
+
+
+def lanczos_svd(matrix, k, random_state=None):
+    """compute the top k singular triplets with ARPACK's implicitly restarted Lanczos method
+
+    Args:
+        matrix (scipy.sparse matrix or np.ndarray): matrix of shape (n_rows, n_cols)
+        k (int): number of singular triplets, must be lower than min(n_rows, n_cols)
+        random_state (int, optional): seed of the starting vector. Defaults to None.
+
+    Returns:
+        Tuple: U (n_rows, k), S (k,) in decreasing order, Vt (k, n_cols)
+    """
+    v0 = np.random.RandomState(random_state).uniform(-1, 1, size=min(matrix.shape))
+    U, S, Vt = svds(matrix.astype(np.float64), k=k, v0=v0)
+    order = np.argsort(S)[::-1]
+    return U[:, order], S[order], Vt[order]
+
+
+SOLVERS = {
+    'randomized': randomized_svd,
+    'lanczos': lanczos_svd,
+}
+
+
+def truncated_svd(matrix, k, solver='randomized', **kwargs):
+    """compute the top k singular triplets of a (sparse) matrix
+
+    Args:
+        matrix (scipy.sparse matrix or np.ndarray): matrix of shape (n_rows, n_cols)
+        k (int): number of singular triplets
+        solver (str, optional): one of 'randomized' | 'lanczos'. Defaults to 'randomized'.
+        **kwargs: passed to the solver
+
+    Returns:
+        Tuple: U (n_rows, k), S (k,) in decreasing order, Vt (k, n_cols)
+    """
+    try:
+        solve = SOLVERS[solver]
+    except KeyError:
+        raise ValueError(f'Unknown solver {solver!r}, expected one of {sorted(SOLVERS)}.')
+    return solve(matrix, k, **kwargs)
@@ -1,8 +1,15 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
-from collections import defaultdict
 import numpy as np
-from six import iteritems
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+def _errors(predictions):
+    """Errors ``true - est`` of predictions, as a float array."""
+
+    predictions = np.asarray(predictions, dtype=np.float64)
+    return predictions[:, 0] - predictions[:, 1]
 
 
 def rmse(predictions, verbose=True):
@@ -11,10 +18,9 @@ def rmse(predictions, verbose=True):
         \\text{RMSE} = \\sqrt{\\frac{1}{|\\hat{R}|} \\sum_{\\hat{r}_{ui} \in
         \\hat{R}}(r_{ui} - \\hat{r}_{ui})^2}.
     Args:
-        predictions (:obj:`list` of :obj:`Prediction\
-            <surprise.prediction_algorithms.predictions.Prediction>`):
-            A list of predictions, as returned by the :meth:`test()
-            <surprise.prediction_algorithms.algo_base.AlgoBase.test>` method.
+        predictions (:obj:`list` of ``(true, est)`` tuples or
+            :obj:`np.ndarray` of shape ``(n, 2)``): The predictions, as
+            returned by :meth:`SVD.test_result`.
         verbose: If True, will print computed value. Default is ``True``.
     Returns:
         The Root Mean Squared Error of predictions.
@@ -22,11 +28,10 @@ def rmse(predictions, verbose=True):
         ValueError: When ``predictions`` is empty.
     """
 
-    if not predictions:
+    if len(predictions) == 0:
         raise ValueError('Prediction list is empty.')
 
-    mse = np.mean([float((true_r - est)**2) for true_r, est in predictions])
-    rmse_ = np.sqrt(mse)
+    rmse_ = np.sqrt(np.mean(_errors(predictions) ** 2))
 
     if verbose:
         print('RMSE: {0:1.4f}'.format(rmse_))
@@ -40,10 +45,9 @@ def mse(predictions, verbose=True):
         \\text{MSE} = \\frac{1}{|\\hat{R}|} \\sum_{\\hat{r}_{ui} \in
         \\hat{R}}(r_{ui} - \\hat{r}_{ui})^2.
     Args:
-        predictions (:obj:`list` of :obj:`Prediction\
-            <surprise.prediction_algorithms.predictions.Prediction>`):
-            A list of predictions, as returned by the :meth:`test()
-            <surprise.prediction_algorithms.algo_base.AlgoBase.test>` method.
+        predictions (:obj:`list` of ``(true, est)`` tuples or
+            :obj:`np.ndarray` of shape ``(n, 2)``): The predictions, as
+            returned by :meth:`SVD.test_result`.
         verbose: If True, will print computed value. Default is ``True``.
     Returns:
         The Mean Squared Error of predictions.
@@ -51,11 +55,10 @@ def mse(predictions, verbose=True):
         ValueError: When ``predictions`` is empty.
     """
 
-    if not predictions:
+    if len(predictions) == 0:
         raise ValueError('Prediction list is empty.')
 
-    mse_ = np.mean([float((true_r - est)**2)
-                    for true_r, est in predictions])
+    mse_ = np.mean(_errors(predictions) ** 2)
 
     if verbose:
         print('MSE: {0:1.4f}'.format(mse_))
@@ -69,10 +72,9 @@ def mae(predictions, verbose=True):
         \\text{MAE} = \\frac{1}{|\\hat{R}|} \\sum_{\\hat{r}_{ui} \in
         \\hat{R}}|r_{ui} - \\hat{r}_{ui}|
     Args:
-        predictions (:obj:`list` of :obj:`Prediction\
-            <surprise.prediction_algorithms.predictions.Prediction>`):
-            A list of predictions, as returned by the :meth:`test()
-            <surprise.prediction_algorithms.algo_base.AlgoBase.test>` method.
+        predictions (:obj:`list` of ``(true, est)`` tuples or
+            :obj:`np.ndarray` of shape ``(n, 2)``): The predictions, as
+            returned by :meth:`SVD.test_result`.
         verbose: If True, will print computed value. Default is ``True``.
     Returns:
         The Mean Absolute Error of predictions.
@@ -80,14 +82,214 @@ def mae(predictions, verbose=True):
         ValueError: When ``predictions`` is empty.
     """
 
-    if not predictions:
+    if len(predictions) == 0:
         raise ValueError('Prediction list is empty.')
 
-    mae_ = np.mean([float(abs(true_r - est))
-                    for true_r, est in predictions])
+    mae_ = np.mean(np.abs(_errors(predictions)))
 
     if verbose:
         print('MAE:  {0:1.4f}'.format(mae_))
 
     return mae_
 
+
+class ErrorAccumulator:
+    """Accumulate prediction errors chunk by chunk, e.g. from a batched
+    predictor, without keeping the predictions in memory.
+    Attributes:
+        count(int): Number of predictions seen so far.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._squared_sum = 0.
+        self._absolute_sum = 0.
+
+    def update(self, predictions):
+        """Add a chunk of predictions.
+        Args:
+            predictions: ``(true, est)`` pairs, as accepted by :func:`rmse`.
+        Returns:
+            The accumulator itself.
+        """
+
+        if len(predictions) == 0:
+            return self
+        errors = _errors(predictions)
+        self.count += len(errors)
+        self._squared_sum += float(np.dot(errors, errors))
+        self._absolute_sum += float(np.abs(errors).sum())
+        return self
+
+    def _check(self):
+        if self.count == 0:
+            raise ValueError('Prediction list is empty.')
+
+    def mse(self):
+        """The Mean Squared Error of the predictions seen so far."""
+
+        self._check()
+        return self._squared_sum / self.count
+
+    def rmse(self):
+        """The Root Mean Squared Error of the predictions seen so far."""
+
+        return np.sqrt(self.mse())
+
+    def mae(self):
+        """The Mean Absolute Error of the predictions seen so far."""
+
+        self._check()
+        return self._absolute_sum / self.count
+
+
+def holdout_matrix(test, user_ids, item_ids, min_rating=None):
+    """Build the sparse relevance matrix of a holdout set, aligned with the
+    rows and columns of a recommendation matrix.
+    Args:
+        test(pd.DataFrame): Holdout ratings, cols: user_id | movie_id | rating
+        user_ids(array-like): Ids of the users, in recommendation rows order.
+        item_ids(array-like): Ids of all the items that can be recommended.
+        min_rating(float): Minimal rating of a relevant item. Default is
+            ``None``: every holdout item is relevant.
+    Returns:
+        :obj:`csr_matrix` of shape ``(len(user_ids), len(item_ids))``, ones
+        for relevant items.
+    """
+
+    if min_rating is not None:
+        test = test[test['rating'] >= min_rating]
+    rows = pd.Index(user_ids).get_indexer(test['user_id'])
+    cols = pd.Index(item_ids).get_indexer(test['movie_id'])
+    known = (rows >= 0) & (cols >= 0)
+    relevant = csr_matrix((np.ones(known.sum(), dtype=np.int8),
+                           (rows[known], cols[known])),
+                          shape=(len(user_ids), len(item_ids)))
+    relevant.sum_duplicates()
+    relevant.data[:] = 1
+    return relevant
+
+
+def item_positions(recommended, item_ids):
+    """Convert a matrix of recommended item ids, as returned by
+    ``predict_batch``, to column positions of :func:`holdout_matrix`.
+    Unknown ids get the position ``-1`` (an empty slot).
+    """
+
+    recommended = np.asarray(recommended)
+    return pd.Index(item_ids).get_indexer(recommended.ravel()).reshape(
+        recommended.shape)
+
+
+def _hits(recommended, relevant, k):
+    """Relevance of the first ``k`` recommendations of each user, and the
+    number of relevant items of each user."""
+
+    recommended = np.asarray(recommended)
+    if k is not None:
+        recommended = recommended[:, :k]
+    if recommended.shape[0] != relevant.shape[0]:
+        raise ValueError('recommended and relevant must have the same number '
+                         'of users.')
+    filled = recommended >= 0
+    rows = np.repeat(np.arange(recommended.shape[0]), recommended.shape[1])
+    hits = np.asarray(relevant[rows, np.where(filled, recommended, 0).ravel()])
+    hits = (hits.reshape(recommended.shape) != 0) & filled
+    n_relevant = np.diff(relevant.tocsr().indptr)
+    return hits, n_relevant
+
+
+def _report(name, value, verbose):
+    if verbose:
+        print('{0}: {1:1.4f}'.format(name, value))
+    return value
+
+
+def precision_at_k(recommended, relevant, k=None, verbose=True):
+    """Compute the mean Precision@k over the users having relevant items.
+    Args:
+        recommended(:obj:`np.ndarray`): Positions of the recommended items,
+            of shape ``(n_users, N)``, best first, ``-1`` for empty slots.
+        relevant(:obj:`csr_matrix`): Relevant items of each user, as returned
+            by :func:`holdout_matrix`.
+        k(int): Number of recommendations considered. Default is ``None``:
+            all ``N``.
+        verbose: If True, will print computed value. Default is ``True``.
+    Returns:
+        The mean Precision@k.
+    """
+
+    hits, n_relevant = _hits(recommended, relevant, k)
+    users = n_relevant > 0
+    value = np.mean(hits[users].sum(axis=1) / hits.shape[1])
+    return _report('Precision@{0}'.format(hits.shape[1]), value, verbose)
+
+
+def recall_at_k(recommended, relevant, k=None, verbose=True):
+    """Compute the mean Recall@k over the users having relevant items.
+    Args: see :func:`precision_at_k`.
+    Returns:
+        The mean Recall@k.
+    """
+
+    hits, n_relevant = _hits(recommended, relevant, k)
+    users = n_relevant > 0
+    value = np.mean(hits[users].sum(axis=1) / n_relevant[users])
+    return _report('Recall@{0}'.format(hits.shape[1]), value, verbose)
+
+
+def map_at_k(recommended, relevant, k=None, verbose=True):
+    """Compute the MAP@k (Mean Average Precision) over the users having
+    relevant items.
+    .. math::
+        \\text{AP@k}(u) = \\frac{1}{\\min(k, |R_u|)} \\sum_{j=1}^{k}
+        \\text{Precision@j}(u) \\cdot rel_u(j).
+    Args: see :func:`precision_at_k`.
+    Returns:
+        The MAP@k.
+    """
+
+    hits, n_relevant = _hits(recommended, relevant, k)
+    users = n_relevant > 0
+    hits, n_relevant = hits[users], n_relevant[users]
+    ranks = np.arange(1, hits.shape[1] + 1)
+    precisions = np.cumsum(hits, axis=1) / ranks
+    average_precisions = ((precisions * hits).sum(axis=1)
+                          / np.minimum(n_relevant, hits.shape[1]))
+    value = np.mean(average_precisions)
+    return _report('MAP@{0}'.format(hits.shape[1]), value, verbose)
+
+
+def ndcg_at_k(recommended, relevant, k=None, verbose=True):
+    """Compute the mean NDCG@k (Normalized Discounted Cumulative Gain) with
+    binary relevance, over the users having relevant items.
+    Args: see :func:`precision_at_k`.
+    Returns:
+        The mean NDCG@k.
+    """
+
+    hits, n_relevant = _hits(recommended, relevant, k)
+    users = n_relevant > 0
+    hits, n_relevant = hits[users], n_relevant[users]
+    discounts = 1. / np.log2(np.arange(2, hits.shape[1] + 2))
+    dcg = hits.dot(discounts)
+    ideal_dcg = np.cumsum(discounts)[np.minimum(n_relevant, hits.shape[1]) - 1]
+    value = np.mean(dcg / ideal_dcg)
+    return _report('NDCG@{0}'.format(hits.shape[1]), value, verbose)
+
+
+def coverage(recommended, n_items, verbose=True):
+    """Compute the catalog coverage: the fraction of items recommended to at
+    least one user.
+    Args:
+        recommended(:obj:`np.ndarray`): Positions of the recommended items,
+            of shape ``(n_users, N)``, ``-1`` for empty slots.
+        n_items(int): Number of items that can be recommended.
+        verbose: If True, will print computed value. Default is ``True``.
+    Returns:
+        The coverage, between 0 and 1.
+    """
+
+    recommended = np.asarray(recommended)
+    value = len(np.unique(recommended[recommended >= 0])) / n_items
+    return _report('Coverage', value, verbose)
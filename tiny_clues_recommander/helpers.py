@@ -1,3 +1,6 @@
+import numpy as np
+import pandas as pd
+
 def get_movie_id(movies, title, year=None, title_col='title', year_col='year'):
     """get movie_id using a movie name
 
@@ -48,3 +51,152 @@ def get_movie_year(movies, index, year_col='year'):
         int: year of the movie
     """    
     return movies.iloc[index][year_col]
+
+class AmbiguousTitleError(KeyError):
+    """Raised when several movies match a title (and year)
+
+    Attributes:
+        candidates (List): list of tuple(id_movie, title, year) of the matching movies
+    """
+    def __init__(self, title, candidates):
+        super().__init__(title)
+        self.candidates = candidates
+
+    def __str__(self):
+        return f'Ambiguous title {self.args[0]!r}: found {self.candidates}'
+
+
+class MovieIndex:
+    """Lookup index between movie ids and their title and year, built once from a movies DataFrame
+    Lookups by id or by (title, year) are dict lookups, batched lookups are single array gathers.
+
+    Attributes:
+        ids (np.Array): movie ids, in movies DataFrame order
+        titles (np.Array): movie titles, aligned with ids
+        years (np.Array): movie years, aligned with ids
+    """
+    def __init__(self, movies, title_col='title', year_col='year'):
+        """build the index
+
+        Args:
+            movies (pd.DataFrame): movies DataFrame cols: title | year | *genres, indexed by movie id
+            title_col (str, optional): title column name. Defaults to 'title'.
+            year_col (str, optional): year column name. Defaults to 'year'.
+        """
+        self.ids = movies.index.values
+        self.titles = movies[title_col].values
+        self.years = movies[year_col].values
+        self._positions = pd.Index(self.ids)
+        self._by_title = None
+        self._by_title_year = None
+
+    def _build_title_dicts(self):
+        """title and (title, year) -> positions dicts, only built for the first lookup by title"""
+        self._by_title = {}
+        self._by_title_year = {}
+        for position, (title, year) in enumerate(zip(self.titles.tolist(), self.years.tolist())):
+            self._by_title.setdefault(title, []).append(position)
+            self._by_title_year.setdefault((title, year), []).append(position)
+
+    def get_id(self, title, year=None):
+        """get movie_id using a movie name
+
+        Args:
+            title (string): name of the movie
+            year (int, optional): year of the movie. Defaults to None.
+
+        Returns:
+            int: id of the movie
+
+        Raises:
+            KeyError: when no movie matches
+            AmbiguousTitleError: when several movies match
+        """
+        if self._by_title is None:
+            self._build_title_dicts()
+        positions = self._by_title.get(title, []) if year is None else self._by_title_year.get((title, year), [])
+        if len(positions) == 0:
+            raise KeyError(title if year is None else (title, year))
+        if len(positions) > 1:
+            raise AmbiguousTitleError(title, [(self.ids[p], self.titles[p], self.years[p]) for p in positions])
+        return self.ids[positions[0]]
+
+    def ambiguous_titles(self):
+        """titles shared by several movies
+
+        Returns:
+            dict: title -> list of tuple(id_movie, year)
+        """
+        if self._by_title is None:
+            self._build_title_dicts()
+        return {title: [(self.ids[p], self.years[p]) for p in positions]
+                for title, positions in self._by_title.items() if len(positions) > 1}
+
+    def positions(self, movie_ids):
+        """positions of movies in the index
+
+        Args:
+            movie_ids (array-like): ids of the movies
+
+        Returns:
+            np.Array: positions aligned with movie_ids
+
+        Raises:
+            KeyError: when a movie id is unknown
+        """
+        positions = self._positions.get_indexer(np.atleast_1d(movie_ids))
+        if (positions < 0).any():
+            raise KeyError(np.atleast_1d(movie_ids)[positions < 0][0])
+        return positions
+
+    def get_title(self, movie_id):
+        """get movie name using a movie id"""
+        return self.titles[self._positions.get_loc(movie_id)]
+
+    def get_year(self, movie_id):
+        """get movie year using a movie id"""
+        return self.years[self._positions.get_loc(movie_id)]
+
+    def get_titles(self, movie_ids):
+        """get movie names of an array of movie ids"""
+        return self.titles[self.positions(movie_ids)]
+
+    def get_years(self, movie_ids):
+        """get movie years of an array of movie ids"""
+        return self.years[self.positions(movie_ids)]
+
+
+def top_n(scores, n):
+    """get the positions of the n highest scores, by decreasing score
+    It only partially sorts the scores (argpartition) before ordering the n selected ones.
+
+    Args:
+        scores (np.Array): scores, the selection is made along the last axis
+        n (int): number of positions to select
+
+    Returns:
+        np.Array: positions of shape (..., min(n, number of scores))
+    """
+    n = min(n, scores.shape[-1])
+    if n <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    best = np.argpartition(-scores, n - 1, axis=-1)[..., :n]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(best, order, axis=-1)
+
+
+class ModelWrapper:
+    """Base of the wrappers of a fitted model, any attribute missing from the wrapper is the model's
+
+    Args:
+        model (BaseRecommander): fitted model
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name):
+        # only called for missing attributes: model is missing while unpickling or copying, and special
+        # methods looked up on the instance are not the model's
+        if name == 'model' or (name.startswith('__') and name.endswith('__')):
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -0,0 +1,171 @@
+"""Profiling of named stages of the models and of the trainset build.
+
+Switched off by default: a stage then costs one attribute check.
+
+    >>> from tiny_clues_recommander import instrumentation
+    >>> instrumentation.enable(memory=True)
+    >>> svd.fit(ratings)
+    >>> instrumentation.snapshot()
+    {'SVD.fit': {'calls': 1, 'total_seconds': ..., 'peak_mb': ...},
+     'SVD.fit/Dataset.build_trainset': {...},
+     'SVD.fit/decompose': {...}}
+    >>> instrumentation.to_json('profile.json')
+
+A stage is recorded under the path of the stages it runs in, joined by '/'.
+fit, predict and the other public methods of every BaseRecommander are stages
+named after the model class; models add finer stages with ``stage(name)``.
+"""
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+# returned by stage() when profiling is off, shared by all calls
+_NULL_STAGE = nullcontext()
+
+
+class Profiler:
+    """Accumulate the wall time, call count and peak memory of named stages
+
+    Attributes:
+        enabled (bool): whether stages are recorded
+        memory (bool): whether the peak memory of stages is traced, which slows them down
+    """
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self._started_tracing = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, memory=False):
+        """record stages from now on
+
+        Args:
+            memory (bool, optional): also trace the peak memory allocated within stages. Defaults to False.
+        """
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        """stop recording stages, the recorded stats are kept"""
+        self.enabled = False
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.memory = False
+
+    def reset(self):
+        """forget the recorded stats"""
+        with self._lock:
+            self._stats = {}
+
+    def stage(self, name):
+        """context manager recording a stage, a shared no-op one when profiling is off"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, path, seconds, peak_bytes):
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                stats = self._stats[path] = {'calls': 0, 'total_seconds': 0., 'max_seconds': 0.}
+            stats['calls'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if peak_bytes is not None:
+                stats['peak_mb'] = max(stats.get('peak_mb', 0.), peak_bytes / 2 ** 20)
+
+    def snapshot(self):
+        """recorded stats of every stage
+
+        Returns:
+            dict: stage path -> calls | total_seconds | mean_seconds | max_seconds | peak_mb (memory tracing only)
+        """
+        with self._lock:
+            return {path: dict(stats, mean_seconds=stats['total_seconds'] / stats['calls'])
+                    for path, stats in self._stats.items()}
+
+    def to_json(self, path=None):
+        """snapshot as JSON, with the time it was taken
+
+        Args:
+            path (str, optional): file written. Defaults to None: only returned.
+
+        Returns:
+            str: the JSON document
+        """
+        document = json.dumps({'time': time.time(), 'stages': self.snapshot()}, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(document)
+        return document
+
+
+class _Stage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.path = '/'.join([parent.name for parent in stack] + [self.name])
+        self.traced = self.profiler.memory and tracemalloc.is_tracing()
+        if self.traced:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # the peak is reset for this stage, the parent keeps what it reached so far
+                stack[-1].peak = max(stack[-1].peak, peak)
+            self.start_memory = self.peak = current
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        peak_bytes = None
+        if self.traced and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = self.peak - self.start_memory
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        self.profiler._record(self.path, seconds, peak_bytes)
+
+
+def profiled(method):
+    """record a method as a stage named after the class of the instance and the method"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not PROFILER.enabled:
+            return method(self, *args, **kwargs)
+        with _Stage(PROFILER, f'{type(self).__name__}.{method.__name__}'):
+            return method(self, *args, **kwargs)
+    wrapper.profiled = True
+    return wrapper
+
+
+PROFILER = Profiler()
+enable = PROFILER.enable
+disable = PROFILER.disable
+reset = PROFILER.reset
+stage = PROFILER.stage
+snapshot = PROFILER.snapshot
+to_json = PROFILER.to_json
@@ -0,0 +1,190 @@
+"""Cross validation of recommenders.
+
+The ratings and the test masks of every split are put once in shared memory,
+so worker processes rebuild their folds from it instead of receiving a pickled
+DataFrame for each fold.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+import pandas as pd
+
+from . import evaluation
+
+
+class KFold:
+    """K-folds splitter: every rating is in the test set of exactly one fold
+
+    Args:
+        n_splits (int, optional): number of folds. Defaults to 5.
+        shuffle (bool, optional): shuffle the ratings before splitting them. Defaults to True.
+        random_state (int, optional): seed of the shuffle. Defaults to None.
+    """
+    def __init__(self, n_splits=5, shuffle=True, random_state=None):
+        if n_splits < 2:
+            raise ValueError(f'n_splits must be at least 2, got {n_splits}.')
+        self.n_splits = n_splits
+        self.shuffle = shuffle
+        self.random_state = random_state
+
+    def test_masks(self, n_ratings):
+        """test set membership of every rating
+
+        Args:
+            n_ratings (int): number of ratings
+
+        Returns:
+            np.Array: boolean masks of shape (n_splits, n_ratings)
+        """
+        folds = np.arange(n_ratings) % self.n_splits
+        if self.shuffle:
+            np.random.RandomState(self.random_state).shuffle(folds)
+        return folds == np.arange(self.n_splits)[:, None]
+
+
+class RepeatedHoldout:
+    """Repeated random train/test splits
+
+    Args:
+        n_repeats (int, optional): number of splits. Defaults to 5.
+        test_size (float, optional): fraction of the ratings in each test set. Defaults to 0.2.
+        random_state (int, optional): seed of the splits. Defaults to None.
+    """
+    def __init__(self, n_repeats=5, test_size=0.2, random_state=None):
+        if not 0 < test_size < 1:
+            raise ValueError(f'test_size must be in ]0, 1[, got {test_size}.')
+        self.n_splits = n_repeats
+        self.test_size = test_size
+        self.random_state = random_state
+
+    def test_masks(self, n_ratings):
+        """test set membership of every rating
+
+        Args:
+            n_ratings (int): number of ratings
+
+        Returns:
+            np.Array: boolean masks of shape (n_repeats, n_ratings)
+        """
+        rng = np.random.RandomState(self.random_state)
+        n_test = int(round(self.test_size * n_ratings))
+        masks = np.zeros((self.n_splits, n_ratings), dtype=bool)
+        for split in range(self.n_splits):
+            masks[split, rng.choice(n_ratings, n_test, replace=False)] = True
+        return masks
+
+
+def _to_shared(array, typecode):
+    shared = RawArray(typecode, array.size)
+    shared_array = np.frombuffer(shared, dtype=array.dtype).reshape(array.shape)
+    shared_array[...] = array
+    return shared
+
+
+# state of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(shared, shapes, raw_users, raw_items, model_factory, fit_params, predict_params, N, min_rating):
+    _worker.update(
+        user_codes=np.frombuffer(shared['user_codes'], dtype=np.int32),
+        item_codes=np.frombuffer(shared['item_codes'], dtype=np.int32),
+        ratings=np.frombuffer(shared['ratings'], dtype=np.float32),
+        test_masks=np.frombuffer(shared['test_masks'], dtype=bool).reshape(shapes['test_masks']),
+        raw_users=raw_users,
+        raw_items=raw_items,
+        model_factory=model_factory,
+        fit_params=fit_params,
+        predict_params=predict_params,
+        N=N,
+        min_rating=min_rating,
+    )
+
+
+def _fold_ratings(mask):
+    return pd.DataFrame({
+        'user_id': _worker['raw_users'][_worker['user_codes'][mask]],
+        'movie_id': _worker['raw_items'][_worker['item_codes'][mask]],
+        'rating': _worker['ratings'][mask],
+    })
+
+
+def _evaluate_fold(split):
+    """fit a new model on the train ratings of a split and evaluate it on its test ratings
+
+    Returns:
+        dict: metrics and timings of the fold
+    """
+    test_mask = _worker['test_masks'][split]
+    train, test = _fold_ratings(~test_mask), _fold_ratings(test_mask)
+    result = {'fold': split}
+
+    model = _worker['model_factory']()
+    start = time.perf_counter()
+    model.fit(ratings=train, **_worker['fit_params'])
+    result['fit_time'] = time.perf_counter() - start
+
+    if hasattr(model, 'test_result'):
+        start = time.perf_counter()
+        predictions = model.test_result(test)
+        result['test_time'] = time.perf_counter() - start
+        for metric in ('rmse', 'mae', 'mse'):
+            result[metric] = getattr(evaluation, metric)(predictions, verbose=False)
+
+    user_ids = pd.unique(test['user_id'][test['user_id'].isin(train['user_id'])])
+    start = time.perf_counter()
+    recommended, _ = model.predict_batch(user_ids, N=_worker['N'], **_worker['predict_params'])
+    result['predict_time'] = time.perf_counter() - start
+
+    item_ids = _worker['raw_items']
+    relevant = evaluation.holdout_matrix(test, user_ids, item_ids, min_rating=_worker['min_rating'])
+    positions = evaluation.item_positions(recommended, item_ids)
+    N = _worker['N']
+    result[f'precision@{N}'] = evaluation.precision_at_k(positions, relevant, verbose=False)
+    result[f'recall@{N}'] = evaluation.recall_at_k(positions, relevant, verbose=False)
+    result[f'map@{N}'] = evaluation.map_at_k(positions, relevant, verbose=False)
+    result[f'ndcg@{N}'] = evaluation.ndcg_at_k(positions, relevant, verbose=False)
+    result['coverage'] = evaluation.coverage(positions, len(item_ids), verbose=False)
+    return result
+
+
+def cross_validate(model_factory, ratings, cv=None, fit_params=None, predict_params=None, N=10,
+                   min_rating=None, n_jobs=None):
+    """fit and evaluate a recommender on every split of a cross validation, in a process pool
+
+    Args:
+        model_factory (callable): picklable callable returning a new BaseRecommander, e.g. the model class
+        ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+        cv (KFold or RepeatedHoldout, optional): splitter. Defaults to KFold(5).
+        fit_params (dict, optional): extra arguments of fit, ratings are passed as `ratings`. Defaults to None.
+        predict_params (dict, optional): extra arguments of predict_batch. Defaults to None.
+        N (int, optional): number of movies suggested to each test user for the ranking metrics. Defaults to 10.
+        min_rating (float, optional): minimal test rating of a relevant movie. Defaults to None: all test movies.
+        n_jobs (int, optional): number of worker processes, 1 runs in the current process. Defaults to None: one per CPU.
+
+    Returns:
+        pd.DataFrame: one row per fold with fit/test/predict timings (seconds),
+            rmse | mae | mse (models having test_result) and ranking metrics at N
+    """
+    cv = KFold() if cv is None else cv
+    user_codes, raw_users = pd.factorize(ratings['user_id'])
+    item_codes, raw_items = pd.factorize(ratings['movie_id'])
+    test_masks = cv.test_masks(len(ratings))
+    shared = {
+        'user_codes': _to_shared(user_codes.astype(np.int32), 'i'),
+        'item_codes': _to_shared(item_codes.astype(np.int32), 'i'),
+        'ratings': _to_shared(ratings['rating'].to_numpy(dtype=np.float32), 'f'),
+        'test_masks': _to_shared(test_masks, 'b'),
+    }
+    initargs = (shared, {'test_masks': test_masks.shape}, np.asarray(raw_users), np.asarray(raw_items),
+                model_factory, fit_params or {}, predict_params or {}, N, min_rating)
+
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        results = [_evaluate_fold(split) for split in range(cv.n_splits)]
+    else:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_evaluate_fold, range(cv.n_splits)))
+    return pd.DataFrame(results).set_index('fold')
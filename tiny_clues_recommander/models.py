@@ -1,34 +1,193 @@
 import pandas as pd
 import numpy as np
 
-from .helpers import  get_movie_id, get_movie_name, get_movie_year
+from . import evaluation, instrumentation, persistence
+from .data import Dataset, Trainset
+from .decomposition import truncated_svd
+from .helpers import  MovieIndex, top_n
 
 class BaseRecommander:
     """Base Model
     Inherit from this class to ensure reusability and compatibility of new model    
+
+    Attributes:
+        version (int): incremented each time the model changes for all users (fit),
+            so that results computed with a former version can be told apart
     """
+    version = 0
+    # recorded as instrumentation stages in every subclass defining them
+    PROFILED_METHODS = ('fit', 'update', 'predict', 'predict_batch', 'predict_ratings', 'predict_sim', 'predict_df',
+                        'test_result')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls.PROFILED_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, 'profiled', False):
+                setattr(cls, name, instrumentation.profiled(method))
+
     def fit(self, *args, **kwargs):
         raise NotImplementedError
     
     def predict(self, *args, **kwargs):
         raise NotImplementedError
 
+    def _get_state(self):
+        """state of the fitted model
+
+        Returns:
+            Tuple: dict of arrays, dict of json serializable params, dict of picklable objects
+        """
+        raise NotImplementedError
+
+    def _set_state(self, arrays, params, objects):
+        """restore the state returned by _get_state"""
+        raise NotImplementedError
+
+    def save(self, path):
+        """save the fitted model in a directory, its numeric state as raw .npy files
+
+        Args:
+            path (str): directory, created if needed
+        """
+        arrays, params, objects = self._get_state()
+        persistence.save_state(path, type(self).__name__, arrays, params, objects)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """load a model saved with save
+        BaseRecommander.load loads any model, a model class only loads its own models.
+
+        Args:
+            path (str): directory of the saved model
+            mmap (bool, optional): memory-map the numeric arrays (read only) instead of reading them,
+                so that processes loading the same model share its memory. Defaults to True.
+
+        Returns:
+            BaseRecommander: the fitted model
+        """
+        model_name, arrays, params, objects = persistence.load_state(path, mmap=mmap)
+        models = {model.__name__: model for model in _subclasses(BaseRecommander)}
+        if model_name not in models or not issubclass(models[model_name], cls):
+            raise ValueError(f'{path} holds a {model_name} model, not a {cls.__name__}.')
+        model = models[model_name]()
+        model._set_state(arrays, params, objects)
+        return model
+
+    def _score_batch(self, user_ids, **kwargs):
+        """score every candidate movie for a chunk of users
+
+        Args:
+            user_ids (np.Array): ids of the users
+            **kwargs: model specific scoring options
+
+        Returns:
+            np.Array: scores of shape (len(user_ids), len(self._batch_item_ids())), -inf for movies not to suggest
+        """
+        raise NotImplementedError
+
+    def _batch_item_ids(self):
+        """ids of the movies scored by _score_batch, in column order"""
+        raise NotImplementedError
+
+    @instrumentation.profiled
+    def predict_batch(self, user_ids, N=5, chunk_size=1024, **kwargs):
+        """predict the ids of top N movies for many users at once
+        Users are scored by chunks with matrix products, so memory is bounded by chunk_size x number of movies.
+
+        Args:
+            user_ids (array-like): ids of the users
+            N (int, optional): number of movies to suggest. Defaults to 5.
+            chunk_size (int, optional): number of users scored at once. Defaults to 1024.
+            **kwargs: model specific scoring options (e.g. M for ContentFilter)
+
+        Returns:
+            Tuple: np.Array of movie ids (n_users, N) and np.Array of their scores (n_users, N).
+                A score of -inf means there was no movie left to suggest in that slot.
+        """
+        user_ids = np.asarray(user_ids)
+        item_ids = np.asarray(self._batch_item_ids())
+        N = min(N, len(item_ids))
+        recommended = np.empty((len(user_ids), N), dtype=item_ids.dtype)
+        scores = np.empty((len(user_ids), N), dtype=np.float64)
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            with instrumentation.stage('score'):
+                chunk_scores = self._score_batch(user_ids[chunk], **kwargs)
+            with instrumentation.stage('top_n'):
+                best = top_n(chunk_scores, N)
+            recommended[chunk] = item_ids[best]
+            scores[chunk] = np.take_along_axis(chunk_scores, best, axis=1)
+        return recommended, scores
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def _trainset_state(trainset):
+    """arrays and params of a trainset, prefixed to be saved along a model state"""
+    arrays, params = trainset.get_state()
+    return {'trainset.' + name: array for name, array in arrays.items()}, {'trainset': params}
+
+
+def _trainset_from_state(arrays, params):
+    prefix = 'trainset.'
+    return Trainset.from_state({name[len(prefix):]: array for name, array in arrays.items()
+                                if name.startswith(prefix)}, params['trainset'])
+
+
 class ContentFilter(BaseRecommander):
     
-    def fit(self, movie_df, ratings, genre_cols=None):
+    def fit(self, movie_df, ratings, genre_cols=None, n_neighbors=None, block_size=1024):
         """fit the content filter model
 
         Args:
             movie_df (pd.DataFrame): Dataframe of movies contains cols: movie_id | title | year | *genres
             ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
             genre_cols (List): list of movie genres. Defaults to None
+            n_neighbors (int, optional): if set, only the n_neighbors most similar movies of each movie are stored
+                instead of the full movies x movies similarity matrix. Defaults to None.
+            block_size (int, optional): number of movies whose neighbors are computed at once. Defaults to 1024.
 
         """        
         if genre_cols is None: # if genre_cols are not specified calculate them from movies dataframe
             genre_cols = movie_df.columns.difference(['movie_id', 'title', 'year']).values
-        self.similarity = movie_df[genre_cols].values.dot(movie_df[genre_cols].values.T)
+        self.genre_cols = list(genre_cols)
+        features = movie_df[genre_cols].values
+        with instrumentation.stage('similarity'):
+            if n_neighbors is None:
+                self.similarity = features.dot(features.T)
+                self.neighbor_ids, self.neighbor_scores = None, None
+            else:
+                self.similarity = None
+                self.neighbor_ids, self.neighbor_scores = _nearest_neighbors(features, n_neighbors, block_size)
         self.ratings = ratings
         self.movies = movie_df
+        self.movie_index = MovieIndex(movie_df)
+        self.trainset = Dataset(ratings[['user_id', 'movie_id', 'rating']]).build_trainset()
+        # position in movie_df of every rated movie, indexed by movie inner id
+        self._movie_positions = movie_df.index.get_indexer(self.trainset.raw_iids)
+        self.version += 1
+
+    def _neighbors(self, positions, top=10):
+        """most similar movies of the movies at the given positions, the movie itself excluded
+
+        Args:
+            positions (np.Array): positions of the reference movies
+            top (int, optional): number of similar movies, at most n_neighbors in index mode,
+                None for all of them. Defaults to 10.
+
+        Returns:
+            Tuple: positions (len(positions), top) and similarities (len(positions), top) of the neighbors
+        """
+        if self.similarity is None:
+            return self.neighbor_ids[positions, :top], self.neighbor_scores[positions, :top]
+        similarities = self.similarity[positions].astype(np.float64)
+        similarities[np.arange(len(positions)), positions] = -np.inf
+        best = top_n(similarities, len(self.similarity) - 1 if top is None else top)
+        return best, np.take_along_axis(similarities, best, axis=1)
         
     def _get_most_similar(self, movie_name, year=None, top=10):
         """ find the most similar movies to ref movie
@@ -41,28 +200,30 @@ class ContentFilter(BaseRecommander):
         Returns:
             List: list of tuple(id_movie, name, similarity)
         """        
-        index_movie = get_movie_id(self.movies, movie_name, year)
-        best = self.similarity[index_movie].argsort()[::-1]
-        return [(ind, get_movie_name(self.movies, ind), self.similarity[index_movie, ind]) for ind in best[:top] if ind != index_movie]
+        position = self.movie_index.positions(self.movie_index.get_id(movie_name, year))
+        best, similarities = self._neighbors(position, top)
+        return list(zip(self.movie_index.ids[best[0]], self.movie_index.titles[best[0]], similarities[0]))
     
-    def predict_df(self, user_id, N=5, M=10):
+    def predict_df(self, user_id, N=5, M=10, aggregate='max'):
         """suggest top N movies in a pd.DataFrame Format cols: movie_id | title | similarity
 
         Args:
             user_id ([int]): id for user
             N (int, optional): number of movies to suggest. Defaults to 5.
             M (int, optional): number of rated movies used to find similar unwatched movies. Defaults to 10.
+            aggregate (str, optional): 'max' scores a movie by its highest similarity with the rated movies,
+                'sum' by the sum of its similarities weighted by the ratings. Defaults to 'max'.
 
         Returns:
             pd.DataFrame: columns : movie_id | title | similarity
         """        
-    
-        top_movies = self.ratings[self.ratings['user_id'] == user_id].sort_values(by='rating', ascending=False).head(M)['movie_id']
-        index=['movie_id', 'title', 'similarity']
-        most_similars = []
-        for top_movie in top_movies:
-            most_similars += self._get_most_similar( get_movie_name(self.movies, top_movie), get_movie_year(self.movies, top_movie))
-        return pd.DataFrame(most_similars, columns=index).drop_duplicates().sort_values(by='similarity', ascending=False).head(5)
+        scores = self._score_users(np.array([self.trainset.to_inner_uid(user_id)]), M=M, aggregate=aggregate)[0]
+        best = top_n(scores, min(N, np.isfinite(scores).sum()))
+        return pd.DataFrame({
+            'movie_id': self.movie_index.ids[best],
+            'title': self.movie_index.titles[best],
+            'similarity': scores[best],
+        })
     
     def predict(self, user_id, N=5, M=10):
         """predict the ids of top N movies
@@ -92,44 +253,137 @@ class ContentFilter(BaseRecommander):
         prediction = self.predict_df(user_id, N=N, M=M)
         return prediction[['movie_id', 'similarity']].set_index('movie_id')
 
-
-class SVD(BaseRecommander):
-    
-    def fit(self, ratings, k=20):
-        """fit the collaborative filter model
+    def _score_users(self, inner_uids, M=10, top=None, aggregate='max'):
+        """score the movies similar to the M best rated movies of each user, in movie_df order
 
         Args:
-            ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
-            k (int, optional): number of component to reconstruct the matrix. Defaults to 20.
-        """ 
-        self.train = ratings
-        self.df_ratings = ratings.pivot(
-            index='user_id',
-            columns='movie_id',
-            values='rating').fillna(0)
+            inner_uids (np.Array): inner ids of the users
+            M (int, optional): number of best rated movies of each user used as seeds. Defaults to 10.
+            top (int, optional): number of similar movies gathered for each seed. Defaults to None: every movie
+                with the full similarity matrix, the n_neighbors stored ones in index mode.
+            aggregate (str, optional): 'max' or 'sum' of the rating weighted similarities. Defaults to 'max'.
 
-        U, S, Vt = np.linalg.svd(self.df_ratings.values, full_matrices=False)
-        
-        predicted_R = (U[:,0] * S[0]).reshape([len(U),1]).dot(Vt[0,:].reshape([1, len(Vt)])) 
-        for i in np.arange(1,k):
-            predicted_R = predicted_R + (U[:,i] * S[i]).reshape([len(U),1]).dot(Vt[i,:].reshape([1, len(Vt)])) 
+        Returns:
+            np.Array: scores of shape (len(inner_uids), number of movies),
+                -inf for the movies that are not candidates or already rated
+        """
+        if aggregate not in ('max', 'sum'):
+            raise ValueError(f"Unknown aggregate {aggregate!r}, expected 'max' or 'sum'.")
 
-        self.predicted_R_df = pd.DataFrame(predicted_R, index = self.df_ratings.index, columns = self.df_ratings.columns)
+        rated = self.trainset.rating_matrix(inner_uids).tocoo()
+        rows, movies, user_ratings = rated.row, self._movie_positions[rated.col], rated.data
+        # best rated first within each user, then keep the M first ones
+        order = np.lexsort((-user_ratings, rows))
+        rows, movies, user_ratings = rows[order], movies[order], user_ratings[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        seeds = (rank < M) & (movies >= 0)
+
+        scores = np.full((len(inner_uids), len(self.movies)), -np.inf)
+        if top is None and self.similarity is not None:
+            # full similarity rows, gathered seed rank by seed rank: a user has at most one seed of each rank
+            if aggregate == 'sum':
+                scores[np.unique(rows[seeds])] = 0
+            for seed_rank in np.unique(rank[seeds]):
+                at = seeds & (rank == seed_rank)
+                similarities = self.similarity[movies[at]].astype(np.float64)
+                if aggregate == 'max':
+                    scores[rows[at]] = np.maximum(scores[rows[at]], similarities)
+                else:
+                    scores[rows[at]] += similarities * user_ratings[at][:, None]
+            scores[rows[movies >= 0], movies[movies >= 0]] = -np.inf
+            return scores
+
+        neighbors, similarities = self._neighbors(movies[seeds], top)
+        candidates = (rows[seeds][:, None], neighbors)
+        if aggregate == 'max':
+            np.maximum.at(scores, candidates, similarities)
+        else:
+            scores[candidates] = 0
+            np.add.at(scores, candidates, similarities * user_ratings[seeds][:, None])
+        scores[rows[movies >= 0], movies[movies >= 0]] = -np.inf
+        return scores
+
+    def _batch_item_ids(self):
+        return self.movie_index.ids
+
+    def _score_batch(self, user_ids, **kwargs):
+        return self._score_users(self.trainset.to_inner_uids(user_ids), **kwargs)
+
+    def _get_state(self):
+        arrays, params = _trainset_state(self.trainset)
+        arrays['movie_positions'] = self._movie_positions
+        params['genre_cols'] = self.genre_cols
+        if self.similarity is None:
+            arrays.update(neighbor_ids=self.neighbor_ids, neighbor_scores=self.neighbor_scores)
+        else:
+            arrays['similarity'] = self.similarity
+        return arrays, params, {'movies': self.movies}
+
+    def _set_state(self, arrays, params, objects):
+        self.trainset = _trainset_from_state(arrays, params)
+        self._movie_positions = arrays['movie_positions']
+        self.similarity = arrays.get('similarity')
+        self.neighbor_ids, self.neighbor_scores = arrays.get('neighbor_ids'), arrays.get('neighbor_scores')
+        self.movies = objects['movies']
+        self.genre_cols = params['genre_cols']
+        self.movie_index = MovieIndex(self.movies)
+        self.ratings = None
+
+
+def _nearest_neighbors(features, n_neighbors, block_size):
+    """most similar rows of features (dot product similarity), computed by blocks of rows
+
+    Returns:
+        Tuple: positions (n, n_neighbors) and similarities (n, n_neighbors) of the neighbors
+            of each row, sorted by decreasing similarity, the row itself excluded
+    """
+    n_neighbors = min(n_neighbors, len(features) - 1)
+    neighbor_ids = np.empty((len(features), n_neighbors), dtype=np.int32)
+    neighbor_scores = np.empty((len(features), n_neighbors), dtype=np.float32)
+    for start in range(0, len(features), block_size):
+        block = features[start:start + block_size].dot(features.T).astype(np.float64)
+        block[np.arange(len(block)), start + np.arange(len(block))] = -np.inf
+        best = top_n(block, n_neighbors)
+        neighbor_ids[start:start + len(block)] = best
+        neighbor_scores[start:start + len(block)] = np.take_along_axis(block, best, axis=1)
+    return neighbor_ids, neighbor_scores
+
+
+class LatentFactorRecommander(BaseRecommander):
+    """Base of the models scoring every movie for a user from learnt factors, or biases only for BaselineOnly
+    Subclasses provide _predict_users and _predict_pairs, the predicted ratings of users or (user, movie) pairs
+    given by inner ids, rated movies are never suggested.
+    """
+
+    def _predict_users(self, inner_uids):
+        """predicted ratings of every movie for users, indexed by movie inner id
+
+        Returns:
+            np.Array: of shape (len(inner_uids), number of movies)
+        """
+        raise NotImplementedError
+
+    def _predict_pairs(self, inner_uids, inner_iids):
+        """predicted ratings of (user, movie) pairs given by inner ids"""
+        raise NotImplementedError
 
     def predict_ratings(self, user_id, N=10):
         """predict the ids of top N movies with their predicted ratings
 
         Args:
             user_id ([int]): id for user
-            N (int, optional): number of movies to suggest. Defaults to 5.
+            N (int, optional): number of movies to suggest. Defaults to 10.
 
         Returns:
             pd.Series: of movie ids as index and predicted ratings as values
-        """   
-        user_movies = self.df_ratings.loc[user_id]
-        predicted_rated_movies = self.predicted_R_df.loc[user_id]
-        recommended_movies = predicted_rated_movies[user_movies==0].sort_values(ascending=False)[0:N]
-        return recommended_movies
+        """
+        inner_uid = self.trainset.to_inner_uid(user_id)
+        predicted = self._predict_users(np.array([inner_uid]))[0]
+        rated_iids, _ = self.trainset.user_ratings(inner_uid)
+        predicted[rated_iids] = -np.inf
+        best = top_n(predicted, min(N, len(predicted) - len(rated_iids)))
+        return pd.Series(predicted[best], index=self.trainset.raw_iids[best])
+
     def predict(self, user_id, N=5):
         """predict the ids of top N movies
 
@@ -139,48 +393,200 @@ class SVD(BaseRecommander):
 
         Returns:
             np.Array: of movie ids
-        """      
+        """
         return np.array(self.predict_ratings(user_id, N).index)
-    def test_result(self, test):
+
+    def _batch_item_ids(self):
+        return self.trainset.raw_iids.values
+
+    def _score_batch(self, user_ids):
+        inner_uids = self.trainset.to_inner_uids(user_ids)
+        scores = self._predict_users(inner_uids)
+        rated = self.trainset.rating_matrix(inner_uids).tocoo()
+        scores[rated.row, rated.col] = -np.inf
+        return scores
+
+    def test_result(self, test, unknown='drop'):
         """create test result to be used for evaluation
+        All (user, movie) pairs are mapped to inner ids and predicted at once.
 
         Args:
             test (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+            unknown (str, optional): policy for pairs whose user or movie is not in the train set:
+                'drop' skips them, 'global_mean' predicts the mean train rating,
+                'baseline' predicts the mean train rating plus the known user and movie deviations. Defaults to 'drop'.
 
         Returns:
-            List: list of tuple (true, pred)
-        """        
+            np.Array: array of shape (n, 2) with columns true | pred
+        """
+        return _test_result(self, test, unknown)
+
+
+class SVD(LatentFactorRecommander):
+    
+    def fit(self, ratings, k=20, solver='dense', random_state=None, **solver_kwargs):
+        """fit the collaborative filter model
+        Only the user factors (U.S) and the item factors (Vt) are kept, scores are computed on demand.
+
+        Args:
+            ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+            k (int, optional): number of component to reconstruct the matrix. Defaults to 20.
+            solver (str, optional): 'dense' decomposes the full users x movies matrix,
+                'randomized' | 'lanczos' compute only the top k factors from the sparse ratings. Defaults to 'dense'.
+            random_state (int, optional): seed of the sparse solvers. Defaults to None.
+            **solver_kwargs: passed to the sparse solver (see decomposition.truncated_svd)
+        """ 
+        self.train = ratings
+        self.trainset = Dataset(ratings[['user_id', 'movie_id', 'rating']]).build_trainset()
+        rating_matrix = self.trainset.rating_matrix()
+
+        with instrumentation.stage('decompose'):
+            if solver == 'dense':
+                U, S, Vt = np.linalg.svd(rating_matrix.astype(np.float64).toarray(), full_matrices=False)
+                U, S, Vt = U[:, :k], S[:k], Vt[:k]
+            else:
+                U, S, Vt = truncated_svd(rating_matrix, k, solver=solver, random_state=random_state,
+                                         **solver_kwargs)
+
+        self.singular_values = S
+        self.user_factors = U * S
+        self.item_factors = Vt
+        self.version += 1
+
+    def _predict_users(self, inner_uids):
+        """predicted ratings of every movie for users, indexed by movie inner id"""
+        return self.user_factors[inner_uids].dot(self.item_factors)
+
+    def update(self, new_ratings, fold_in_items=False):
+        """add new ratings without refitting: the users who rated are projected on the current movie factors
+        New or changed users get the least squares user factors p minimizing ||r_u - p.Vt|| over all movies,
+        missing ratings being zeros as in fit. Movies absent from the fit score 0 unless they are folded in.
+
+        Args:
+            new_ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+            fold_in_items (bool, optional): also project new movies on the current user factors. Defaults to False.
+        """
+        n_users, n_items = self.user_factors.shape[0], self.item_factors.shape[1]
+        inner_uids, _ = self.trainset.add_ratings(new_ratings['user_id'], new_ratings['movie_id'], new_ratings['rating'])
+
+        item_factors = np.zeros((self.item_factors.shape[0], self.trainset.n_items))
+        item_factors[:, :n_items] = self.item_factors
+        if fold_in_items and self.trainset.n_items > n_items:
+            # Vt = S^-1 U^T R with U = user factors . S^-1, on the users known at fit time
+            new_items = self.trainset.ir.to_csr(self.trainset.n_users, np.arange(n_items, self.trainset.n_items))
+            item_factors[:, n_items:] = new_items[:, :n_users].dot(self.user_factors).T / self.singular_values[:, None] ** 2
+            # new movies can be suggested to every user
+            self.version += 1
+
+        user_factors = np.zeros((self.trainset.n_users, self.user_factors.shape[1]))
+        user_factors[:n_users] = self.user_factors
+        users = np.unique(inner_uids)
+        gram = item_factors.dot(item_factors.T)
+        user_factors[users] = np.linalg.solve(gram, self.trainset.rating_matrix(users).dot(item_factors.T).T).T
+
+        self.user_factors, self.item_factors = user_factors, item_factors
+
+    def _get_state(self):
+        arrays, params = _trainset_state(self.trainset)
+        arrays.update(user_factors=self.user_factors, item_factors=self.item_factors,
+                      singular_values=self.singular_values)
+        return arrays, params, {}
+
+    def _set_state(self, arrays, params, objects):
+        self.trainset = _trainset_from_state(arrays, params)
+        self.user_factors = arrays['user_factors']
+        self.item_factors = arrays['item_factors']
+        self.singular_values = arrays['singular_values']
+        self.train = None
+
+    def _predict_pairs(self, inner_uids, inner_iids):
+        """predicted ratings of (user, movie) pairs given by inner ids"""
+        return np.einsum('ij,ji->i', self.user_factors[inner_uids], self.item_factors[:, inner_iids])
+
+
+def _test_result(model, test, unknown):
+    """test_result of a model predicting (user, movie) pairs of inner ids with _predict_pairs"""
+    if unknown not in ('drop', 'global_mean', 'baseline'):
+        raise ValueError(f"Unknown policy {unknown!r}, expected 'drop', 'global_mean' or 'baseline'.")
 
-        test_users = set(test.user_id.unique())
-        train_users = set(self.train.user_id.unique())
-        test_users = train_users.intersection(test_users)
+    inner_uids = model.trainset.raw_uids.get_indexer(test['user_id'])
+    inner_iids = model.trainset.raw_iids.get_indexer(test['movie_id'])
+    true_ratings = test['rating'].to_numpy(dtype=np.float64)
+    known = (inner_uids >= 0) & (inner_iids >= 0)
 
-        test_result = []
-        for _, row in test[test.user_id.isin(test_users)].iterrows():
-            user_id, movie_id, true_rating = row
-            try:
-                pred_rating = self.predicted_R_df.loc[user_id, movie_id]
-            except:
-                pass
-            test_result.append((true_rating, pred_rating))
-        return test_result
+    pred_ratings = np.empty(len(test))
+    pred_ratings[known] = model._predict_pairs(inner_uids[known], inner_iids[known])
+    if unknown == 'drop':
+        true_ratings, pred_ratings = true_ratings[known], pred_ratings[known]
+    elif unknown == 'global_mean':
+        pred_ratings[~known] = model.trainset.global_mean
+    else:
+        trainset = model.trainset
+        user_deviations = trainset.user_means - trainset.global_mean
+        item_deviations = trainset.item_means - trainset.global_mean
+        pred_ratings[~known] = (trainset.global_mean
+                                + np.where(inner_uids >= 0, user_deviations[inner_uids], 0)[~known]
+                                + np.where(inner_iids >= 0, item_deviations[inner_iids], 0)[~known])
+    return np.column_stack([true_ratings, pred_ratings])
 
 
 class CollaborativeFilter(BaseRecommander):
     
-    def fit(self, ratings):
+    def fit(self, ratings, n_neighbors=None):
         """fit the collaborative filter model
+        The rating matrix stays sparse: only the mean and the norm of the centered ratings of each user are stored,
+        so that pearson correlations reduce to sparse matrix products.
 
         Args:
             ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+            n_neighbors (int, optional): number of most similar users used to score movies. Defaults to None: all users.
         """ 
+        self.n_neighbors = n_neighbors
+        self.trainset = Dataset(ratings[['user_id', 'movie_id', 'rating']]).build_trainset()
+        self._rating_matrix = self.trainset.rating_matrix()
+
+        uids, _, user_ratings = self.trainset.all_ratings_arrays()
+        user_ratings = user_ratings.astype(np.float64)
+        n_items = self.trainset.n_items
+        self._user_means = np.bincount(uids, user_ratings, self.trainset.n_users) / n_items
+        squares = np.bincount(uids, user_ratings ** 2, self.trainset.n_users)
+        self._user_norms = np.sqrt(np.maximum(squares - n_items * self._user_means ** 2, 0))
+        self.version += 1
+
+    def _similarities(self, inner_uids):
+        """pearson correlation of the given users with all users, over all movies
+
+        Returns:
+            np.Array: correlations of shape (len(inner_uids), number of users)
+        """
+        users = self._rating_matrix[inner_uids].toarray().astype(np.float64)
+        products = self._rating_matrix.dot(users.T).T
+        covariances = products - self.trainset.n_items * np.outer(self._user_means[inner_uids], self._user_means)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            similarities = covariances / np.outer(self._user_norms[inner_uids], self._user_norms)
+        return np.nan_to_num(similarities, posinf=0, neginf=0)
+
+    def _predict_users(self, inner_uids):
+        """similarity weighted ratings of every movie, -inf for the movies already rated
+
+        Returns:
+            np.Array: scores of shape (len(inner_uids), number of movies)
+        """
+        with instrumentation.stage('similarities'):
+            similar_users = self._similarities(inner_uids)
+        if self.n_neighbors is not None:
+            rows = np.arange(len(inner_uids))
+            similar_users[rows, inner_uids] = -np.inf
+            neighbors = top_n(similar_users, min(self.n_neighbors, self.trainset.n_users - 1))
+            weights = np.zeros_like(similar_users)
+            np.put_along_axis(weights, neighbors, np.take_along_axis(similar_users, neighbors, axis=1), axis=1)
+            similar_users = weights
+
+        scores = self._rating_matrix.T.dot(similar_users.T).T / similar_users.sum(axis=1, keepdims=True)
+        rated = self._rating_matrix[inner_uids].tocoo()
+        scores[rated.row, rated.col] = -np.inf
+        return scores
 
-        self.df_movie_features = ratings.pivot(
-            index='user_id',
-            columns='movie_id',
-            values='rating'
-        ).fillna(0)
-        
     def predict_sim(self, user_id, N=5):
         """predict the ids of top N movies with their similarities
 
@@ -191,11 +597,11 @@ class CollaborativeFilter(BaseRecommander):
         Returns:
             pd.Series: of movie ids as index and similarity as values
         """   
-        user_ratings = self.df_movie_features.loc[user_id]
-        similair_users = self.df_movie_features.T.corrwith(user_ratings)
-        not_ratated_movies = user_ratings[user_ratings == 0].index
-        predicted = similair_users.dot(self.df_movie_features.loc[:, not_ratated_movies]) / sum(similair_users)
-        return predicted.sort_values(ascending=False)[:N]
+        inner_uid = self.trainset.to_inner_uid(user_id)
+        predicted = self._predict_users(np.array([inner_uid]))[0]
+        rated_iids, _ = self.trainset.user_ratings(inner_uid)
+        best = top_n(predicted, min(N, len(predicted) - len(rated_iids)))
+        return pd.Series(predicted[best], index=self.trainset.raw_iids[best])
     
     def predict(self, user_id, N=5):
         """predict the ids of top N movies
@@ -209,4 +615,479 @@ class CollaborativeFilter(BaseRecommander):
         """      
         return np.array(self.predict_sim(user_id, N).index)
 
-    
+    def _batch_item_ids(self):
+        return self.trainset.raw_iids.values
+
+    def _score_batch(self, user_ids):
+        return self._predict_users(self.trainset.to_inner_uids(user_ids))
+
+    def _get_state(self):
+        arrays, params = _trainset_state(self.trainset)
+        arrays.update(user_means=self._user_means, user_norms=self._user_norms)
+        params['n_neighbors'] = self.n_neighbors
+        return arrays, params, {}
+
+    def _set_state(self, arrays, params, objects):
+        self.trainset = _trainset_from_state(arrays, params)
+        self._rating_matrix = self.trainset.rating_matrix()
+        self._user_means = arrays['user_means']
+        self._user_norms = arrays['user_norms']
+        self.n_neighbors = params['n_neighbors']
+
+
+class MatrixFactorization(LatentFactorRecommander):
+    """Latent factor model fitted on the observed ratings only, where SVD reads the missing ones as zeros
+    Explicit feedback predicts global_bias + user_biases[u] + item_biases[i] + user_factors[u].item_factors[:, i].
+    Implicit feedback reads every rating r as a preference for the movie with confidence 1 + alpha.r and
+    every missing rating as a lack of preference with confidence 1 (Hu, Koren & Volinsky), movies are scored
+    with user_factors[u].item_factors[:, i].
+
+    Attributes:
+        user_factors (np.Array): of shape (number of users, k)
+        item_factors (np.Array): of shape (k, number of movies), as SVD
+        user_biases (np.Array): learnt for explicit feedback, zeros otherwise
+        item_biases (np.Array): learnt for explicit feedback, zeros otherwise
+        global_bias (float): mean train rating for explicit feedback, 0 for implicit feedback
+        history (List): validation score of each epoch, rmse for explicit feedback, -ndcg@10 for implicit feedback
+    """
+
+    def fit(self, ratings, k=20, method='als', feedback='explicit', n_epochs=15, reg=0.05, alpha=10.,
+            learning_rate=0.01, batch_size=1024, n_negatives=1, validation=None, patience=2,
+            block_size=2 ** 22, random_state=None):
+        """fit the factors, each epoch costs time linear in the number of ratings
+
+        Args:
+            ratings (pd.DataFrame or Trainset): DataFrame contains ratings cols: user_id | movie_id | rating
+            k (int, optional): number of factors. Defaults to 20.
+            method (str, optional): 'als' alternates exact least squares solves of all user factors then all movie
+                factors, 'sgd' runs mini-batch stochastic gradient descent. Defaults to 'als'.
+            feedback (str, optional): 'explicit' | 'implicit'. Defaults to 'explicit'.
+            n_epochs (int, optional): maximum number of passes over the ratings. Defaults to 15.
+            reg (float, optional): L2 regularization, scaled by the number of ratings of each user or movie
+                for explicit als. Defaults to 0.05.
+            alpha (float, optional): confidence gained per rating point for implicit feedback. Defaults to 10.
+            learning_rate (float, optional): sgd step size. Defaults to 0.01.
+            batch_size (int, optional): number of ratings of a sgd step. Defaults to 1024.
+            n_negatives (int, optional): missing ratings sampled per rating by implicit sgd. Defaults to 1.
+            validation (pd.DataFrame, optional): ratings scored after each epoch, the factors of the best epoch
+                are kept. Defaults to None: all epochs are run.
+            patience (int, optional): number of epochs without improvement before stopping. Defaults to 2.
+            block_size (int, optional): maximum number of floats of the per rating outer products an als solve
+                block holds. Defaults to 2 ** 22.
+            random_state (int, optional): seed of the initial factors and of sgd. Defaults to None.
+        """
+        if method not in ('als', 'sgd'):
+            raise ValueError(f"Unknown method {method!r}, expected 'als' or 'sgd'.")
+        if feedback not in ('explicit', 'implicit'):
+            raise ValueError(f"Unknown feedback {feedback!r}, expected 'explicit' or 'implicit'.")
+        if isinstance(ratings, Trainset):
+            self.trainset = ratings
+        else:
+            self.trainset = Dataset(ratings[['user_id', 'movie_id', 'rating']]).build_trainset()
+        self.feedback = feedback
+        implicit = feedback == 'implicit'
+        rng = np.random.RandomState(random_state)
+        n_users, n_items = self.trainset.n_users, self.trainset.n_items
+
+        self.global_bias = 0. if implicit else self.trainset.global_mean
+        self.user_biases, self.item_biases = np.zeros(n_users), np.zeros(n_items)
+        user_factors = rng.normal(0, 0.1, (n_users, k))
+        item_factors = rng.normal(0, 0.1, (n_items, k))
+        if method == 'sgd':
+            uids, iids, values = self.trainset.all_ratings_arrays()
+            values = values.astype(np.float64)
+
+        self.history = []
+        best = None
+        for _ in range(n_epochs):
+            with instrumentation.stage('epoch'):
+                if method == 'als':
+                    if implicit:
+                        user_factors = _als_solve(self.trainset.ur, item_factors, reg, block_size, alpha=alpha)
+                        item_factors = _als_solve(self.trainset.ir, user_factors, reg, block_size, alpha=alpha)
+                    else:
+                        user_factors, self.user_biases = _als_solve(self.trainset.ur, item_factors, reg, block_size,
+                                                                    self.global_bias, self.item_biases)
+                        item_factors, self.item_biases = _als_solve(self.trainset.ir, user_factors, reg, block_size,
+                                                                    self.global_bias, self.user_biases)
+                elif implicit:
+                    negatives = rng.randint(n_items, size=n_negatives * len(uids))
+                    weights = np.concatenate([1 + alpha * values, np.ones(len(negatives))])
+                    # rescaled so that learning_rate keeps its meaning whatever alpha
+                    weights /= weights.mean()
+                    targets = np.concatenate([np.ones(len(values)), np.zeros(len(negatives))])
+                    _sgd_epoch(np.concatenate([uids, np.repeat(uids, n_negatives)]), np.concatenate([iids, negatives]),
+                               targets, weights, user_factors, item_factors, None, None, 0.,
+                               learning_rate, reg, batch_size, rng)
+                else:
+                    _sgd_epoch(uids, iids, values, None, user_factors, item_factors, self.user_biases,
+                               self.item_biases, self.global_bias, learning_rate, reg, batch_size, rng)
+            self.user_factors, self.item_factors = user_factors, item_factors.T
+
+            if validation is None:
+                continue
+            with instrumentation.stage('validation'):
+                self.history.append(self._validation_score(validation))
+            if best is None or self.history[-1] < best[0]:
+                best = (self.history[-1], user_factors.copy(), item_factors.copy(),
+                        self.user_biases.copy(), self.item_biases.copy())
+            elif len(self.history) - np.argmin(self.history) > patience:
+                break
+
+        if best is not None:
+            _, user_factors, item_factors, self.user_biases, self.item_biases = best
+        self.user_factors, self.item_factors = user_factors, np.ascontiguousarray(item_factors.T)
+        self.version += 1
+
+    def _validation_score(self, validation):
+        """score of the current factors on validation ratings, lower is better"""
+        if self.feedback == 'explicit':
+            return evaluation.rmse(self.test_result(validation), verbose=False)
+        user_ids = pd.unique(validation['user_id'][validation['user_id'].isin(self.trainset.raw_uids)])
+        recommended, _ = self.predict_batch(user_ids, N=10)
+        item_ids = self.trainset.raw_iids.values
+        relevant = evaluation.holdout_matrix(validation, user_ids, item_ids)
+        return -evaluation.ndcg_at_k(evaluation.item_positions(recommended, item_ids), relevant, verbose=False)
+
+    def _predict_users(self, inner_uids):
+        """predicted ratings of every movie for users, indexed by movie inner id
+
+        Returns:
+            np.Array: of shape (len(inner_uids), number of movies)
+        """
+        return (self.global_bias + self.user_biases[inner_uids, None] + self.item_biases
+                + self.user_factors[inner_uids].dot(self.item_factors))
+
+    def _predict_pairs(self, inner_uids, inner_iids):
+        """predicted ratings of (user, movie) pairs given by inner ids"""
+        return (self.global_bias + self.user_biases[inner_uids] + self.item_biases[inner_iids]
+                + np.einsum('ij,ji->i', self.user_factors[inner_uids], self.item_factors[:, inner_iids]))
+
+    def _get_state(self):
+        arrays, params = _trainset_state(self.trainset)
+        arrays.update(user_factors=self.user_factors, item_factors=self.item_factors,
+                      user_biases=self.user_biases, item_biases=self.item_biases)
+        params.update(feedback=self.feedback, global_bias=self.global_bias, history=self.history)
+        return arrays, params, {}
+
+    def _set_state(self, arrays, params, objects):
+        self.trainset = _trainset_from_state(arrays, params)
+        self.user_factors = arrays['user_factors']
+        self.item_factors = arrays['item_factors']
+        self.user_biases = arrays['user_biases']
+        self.item_biases = arrays['item_biases']
+        self.feedback = params['feedback']
+        self.global_bias = params['global_bias']
+        self.history = params['history']
+
+
+def _row_blocks(indptr, max_nnz):
+    """consecutive row ranges holding at most max_nnz values, or a single row"""
+    start, n_rows = 0, len(indptr) - 1
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + max_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        yield start, end
+        start = end
+
+
+def _als_solve(ratings, fixed, reg, block_size, global_bias=0., fixed_biases=None, alpha=None):
+    """least squares factors of every row of a CompressedRatings given the factors of its columns
+    Rows are solved by blocks: their normal equations are summed from per rating outer products with
+    np.add.reduceat and solved together by a batched np.linalg.solve.
+
+    Args:
+        ratings (CompressedRatings): ratings of the rows to solve
+        fixed (np.Array): factors of the columns, of shape (number of columns, k)
+        reg (float): L2 regularization, scaled by the number of ratings of each row for explicit feedback
+        block_size (int): maximum number of floats of the outer products of a block
+        global_bias (float, optional): explicit feedback mean rating. Defaults to 0.
+        fixed_biases (np.Array, optional): explicit feedback biases of the columns, the biases of the rows
+            are solved along their factors. Defaults to None.
+        alpha (float, optional): confidence per rating point, implicit feedback when given. Defaults to None.
+
+    Returns:
+        np.Array: factors of shape (number of rows, k), zeros for the rows without ratings,
+            with the biases of the rows for explicit feedback
+    """
+    implicit = alpha is not None
+    if not implicit:
+        # the row bias is one more factor, matched with a constant column factor
+        fixed = np.column_stack([fixed, np.ones(len(fixed))])
+    k = fixed.shape[1]
+    solved = np.zeros((ratings.n_rows, k))
+    eye = np.eye(k)
+    gram = fixed.T.dot(fixed) if implicit else None
+    counts = np.diff(ratings.indptr)
+    for start, end in _row_blocks(ratings.indptr, max(block_size // (k * k), 1)):
+        rows = start + np.flatnonzero(counts[start:end])
+        if not len(rows):
+            continue
+        first, last = ratings.indptr[start], ratings.indptr[end]
+        factors = fixed[ratings.indices[first:last]]
+        values = ratings.data[first:last].astype(np.float64)
+        segments = ratings.indptr[rows] - first
+        if implicit:
+            # the missing ratings contribute gram, the ratings add their extra confidence alpha.r
+            outer = np.einsum('ni,nj->nij', factors * (alpha * values)[:, None], factors)
+            lhs = gram + np.add.reduceat(outer, segments) + reg * eye
+            rhs = np.add.reduceat(factors * (1 + alpha * values)[:, None], segments)
+        else:
+            outer = np.einsum('ni,nj->nij', factors, factors)
+            lhs = np.add.reduceat(outer, segments) + reg * counts[rows][:, None, None] * eye
+            targets = values - global_bias - fixed_biases[ratings.indices[first:last]]
+            rhs = np.add.reduceat(factors * targets[:, None], segments)
+        solved[rows] = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+    if implicit:
+        return solved
+    return solved[:, :-1], solved[:, -1]
+
+
+def _sgd_epoch(uids, iids, targets, weights, user_factors, item_factors, user_biases, item_biases, global_bias,
+               learning_rate, reg, batch_size, rng):
+    """one pass of mini-batch sgd over shuffled ratings, updating the factors (and biases if given) in place
+    Updates of a user or movie appearing several times in a batch are summed with np.add.at.
+    """
+    order = rng.permutation(len(uids))
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        u, i = uids[batch], iids[batch]
+        p, q = user_factors[u], item_factors[i]
+        errors = targets[batch] - global_bias - np.einsum('ij,ij->i', p, q)
+        if user_biases is not None:
+            errors -= user_biases[u] + item_biases[i]
+        if weights is not None:
+            errors *= weights[batch]
+        np.add.at(user_factors, u, learning_rate * (errors[:, None] * q - reg * p))
+        np.add.at(item_factors, i, learning_rate * (errors[:, None] * p - reg * q))
+        if user_biases is not None:
+            np.add.at(user_biases, u, learning_rate * (errors - reg * user_biases[u]))
+            np.add.at(item_biases, i, learning_rate * (errors - reg * item_biases[i]))
+
+
+class BaselineOnly(LatentFactorRecommander):
+    """Baseline estimate global_mean + user_biases[u] + item_biases[i] with the regularized biases of the trainset
+    Unknown users and movies have a zero bias, so that any (user, movie) pair is predicted in constant time:
+    it is the fallback of other models for cold start users or movies.
+
+    Attributes:
+        global_mean (float): mean train rating
+        user_biases (np.Array): indexed by user inner id
+        item_biases (np.Array): indexed by movie inner id
+    """
+
+    def fit(self, ratings, reg_user=15., reg_item=10., n_epochs=10):
+        """fit the biases
+
+        Args:
+            ratings (pd.DataFrame or Trainset): DataFrame contains ratings cols: user_id | movie_id | rating
+            reg_user (float, optional): regularization of the user biases. Defaults to 15.
+            reg_item (float, optional): regularization of the movie biases. Defaults to 10.
+            n_epochs (int, optional): number of alternating least squares updates. Defaults to 10.
+        """
+        if isinstance(ratings, Trainset):
+            self.trainset = ratings
+        else:
+            self.trainset = Dataset(ratings[['user_id', 'movie_id', 'rating']]).build_trainset()
+        self.global_mean = self.trainset.global_mean
+        self.user_biases, self.item_biases = self.trainset.baseline_biases(reg_user, reg_item, n_epochs)
+        self.version += 1
+
+    def estimate(self, user_ids, movie_ids):
+        """predicted ratings of (user, movie) pairs, known or not
+
+        Args:
+            user_ids (array-like): ids of the users
+            movie_ids (array-like): ids of the movies, aligned with user_ids
+
+        Returns:
+            np.Array: predicted ratings
+        """
+        inner_uids = self.trainset.raw_uids.get_indexer(user_ids)
+        inner_iids = self.trainset.raw_iids.get_indexer(movie_ids)
+        return (self.global_mean + np.where(inner_uids >= 0, self.user_biases[inner_uids], 0)
+                + np.where(inner_iids >= 0, self.item_biases[inner_iids], 0))
+
+    def _predict_users(self, inner_uids):
+        return self.global_mean + self.user_biases[inner_uids, None] + self.item_biases
+
+    def _predict_pairs(self, inner_uids, inner_iids):
+        return self.global_mean + self.user_biases[inner_uids] + self.item_biases[inner_iids]
+
+    def test_result(self, test):
+        """create test result to be used for evaluation, every pair is predicted
+
+        Args:
+            test (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+
+        Returns:
+            np.Array: array of shape (n, 2) with columns true | pred
+        """
+        return np.column_stack([test['rating'].to_numpy(dtype=np.float64),
+                                self.estimate(test['user_id'], test['movie_id'])])
+
+    def _get_state(self):
+        arrays, params = _trainset_state(self.trainset)
+        arrays.update(user_biases=self.user_biases, item_biases=self.item_biases)
+        params['global_mean'] = self.global_mean
+        return arrays, params, {}
+
+    def _set_state(self, arrays, params, objects):
+        self.trainset = _trainset_from_state(arrays, params)
+        self.user_biases = arrays['user_biases']
+        self.item_biases = arrays['item_biases']
+        self.global_mean = params['global_mean']
+
+
+class HybridRecommander(BaseRecommander):
+    """Blend of the genre similarity scores of a ContentFilter and the predicted ratings of a latent factor model
+    Both are scored in the movie order of movie_df. The candidates of a user are the union of the top n_candidates
+    movies of each source, whose scores are min-max scaled on their own top list before being blended:
+    content_weight * content + (1 - content_weight) * factors. Users with few ratings have poor factors, so their
+    content weight grows from weight up to 1 as their number of ratings goes down from cold_ratings to 0.
+
+    Attributes:
+        content (ContentFilter): fitted content filter
+        factors (BaseRecommander): fitted SVD or MatrixFactorization
+    """
+
+    def fit(self, movie_df, ratings, factor_model=None, content_params=None, factor_params=None, n_candidates=50,
+            weight=0.5, cold_ratings=10):
+        """fit both models
+
+        Args:
+            movie_df (pd.DataFrame): Dataframe of movies contains cols: movie_id | title | year | *genres
+            ratings (pd.DataFrame): DataFrame contains ratings cols: user_id | movie_id | rating
+            factor_model (BaseRecommander, optional): unfitted SVD or MatrixFactorization. Defaults to None: SVD().
+            content_params (dict, optional): extra arguments of ContentFilter.fit. Defaults to None.
+            factor_params (dict, optional): extra arguments of the factor model fit. Defaults to None.
+            n_candidates (int, optional): number of top movies of each source blended. Defaults to 50.
+            weight (float, optional): content weight of the users with at least cold_ratings ratings. Defaults to 0.5.
+            cold_ratings (int, optional): number of ratings from which a user is not cold. Defaults to 10.
+        """
+        self.content = ContentFilter()
+        self.content.fit(movie_df, ratings, **(content_params or {}))
+        self.factors = SVD() if factor_model is None else factor_model
+        self.factors.fit(ratings=ratings, **(factor_params or {}))
+        self.n_candidates = n_candidates
+        self.weight = weight
+        self.cold_ratings = cold_ratings
+        self._set_positions()
+        self.version += 1
+
+    def _set_positions(self):
+        self.trainset = self.content.trainset
+        # position in movie_df of every movie of the factor model, indexed by its inner id
+        self._factor_positions = self.content._movie_positions[
+            self.trainset.raw_iids.get_indexer(self.factors.trainset.raw_iids)]
+
+    def content_weights(self, inner_uids):
+        """default content weight of users, from their number of ratings
+
+        Returns:
+            np.Array: weights in [weight, 1]
+        """
+        coldness = np.clip(1 - self.trainset.user_counts[inner_uids] / max(self.cold_ratings, 1), 0, 1)
+        return self.weight + (1 - self.weight) * coldness
+
+    def _score_users(self, user_ids, content_weights=None, M=10, top=None, aggregate='max'):
+        """blended scores of the candidates of users, in movie_df order
+
+        Args:
+            user_ids (np.Array): ids of the users
+            content_weights (pd.Series, optional): content weight of some users, indexed by user id.
+                Defaults to None: the weights of content_weights() for all users.
+            M, top, aggregate: ContentFilter scoring options
+
+        Returns:
+            np.Array: scores of shape (len(user_ids), number of movies), -inf for the movies that are not candidates
+        """
+        inner_uids = self.trainset.to_inner_uids(user_ids)
+        n_movies = len(self.content.movie_index.ids)
+        with instrumentation.stage('content'):
+            content_scores = self.content._score_users(inner_uids, M=M, top=top, aggregate=aggregate)
+        with instrumentation.stage('factors'):
+            factor_scores = np.full((len(user_ids), n_movies), -np.inf)
+            indexed = self._factor_positions >= 0
+            factor_scores[:, self._factor_positions[indexed]] = self.factors._score_batch(user_ids)[:, indexed]
+
+        with instrumentation.stage('blend'):
+            candidates = np.zeros((len(user_ids), n_movies), dtype=bool)
+            scaled = []
+            for scores in (content_scores, factor_scores):
+                best = top_n(scores, self.n_candidates)
+                best_scores = np.take_along_axis(scores, best, axis=1)
+                finite = np.isfinite(best_scores)
+                np.put_along_axis(candidates, best, finite, axis=1)
+                high = np.where(finite, best_scores, -np.inf).max(axis=1, keepdims=True)
+                low = np.where(finite, best_scores, np.inf).min(axis=1, keepdims=True)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    scaled.append(np.nan_to_num(np.clip((scores - low) / (high - low), 0, 1), nan=1.))
+
+            weights = self.content_weights(inner_uids)
+            if content_weights is not None:
+                given = content_weights.reindex(user_ids).to_numpy(dtype=np.float64)
+                weights = np.where(np.isnan(given), weights, given)
+            blended = weights[:, None] * scaled[0] + (1 - weights[:, None]) * scaled[1]
+            blended[~candidates] = -np.inf
+        return blended
+
+    def predict_sim(self, user_id, N=5, content_weight=None, **kwargs):
+        """predict the ids of top N movies with their blended scores
+
+        Args:
+            user_id ([int]): id for user
+            N (int, optional): number of movies to suggest. Defaults to 5.
+            content_weight (float, optional): content weight of the user. Defaults to None: from its ratings.
+            **kwargs: ContentFilter scoring options (M, top, aggregate)
+
+        Returns:
+            pd.Series: of movie ids as index and blended scores as values
+        """
+        content_weights = None if content_weight is None else pd.Series([content_weight], index=[user_id])
+        scores = self._score_users(np.array([user_id]), content_weights, **kwargs)[0]
+        best = top_n(scores, min(N, np.isfinite(scores).sum()))
+        return pd.Series(scores[best], index=self.content.movie_index.ids[best])
+
+    def predict(self, user_id, N=5, content_weight=None):
+        """predict the ids of top N movies
+
+        Args:
+            user_id ([int]): id for user
+            N (int, optional): number of movies to suggest. Defaults to 5.
+            content_weight (float, optional): content weight of the user. Defaults to None: from its ratings.
+
+        Returns:
+            np.Array: of movie ids
+        """
+        return np.array(self.predict_sim(user_id, N, content_weight).index)
+
+    def _batch_item_ids(self):
+        return self.content.movie_index.ids
+
+    def _score_batch(self, user_ids, **kwargs):
+        return self._score_users(user_ids, **kwargs)
+
+    def _get_state(self):
+        arrays, params, objects = {}, {}, {}
+        for name, model in (('content', self.content), ('factors', self.factors)):
+            model_arrays, model_params, model_objects = model._get_state()
+            arrays.update({f'{name}.{key}': value for key, value in model_arrays.items()})
+            objects.update({f'{name}.{key}': value for key, value in model_objects.items()})
+            params[name] = {'model': type(model).__name__, 'params': model_params}
+        params.update(n_candidates=self.n_candidates, weight=self.weight, cold_ratings=self.cold_ratings)
+        return arrays, params, objects
+
+    def _set_state(self, arrays, params, objects):
+        models = {model.__name__: model for model in _subclasses(BaseRecommander)}
+        for name in ('content', 'factors'):
+            prefix = name + '.'
+            model = models[params[name]['model']]()
+            model._set_state({key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)},
+                             params[name]['params'],
+                             {key[len(prefix):]: value for key, value in objects.items() if key.startswith(prefix)})
+            setattr(self, name, model)
+        self.n_candidates = params['n_candidates']
+        self.weight = params['weight']
+        self.cold_ratings = params['cold_ratings']
+        self._set_positions()
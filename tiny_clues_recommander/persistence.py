@@ -0,0 +1,70 @@
+"""Save and load fitted models.
+
+A model is saved as a directory holding one raw ``.npy`` file per numeric
+array, so that loading memory-maps them: worker processes loading the same
+model share one page-cached copy instead of reading and copying it.
+Non numeric state (DataFrames, object arrays) is pickled and loaded in memory.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+
+META_FILE = 'meta.json'
+
+
+def save_state(path, model_name, arrays, params, objects=None):
+    """save the state of a model in a directory
+
+    Args:
+        path (str): directory, created if needed
+        model_name (str): name of the model class
+        arrays (dict): name -> np.Array, numeric arrays are loaded memory-mapped
+        params (dict): json serializable parameters
+        objects (dict, optional): name -> picklable object. Defaults to None.
+    """
+    os.makedirs(path, exist_ok=True)
+    pickled_arrays = []
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if array.dtype == object:
+            pickled_arrays.append(name)
+        np.save(os.path.join(path, name + '.npy'), array, allow_pickle=array.dtype == object)
+    for name, obj in (objects or {}).items():
+        with open(os.path.join(path, name + '.pkl'), 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    meta = {
+        'model': model_name,
+        'params': params,
+        'arrays': sorted(arrays),
+        'pickled_arrays': pickled_arrays,
+        'objects': sorted(objects or {}),
+    }
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_state(path, mmap=True):
+    """load a state saved by save_state
+
+    Args:
+        path (str): directory of the saved model
+        mmap (bool, optional): memory-map the numeric arrays, read only. Defaults to True.
+
+    Returns:
+        Tuple: model name, arrays dict, params dict, objects dict
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in meta['arrays']:
+        pickled = name in meta['pickled_arrays']
+        arrays[name] = np.load(os.path.join(path, name + '.npy'),
+                               mmap_mode=None if pickled or not mmap else 'r', allow_pickle=pickled)
+    objects = {}
+    for name in meta['objects']:
+        with open(os.path.join(path, name + '.pkl'), 'rb') as f:
+            objects[name] = pickle.load(f)
+    return meta['model'], arrays, meta['params'], objects
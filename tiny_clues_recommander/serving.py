@@ -0,0 +1,289 @@
+"""Local HTTP/JSON recommendation server over a fitted model.
+
+Concurrent requests are collected into micro-batches (up to a maximum batch
+size or a maximum wait) and scored together by the model's ``predict_batch``
+in a worker thread, so the event loop keeps accepting requests meanwhile:
+
+    $ python -m tiny_clues_recommander.serving path/to/saved/model --port 8000
+    $ curl 'localhost:8000/recommend?user_id=1&n=5'
+    $ curl localhost:8000/stats
+
+Endpoints:
+    GET /recommend?user_id=<id>&n=<N>, or POST /recommend with a JSON body
+        {"user_id": <id>, "n": <N>}: top N movie ids and scores of a user.
+    GET /stats: request count, p50/p99 latency, queue depth and batch sizes.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .models import BaseRecommander
+
+
+class MicroBatcher:
+    """Group concurrent recommendation requests into batches scored with predict_batch
+
+    Args:
+        model (BaseRecommander): fitted model
+        max_batch_size (int, optional): maximum number of requests in a batch. Defaults to 64.
+        max_wait (float, optional): maximum time (seconds) a request waits for other requests. Defaults to 0.005.
+        executor (concurrent.futures.Executor, optional): runs the batches. Defaults to a single thread.
+        latency_window (int, optional): number of recent requests the latency percentiles are computed on.
+            Defaults to 10000.
+    """
+    def __init__(self, model, max_batch_size=64, max_wait=0.005, executor=None, latency_window=10000):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.n_requests = 0
+        self.n_errors = 0
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        """start collecting requests, must be called from the running event loop"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """stop collecting requests"""
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    async def recommend(self, user_id, N=5):
+        """top N movies of a user, scored within the next batch
+
+        Returns:
+            Tuple: np.Array of movie ids and np.Array of their scores
+        """
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self._queue.put((user_id, N, future))
+        try:
+            return await future
+        finally:
+            self.n_requests += 1
+            self.latencies.append(time.perf_counter() - start)
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _predict(self, user_ids, N):
+        """score a batch, or each request alone when the batch fails so that one bad user id fails alone
+
+        Returns:
+            List: per request, a tuple of np.Array of movie ids and np.Array of scores, or the error raised
+        """
+        try:
+            recommended, scores = self.model.predict_batch(user_ids, N=N)
+            return list(zip(recommended, scores))
+        except Exception:
+            results = []
+            for user_id in user_ids:
+                try:
+                    recommended, scores = self.model.predict_batch([user_id], N=N)
+                    results.append((recommended[0], scores[0]))
+                except Exception as error:
+                    results.append(error)
+            return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._answer(loop, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                # the requests of the batch fail, the worker keeps serving the next ones
+                for _, _, future in batch:
+                    if not future.done():
+                        self.n_errors += 1
+                        future.set_exception(error)
+
+    async def _answer(self, loop, batch):
+        """score a batch and set the result (or the error) of each request"""
+        self.batch_sizes.append(len(batch))
+        user_ids = [user_id for user_id, _, _ in batch]
+        max_n = max(N for _, N, _ in batch)
+        results = await loop.run_in_executor(self.executor, self._predict, user_ids, max_n)
+        for row, (_, N, future) in enumerate(batch):
+            if future.done():
+                continue
+            if isinstance(results[row], Exception):
+                self.n_errors += 1
+                future.set_exception(results[row])
+            else:
+                recommended, scores = results[row]
+                future.set_result((recommended[:N], scores[:N]))
+
+    def stats(self):
+        """serving statistics
+
+        Returns:
+            dict: requests, errors, p50/p99 latency (ms), queue depth, mean batch size
+        """
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': self.n_requests,
+            'errors': self.n_errors,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+        }
+
+
+def _parse_user_id(user_id, raw_uids):
+    """query string ids are strings: keep the ones the model knows (e.g. '007'), else use the integer id if it is one"""
+    if user_id in raw_uids:
+        return user_id
+    try:
+        return int(user_id)
+    except ValueError:
+        return user_id
+
+
+class RecommendationServer:
+    """Minimal asyncio HTTP/1.1 server answering JSON requests with a MicroBatcher
+
+    Args:
+        batcher (MicroBatcher): batcher of the served model
+        default_n (int, optional): number of movies when the request does not give n. Defaults to 5.
+    """
+    def __init__(self, batcher, default_n=5):
+        self.batcher = batcher
+        self.default_n = default_n
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """start serving, port 0 picks a free port
+
+        Returns:
+            int: the port served
+        """
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self._route(method, target, body)
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/stats' and method == 'GET':
+            return '200 OK', self.batcher.stats()
+        if url.path != '/recommend':
+            return '404 Not Found', {'error': f'unknown path {url.path}'}
+
+        try:
+            if method == 'POST':
+                request = json.loads(body or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError('the body is not a JSON object')
+            else:
+                request = {name: values[0] for name, values in parse_qs(url.query).items()}
+                if 'user_id' in request:
+                    request['user_id'] = _parse_user_id(request['user_id'], self.batcher.model.trainset.raw_uids)
+            user_id, N = request['user_id'], int(request.get('n', self.default_n))
+            if isinstance(user_id, (list, dict)):
+                raise ValueError(f'user_id is not an id: {user_id}')
+            if N < 1:
+                raise ValueError(f'n must be at least 1, not {N}')
+        except (KeyError, TypeError, ValueError) as error:
+            return '400 Bad Request', {'error': f'invalid request: {error}'}
+
+        try:
+            recommended, scores = await self.batcher.recommend(user_id, N)
+        except (KeyError, ValueError) as error:
+            return '404 Not Found', {'error': str(error)}
+        except Exception as error:
+            return '500 Internal Server Error', {'error': f'{type(error).__name__}: {error}'}
+        return '200 OK', {'user_id': user_id, 'movie_ids': recommended.tolist(), 'scores': scores.tolist()}
+
+
+async def serve(model, host='127.0.0.1', port=8000, max_batch_size=64, max_wait=0.005):
+    """serve a fitted model until cancelled"""
+    server = RecommendationServer(MicroBatcher(model, max_batch_size=max_batch_size, max_wait=max_wait))
+    port = await server.start(host, port)
+    print(f'Serving {type(model).__name__} on http://{host}:{port}')
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='directory of a model saved with save()')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.)
+    parser.add_argument('--no-mmap', action='store_true', help='read the model arrays instead of memory-mapping them')
+    args = parser.parse_args()
+
+    model = BaseRecommander.load(args.model, mmap=not args.no_mmap)
+    try:
+        asyncio.run(serve(model, args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()